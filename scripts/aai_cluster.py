@@ -0,0 +1,98 @@
+"""
+Perfis de envelhecimento por k-means ponderado na população 60+ inteira.
+
+Os pesos amostrais entram como sample_weight de um MiniBatchKMeans (sem
+reamostragem), as features são imputadas e padronizadas uma única vez e
+compartilhadas pelos ajustes de cada k, que rodam em paralelo (threads). Os
+perfis saem de uma única passada agrupada (bincount) sobre as features.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+
+from aai_stats import grouped_weighted_mean
+
+K_RANGE = range(2, 9)
+BATCH_SIZE = 4096
+N_INIT = 3
+
+
+def prepare_features(data, features, weight_col):
+    """
+    Matriz padronizada (média e DP ponderados) com missing imputado pela
+    mediana da coluna, e o vetor de pesos.
+    """
+    X = data[features].to_numpy(dtype=np.float64)
+    medians = np.nanmedian(X, axis=0)
+    X = np.where(np.isnan(X), medians, X)
+    w = data[weight_col].to_numpy(dtype=np.float64)
+    mean = np.average(X, axis=0, weights=w)
+    std = np.sqrt(np.average((X - mean) ** 2, axis=0, weights=w))
+    std[std == 0] = 1.0
+    return np.ascontiguousarray((X - mean) / std), w
+
+
+def calinski_harabasz(X, w, labels, centers):
+    """Índice de Calinski-Harabasz com pesos (dispersão entre / dentro dos grupos)"""
+    k, n = len(centers), len(X)
+    if k < 2 or n <= k:
+        return np.nan
+    overall = np.average(X, axis=0, weights=w)
+    cluster_w = np.bincount(labels, weights=w, minlength=k)
+    between = (cluster_w * ((centers - overall) ** 2).sum(axis=1)).sum()
+    within = (w * ((X - centers[labels]) ** 2).sum(axis=1)).sum()
+    return (between / (k - 1)) / (within / (n - k)) if within > 0 else np.inf
+
+
+def relabel_by_weight(labels, w, k):
+    """Renumera os clusters em ordem decrescente de população (0 = maior)"""
+    order = np.argsort(-np.bincount(labels, weights=w, minlength=k), kind="stable")
+    rank = np.empty(k, dtype=labels.dtype)
+    rank[order] = np.arange(k)
+    return rank[labels], order
+
+
+def fit_kmeans(X, w, k, seed=None, batch_size=BATCH_SIZE, n_init=N_INIT):
+    """MiniBatchKMeans ponderado para um k -> (modelo, rótulos, CH, inércia)"""
+    model = MiniBatchKMeans(n_clusters=k, random_state=seed, batch_size=batch_size, n_init=n_init)
+    model.fit(X, sample_weight=w)
+    labels = model.predict(X)
+    labels, order = relabel_by_weight(labels, w, k)
+    model.cluster_centers_ = model.cluster_centers_[order]
+    inertia = float((w * ((X - model.cluster_centers_[labels]) ** 2).sum(axis=1)).sum())
+    return model, labels, calinski_harabasz(X, w, labels, model.cluster_centers_), inertia
+
+
+def kmeans_range(X, w, k_values=K_RANGE, seed=None, n_jobs=1, batch_size=BATCH_SIZE, n_init=N_INIT):
+    """
+    Ajusta um modelo por k (em paralelo, sobre a mesma matriz X) e devolve
+    ({k: (modelo, rótulos)}, tabela com CH e inércia ponderada por k).
+    """
+    k_values = list(k_values)
+    max_workers = os.cpu_count() if n_jobs == -1 else max(1, n_jobs)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        fits = list(pool.map(lambda k: fit_kmeans(X, w, k, seed, batch_size, n_init), k_values))
+    models = {k: (model, labels) for k, (model, labels, _, _) in zip(k_values, fits)}
+    scores = pd.DataFrame({
+        "k": k_values,
+        "calinski_harabasz": [fit[2] for fit in fits],
+        "inertia": [fit[3] for fit in fits],
+    })
+    return models, scores
+
+
+def weighted_profiles(data, labels, features, weight_col):
+    """Médias ponderadas das features por cluster, N e população numa única passada"""
+    k = int(labels.max()) + 1 if len(labels) else 0
+    w = data[weight_col].to_numpy(dtype=np.float64)
+    profile = pd.DataFrame(
+        {feat: grouped_weighted_mean(labels, k, data[feat].to_numpy(dtype=np.float64), w) for feat in features},
+        index=pd.RangeIndex(k, name="cluster"),
+    )
+    profile["n"] = np.bincount(labels, minlength=k)
+    profile["pop_weight"] = np.bincount(labels, weights=np.nan_to_num(w), minlength=k)
+    return profile
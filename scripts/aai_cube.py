@@ -0,0 +1,128 @@
+"""
+Cubo de estatísticas suficientes ponderadas para análises por subgrupo.
+
+Cada célula (uf × regiao × sexo × raca_cor × faixa_etaria × area_urbana)
+guarda n, Σw e, para cada variável, n válido, Σw·x, Σw·x² e Σw·missing.
+Médias, desvios, proporção de missing e diferenças entre grupos saem de
+somas sobre as células, sem voltar aos microdados.
+"""
+
+import numpy as np
+import pandas as pd
+
+from pns_dataset import write_dataset, read_dataset, read_metadata
+
+CUBE_DIMS = ["uf", "regiao", "sexo", "raca_cor", "faixa_etaria", "area_urbana"]
+STATS = ("n", "swx", "swx2", "swmiss")
+
+
+def build_cube(data, weight_col, values, dims=CUBE_DIMS):
+    """
+    Monta o cubo numa única passada: cada linha recebe o índice da sua célula
+    e todas as somas saem de bincount. Dimensões ausentes em data são
+    ignoradas; missing numa dimensão vira uma célula própria (NaN).
+    """
+    dims = [d for d in dims if d in data.columns]
+    codes, levels = [], []
+    for dim in dims:
+        code, level = pd.factorize(data[dim], sort=True)
+        codes.append(code + 1)  # 0 = missing
+        levels.append(level)
+    shape = tuple(len(level) + 1 for level in levels)
+    if dims:
+        cell = np.ravel_multi_index(codes, shape)
+    else:
+        cell = np.zeros(len(data), dtype=np.int64)
+    cells, inverse = np.unique(cell, return_inverse=True)
+    inverse = inverse.ravel()
+    n_cells = len(cells)
+
+    w = data[weight_col].to_numpy(dtype=np.float64)
+    w = np.where(np.isnan(w), 0.0, w)
+    out = {}
+    for dim, level, coord in zip(dims, levels, np.unravel_index(cells, shape) if dims else []):
+        labels = np.asarray(level, dtype=object)
+        out[dim] = pd.Series(np.where(coord > 0, labels[np.maximum(coord - 1, 0)], None), dtype=object)
+        if isinstance(data[dim].dtype, pd.CategoricalDtype):
+            out[dim] = out[dim].astype(data[dim].dtype)
+    out["n"] = np.bincount(inverse, minlength=n_cells)
+    out["sw"] = np.bincount(inverse, weights=w, minlength=n_cells)
+
+    for value in values:
+        x = data[value].to_numpy(dtype=np.float64)
+        missing = np.isnan(x)
+        x = np.where(missing, 0.0, x)
+        out[f"{value}:n"] = np.bincount(inverse, weights=~missing, minlength=n_cells).astype(np.int64)
+        out[f"{value}:swx"] = np.bincount(inverse, weights=w * x, minlength=n_cells)
+        out[f"{value}:swx2"] = np.bincount(inverse, weights=w * x * x, minlength=n_cells)
+        out[f"{value}:swmiss"] = np.bincount(inverse, weights=np.where(missing, w, 0.0), minlength=n_cells)
+
+    return Cube(pd.DataFrame(out), dims, list(values), weight_col)
+
+
+class Cube:
+    def __init__(self, cells, dims, values, weight_col=None):
+        self.cells = cells
+        self.dims = list(dims)
+        self.values = list(values)
+        self.weight_col = weight_col
+
+    def __len__(self):
+        return len(self.cells)
+
+    def save(self, path):
+        meta = {"dims": self.dims, "values": self.values, "weight_col": self.weight_col}
+        return write_dataset(self.cells, path, metadata={"cube": meta})
+
+    @classmethod
+    def load(cls, path):
+        meta = read_metadata(path)["cube"]
+        return cls(read_dataset(path), meta["dims"], meta["values"], meta["weight_col"])
+
+    def _select(self, where):
+        """Células que atendem ao filtro {dimensão: valor ou lista de valores}"""
+        cells = self.cells
+        for dim, wanted in (where or {}).items():
+            wanted = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            cells = cells[cells[dim].isin(wanted)]
+        return cells
+
+    def rollup(self, by=(), where=None, values=None):
+        """
+        Soma as células por `by` (lista de dimensões; vazio = total) e devolve,
+        por variável: <v>_mean, <v>_sd (ponderado), <v>_missing (proporção
+        ponderada), <v>_missing_n (proporção não ponderada) e <v>_n, além de
+        n e pop_weight (Σw) do grupo.
+        """
+        by = list(by)
+        values = self.values if values is None else list(values)
+        cells = self._select(where)
+        columns = ["n", "sw"] + [f"{v}:{s}" for v in values for s in STATS]
+        if by:
+            sums = cells.groupby(by, observed=True, dropna=False, sort=True)[columns].sum().reset_index()
+        else:
+            sums = cells[columns].sum().to_frame().T
+
+        out = sums[by].copy() if by else pd.DataFrame(index=sums.index)
+        out["n"] = sums["n"].astype(np.int64)
+        out["pop_weight"] = sums["sw"]
+        for v in values:
+            sw_valid = sums["sw"] - sums[f"{v}:swmiss"]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = sums[f"{v}:swx"] / sw_valid
+                var = (sums[f"{v}:swx2"] / sw_valid - mean ** 2).clip(lower=0)
+                out[f"{v}_mean"] = mean.where(sums[f"{v}:n"] > 0)
+                out[f"{v}_sd"] = np.sqrt(var).where(sums[f"{v}:n"] > 0)
+                out[f"{v}_missing"] = sums[f"{v}:swmiss"] / sums["sw"]
+                out[f"{v}_missing_n"] = 1 - sums[f"{v}:n"] / sums["n"]
+            out[f"{v}_n"] = sums[f"{v}:n"].astype(np.int64)
+        return out
+
+    def mean(self, value, where=None):
+        """Média ponderada de uma variável (opcionalmente num subgrupo)"""
+        return float(self.rollup(where=where, values=[value])[f"{value}_mean"].iloc[0])
+
+    def gap(self, value, dim, a, b, where=None):
+        """Diferença de médias ponderadas entre os grupos a e b de uma dimensão"""
+        means = self.rollup(by=[dim], where=where, values=[value]).set_index(dim)[f"{value}_mean"]
+        return float(means.get(a, np.nan) - means.get(b, np.nan))
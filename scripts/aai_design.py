@@ -0,0 +1,354 @@
+"""
+Desenho amostral da PNS (estrato × UPA × peso) com pesos replicados.
+
+Os pesos replicados (bootstrap reescalonado de Rao-Wu, JK1 por grupos ou JKn)
+são gerados uma única vez e guardados como matriz float32 mapeada em memória
+(observações × réplicas) ao lado do dataset processado. Qualquer estatística
+ponderada obtém sua variância de desenho com um produto matricial contra a
+matriz armazenada, sem reamostrar de novo.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+
+from aai_stats import make_rng
+
+METHODS = ("bootstrap", "jk1", "jkn")
+
+# Linhas por bloco ao gravar a matriz de réplicas (no máximo WRITE_CELLS fatores por bloco)
+WRITE_CHUNK = 8192
+WRITE_CELLS = 1 << 22
+
+# Tamanho máximo da matriz de réplicas (n_obs × réplicas × 4 bytes). No JKn há uma
+# réplica por UPA: com ~8 mil UPAs e ~90 mil registros a matriz passa de 2,5 GB.
+MAX_REPLICATE_BYTES = 4 << 30
+
+
+def _codes(values):
+    """Códigos inteiros 0..k-1 para um array de rótulos"""
+    _, inverse = np.unique(np.asarray(values).astype(str), return_inverse=True)
+    return inverse.ravel()
+
+
+def design_fingerprint(strata, psu, weights, method, n_replicates, seed):
+    """Hash do desenho + parâmetros; invalida o cache se qualquer um mudar"""
+    digest = hashlib.sha256()
+    for arr in (np.asarray(strata).astype(str), np.asarray(psu).astype(str)):
+        digest.update("\x1f".join(arr.tolist()).encode("utf-8"))
+    digest.update(np.ascontiguousarray(weights, dtype=np.float64).tobytes())
+    digest.update(f"{method}|{n_replicates}|{seed}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _psu_structure(strata, psu):
+    """Estrato de cada UPA e UPA de cada linha (UPAs numeradas por estrato)"""
+    stratum_code = _codes(strata)
+    psu_code = _codes(np.char.add(np.asarray(strata).astype(str), np.char.add("|", np.asarray(psu).astype(str))))
+    n_psu = psu_code.max() + 1
+    psu_stratum = np.zeros(n_psu, dtype=np.int64)
+    psu_stratum[psu_code] = stratum_code
+    return psu_code, psu_stratum
+
+
+def rao_wu_factors(psu_stratum, n_replicates, rng):
+    """
+    Fatores do bootstrap reescalonado (Rao-Wu, m_h = n_h - 1) por UPA × réplica:
+    (n_h / (n_h - 1)) × multiplicidade. Estratos com uma só UPA ficam com fator 1.
+    """
+    n_psu = len(psu_stratum)
+    order = np.argsort(psu_stratum, kind="stable")
+    n_h = np.bincount(psu_stratum)
+    starts = np.concatenate([[0], np.cumsum(n_h)[:-1]])
+
+    multi = np.flatnonzero(n_h >= 2)
+    draws = n_h[multi] - 1
+    slot_start = np.repeat(starts[multi], draws)
+    slot_size = np.repeat(n_h[multi], draws)
+
+    factors = np.ones((n_psu, n_replicates), dtype=np.float64)
+    if len(slot_start) == 0:
+        return factors
+    scale = np.zeros(n_psu)
+    scale[order] = np.repeat(n_h / np.maximum(n_h - 1, 1), n_h)
+    in_multi = np.zeros(n_psu, dtype=bool)
+    in_multi[order] = np.repeat(n_h >= 2, n_h)
+
+    for r in range(n_replicates):
+        picked = order[slot_start + (rng.random(len(slot_start)) * slot_size).astype(np.int64)]
+        counts = np.bincount(picked, minlength=n_psu)
+        factors[in_multi, r] = scale[in_multi] * counts[in_multi]
+    return factors
+
+
+def jk1_factors(psu_stratum, n_groups, rng):
+    """JK1 por grupos aleatórios de UPAs: grupo r removido, demais × G/(G-1)"""
+    n_psu = len(psu_stratum)
+    groups = rng.permutation(n_psu) % n_groups
+    factors = np.full((n_psu, n_groups), n_groups / (n_groups - 1))
+    factors[np.arange(n_psu), groups] = 0.0
+    return factors
+
+
+def jkn_factors(psu_stratum):
+    """
+    JKn estratificado: uma réplica por UPA (em estratos com ≥2 UPAs). A UPA
+    removida recebe 0 e as demais do estrato n_h/(n_h-1); UPAs de outros
+    estratos ficam com 1. A matriz UPA × réplica completa teria n_psu² fatores,
+    então só o necessário é guardado por estrato: retorna factors_of(upas), que
+    monta as linhas pedidas (len(upas) × réplicas), e o multiplicador
+    (n_h-1)/n_h de cada réplica. As réplicas vêm agrupadas por estrato.
+    """
+    n_h = np.bincount(psu_stratum)
+    deleted = np.flatnonzero(n_h[psu_stratum] >= 2)
+    deleted = deleted[np.argsort(psu_stratum[deleted], kind="stable")]
+    column = np.full(len(psu_stratum), -1)
+    column[deleted] = np.arange(len(deleted))
+    n_cols = np.where(n_h >= 2, n_h, 0)
+    first_col = np.cumsum(n_cols) - n_cols
+    ratio = n_h / np.maximum(n_h - 1, 1)
+
+    def factors_of(psus):
+        h = psu_stratum[psus]
+        counts = n_cols[h]
+        factors = np.ones((len(psus), len(deleted)))
+        rows = np.repeat(np.arange(len(psus)), counts)
+        cols = np.arange(counts.sum()) + np.repeat(first_col[h] - (np.cumsum(counts) - counts), counts)
+        factors[rows, cols] = ratio[h][rows]
+        own = column[psus]
+        removed = np.flatnonzero(own >= 0)
+        factors[removed, own[removed]] = 0.0
+        return factors
+
+    rscales = 1.0 / ratio[psu_stratum[deleted]]
+    return factors_of, rscales
+
+
+class SurveyDesign:
+    """
+    Pesos replicados de um desenho estratificado por conglomerados.
+    replicates: matriz (n, R) float32 (normalmente np.memmap).
+    Var(θ) = scale × Σ_r rscales_r (θ_r − θ)².
+    """
+
+    def __init__(self, weights, replicates, method, scale, rscales, fingerprint=None):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.replicates = replicates
+        self.method = method
+        self.scale = scale
+        self.rscales = np.asarray(rscales, dtype=np.float64)
+        self.fingerprint = fingerprint
+
+    @property
+    def n_replicates(self):
+        return self.replicates.shape[1]
+
+    @property
+    def cache_key(self):
+        """Chave do pipeline (hash_value): fingerprint gravado, método e escala, sem ler a matriz"""
+        if self.fingerprint is None:
+            return None
+        return (self.fingerprint, self.method, self.scale)
+
+    # ------------------------------------------------------------------
+    # Construção e cache
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def build(cls, strata, psu, weights, path, method="bootstrap", n_replicates=200, seed=None,
+              max_bytes=MAX_REPLICATE_BYTES):
+        """
+        Gera os pesos replicados e grava <path>.npy (float32) + <path>.json.
+        Recusa matrizes acima de max_bytes (None desliga o limite).
+        """
+        if method not in METHODS:
+            raise ValueError(f"method deve ser um de {METHODS}: {method!r}")
+        weights = np.asarray(weights, dtype=np.float64)
+        psu_code, psu_stratum = _psu_structure(strata, psu)
+        rng = make_rng(seed, "design", method)
+
+        if method == "bootstrap":
+            factors_of = rao_wu_factors(psu_stratum, n_replicates, rng).__getitem__
+            scale, rscales = 1.0 / n_replicates, np.ones(n_replicates)
+        elif method == "jk1":
+            factors_of = jk1_factors(psu_stratum, n_replicates, rng).__getitem__
+            scale, rscales = (n_replicates - 1) / n_replicates, np.ones(n_replicates)
+        else:
+            factors_of, rscales = jkn_factors(psu_stratum)
+            scale = 1.0
+
+        n_cols = len(rscales)
+        size = len(weights) * n_cols * np.dtype(np.float32).itemsize
+        if max_bytes is not None and size > max_bytes:
+            raise ValueError(
+                f"Matriz de réplicas com {size / 2**30:.1f} GB ({len(weights):,} × {n_cols:,}) "
+                f"excede max_bytes={max_bytes / 2**30:.1f} GB: reduza as réplicas, use 'jk1' ou passe max_bytes=None"
+            )
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        replicates = np.lib.format.open_memmap(
+            path.with_suffix(".npy"), mode="w+", dtype=np.float32, shape=(len(weights), n_cols)
+        )
+        chunk = max(1, min(WRITE_CHUNK, WRITE_CELLS // max(n_cols, 1)))
+        for start in range(0, len(weights), chunk):
+            rows = slice(start, start + chunk)
+            replicates[rows] = weights[rows, None] * factors_of(psu_code[rows])
+        replicates.flush()
+
+        meta = {
+            "fingerprint": design_fingerprint(strata, psu, weights, method, n_replicates, seed),
+            "method": method,
+            "scale": scale,
+            "rscales": rscales.tolist(),
+            "n_obs": len(weights),
+            "n_replicates": int(n_cols),
+            "n_strata": int(psu_stratum.max() + 1),
+            "n_psu": int(len(psu_stratum)),
+        }
+        with open(path.with_suffix(".json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        del replicates
+        return cls.load(weights, path)
+
+    @classmethod
+    def load(cls, weights, path):
+        """Abre a matriz gravada em modo somente leitura (memmap)"""
+        path = Path(path)
+        with open(path.with_suffix(".json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        replicates = np.load(path.with_suffix(".npy"), mmap_mode="r")
+        return cls(weights, replicates, meta["method"], meta["scale"], meta["rscales"], meta.get("fingerprint"))
+
+    @classmethod
+    def load_or_build(cls, data, strata_col, psu_col, weight_col, path, method="bootstrap",
+                      n_replicates=200, seed=None, max_bytes=MAX_REPLICATE_BYTES):
+        """Reusa a matriz gravada se o desenho e os parâmetros forem os mesmos"""
+        strata = data[strata_col].to_numpy()
+        psu = data[psu_col].to_numpy()
+        weights = data[weight_col].to_numpy(dtype=np.float64)
+        path = Path(path)
+        meta_file = path.with_suffix(".json")
+        if meta_file.exists() and path.with_suffix(".npy").exists():
+            with open(meta_file, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("fingerprint") == design_fingerprint(strata, psu, weights, method, n_replicates, seed):
+                return cls.load(weights, path)
+        return cls.build(strata, psu, weights, path, method, n_replicates, seed, max_bytes)
+
+    # ------------------------------------------------------------------
+    # Variância
+    # ------------------------------------------------------------------
+
+    def variance(self, estimate, replicate_estimates):
+        """Variância de desenho a partir das estimativas replicadas (última dimensão = réplicas)"""
+        dev = np.asarray(replicate_estimates) - np.asarray(estimate)[..., None]
+        return self.scale * np.nansum(self.rscales * dev ** 2, axis=-1)
+
+    def summarize(self, estimate, replicate_estimates, ci=95):
+        """(estimativa, erro padrão, inferior, superior) com IC normal"""
+        from scipy.stats import norm
+        se = np.sqrt(self.variance(estimate, replicate_estimates))
+        z = norm.ppf(0.5 + ci / 200)
+        return estimate, se, estimate - z * se, estimate + z * se
+
+    # ------------------------------------------------------------------
+    # Estatísticas
+    # ------------------------------------------------------------------
+
+    def _masked(self, values, rows=None):
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        if rows is not None:
+            valid &= rows
+        return np.where(valid, values, 0.0), valid
+
+    def mean(self, values, rows=None, ci=95):
+        """Média ponderada (opcionalmente num subconjunto de linhas) com IC de desenho"""
+        y, valid = self._masked(values, rows)
+        w = np.where(valid, self.weights, 0.0)
+        estimate = (w * y).sum() / w.sum()
+        reps = (y @ self.replicates) / (valid.astype(np.float64) @ self.replicates)
+        return self.summarize(estimate, reps, ci)
+
+    def ratio(self, numerator, denominator, rows=None, ci=95):
+        """Razão Σw·num / Σw·den com IC de desenho"""
+        num, valid_num = self._masked(numerator, rows)
+        den, valid_den = self._masked(denominator, rows)
+        both = valid_num & valid_den
+        num, den = np.where(both, num, 0.0), np.where(both, den, 0.0)
+        estimate = (self.weights * num).sum() / (self.weights * den).sum()
+        reps = (num @ self.replicates) / (den @ self.replicates)
+        return self.summarize(estimate, reps, ci)
+
+    def gap(self, values, rows_a, rows_b, ci=95):
+        """Diferença de médias entre dois subgrupos (A − B) com IC de desenho"""
+        y, valid = self._masked(values)
+        masks = np.column_stack([valid & rows_a, valid & rows_b]).astype(np.float64)
+        totals = (masks * y[:, None]).T @ self.replicates
+        counts = masks.T @ self.replicates
+        reps = totals[0] / counts[0] - totals[1] / counts[1]
+        w = self.weights
+        estimate = (
+            (w * y * masks[:, 0]).sum() / (w * masks[:, 0]).sum()
+            - (w * y * masks[:, 1]).sum() / (w * masks[:, 1]).sum()
+        )
+        return self.summarize(estimate, reps, ci)
+
+    def group_means(self, codes, values, ci=95):
+        """
+        Médias por grupo (ex.: município) e erros padrão de desenho.
+        Retorna (grupos, estimativa, erro padrão, inferior, superior).
+        """
+        y, valid = self._masked(values)
+        groups, inverse = np.unique(np.asarray(codes), return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind="stable")
+        starts = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+
+        w = np.where(valid, self.weights, 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            estimate = np.bincount(inverse, weights=w * y) / np.bincount(inverse, weights=w)
+            totals = np.add.reduceat(y[order, None] * self.replicates[order], starts, axis=0)
+            counts = np.add.reduceat(valid[order, None] * self.replicates[order], starts, axis=0)
+            reps = totals / counts
+        _, se, lower, upper = self.summarize(estimate, reps, ci)
+        return groups, estimate, se, lower, upper
+
+    def quantiles(self, values, q, ci=95):
+        """Quantis ponderados (ordenação única, cumsum de todas as réplicas)"""
+        y = np.asarray(values, dtype=np.float64)
+        valid = np.flatnonzero(~np.isnan(y))
+        order = valid[np.argsort(y[valid], kind="stable")]
+        y_sorted = y[order]
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+
+        def pick(cum):
+            cum = cum / cum[-1]
+            return y_sorted[np.minimum(np.searchsorted(cum, q), len(y_sorted) - 1)]
+
+        estimate = pick(np.cumsum(self.weights[order]))
+        cum_reps = np.cumsum(np.asarray(self.replicates[order], dtype=np.float64), axis=0)
+        reps = np.column_stack([pick(cum_reps[:, r]) for r in range(self.n_replicates)])
+        return self.summarize(estimate, reps, ci)
+
+    def wls(self, X, y, ci=95):
+        """
+        Coeficientes de mínimos quadrados ponderados (X já com intercepto) e IC
+        de desenho: as R equações normais são resolvidas em lote.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        keep = ~(np.isnan(X).any(axis=1) | np.isnan(y))
+        X, y = X[keep], y[keep]
+        W = np.asarray(self.replicates[keep], dtype=np.float64)
+        w = self.weights[keep]
+
+        estimate = np.linalg.solve(X.T @ (w[:, None] * X), X.T @ (w * y))
+        xtwx = np.einsum("ni,nr,nj->rij", X, W, X)
+        xtwy = np.einsum("ni,nr,n->ri", X, W, y)
+        reps = np.linalg.solve(xtwx, xtwy[..., None])[..., 0].T
+        return self.summarize(estimate, reps, ci)
@@ -0,0 +1,206 @@
+"""
+Exportação dos artefatos de outputs_aai em segundo plano.
+
+O Excel é escrito no modo write-only do openpyxl: as linhas de cada aba vão
+direto para o XML do arquivo, em blocos de EXCEL_CHUNK_ROWS, sem montar a
+planilha em memória (memória constante no número de abas e linhas). Os
+artefatos independentes (CSVs, Parquet, figuras, GeoJSON, textos, o próprio
+Excel) são gravados num pool de threads enquanto a análise segue: pandas,
+pyarrow, zlib (PNG) e GDAL liberam o GIL nas partes pesadas. Uma submissão
+bloqueia quando já há max_pending artefatos na fila, então os objetos retidos
+ficam limitados. Cada arquivo é gravado num .part e renomeado ao final;
+gravações no mesmo caminho saem na ordem de submissão e as figuras são
+renderizadas uma de cada vez (o matplotlib não é thread-safe), em paralelo
+com os demais artefatos.
+
+Os DataFrames submetidos não devem ser alterados in-place até wait(): a
+gravação usa uma cópia rasa (incluir ou remover colunas depois é seguro).
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from pns_dataset import write_dataset
+
+EXCEL_CHUNK_ROWS = 10_000
+MAX_WORKERS = 4
+MAX_PENDING = 8
+
+
+# ==========================================
+# EXCEL EM STREAMING
+# ==========================================
+
+def _sheet_frame(df, index):
+    """Índice vira coluna (como no to_excel) e colunas MultiIndex viram texto"""
+    df = df.reset_index() if index else df
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.set_axis([" / ".join(str(p) for p in col if str(p)) for col in df.columns], axis=1)
+    return df
+
+
+def _excel_rows(df, chunk_rows=EXCEL_CHUNK_ROWS):
+    """Linhas como tuplas de valores Python (missing -> célula vazia), bloco a bloco"""
+    for start in range(0, len(df), chunk_rows):
+        block = df.iloc[start:start + chunk_rows].astype(object)
+        block = block.where(block.notna(), None)
+        yield from block.itertuples(index=False, name=None)
+
+
+def write_workbook(path, sheets, chunk_rows=EXCEL_CHUNK_ROWS):
+    """
+    Grava um .xlsx com uma aba por item de sheets ({nome: DataFrame} ou
+    {nome: (DataFrame, index)}), no modo write-only do openpyxl.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    workbook = Workbook(write_only=True)
+    bold = Font(bold=True)
+    for name, frame in sheets.items():
+        frame, index = frame if isinstance(frame, tuple) else (frame, False)
+        frame = _sheet_frame(frame, index)
+        sheet = workbook.create_sheet(title=str(name)[:31])
+        header = []
+        for col in frame.columns:
+            cell = WriteOnlyCell(sheet, value=str(col))
+            cell.font = bold
+            header.append(cell)
+        sheet.append(header)
+        for row in _excel_rows(frame, chunk_rows):
+            sheet.append(row)
+    workbook.save(path)
+    return path
+
+
+# ==========================================
+# POOL DE GRAVAÇÃO
+# ==========================================
+
+class Exporter:
+    """
+    Uso:
+        exporter = Exporter(OUTPUT_DIR, max_workers=4, columnar_copies=True)
+        exporter.csv(municipal_scores, "municipal_scores_with_ci.csv")
+        exporter.figure(fig, "aai_by_age.png", dpi=150, bbox_inches="tight")
+        exporter.workbook("aai_executive_summary.xlsx", {"Municipal_Scores": municipal_scores})
+        manifest = exporter.wait()   # DataFrame: arquivo, status, segundos, bytes
+
+    Com columnar_copies, cada CSV ganha uma cópia Parquet (zstd) ao lado.
+    Erros não interrompem os demais artefatos: ficam no manifesto (status
+    'error') e são impressos em wait().
+    """
+
+    def __init__(self, output_dir, max_workers=MAX_WORKERS, max_pending=MAX_PENDING, columnar_copies=False,
+                 verbose=True):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.max_workers = os.cpu_count() if max_workers == -1 else max(1, max_workers)
+        self.columnar_copies = columnar_copies
+        self.verbose = verbose
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._slots = threading.BoundedSemaphore(max(max_pending, self.max_workers))
+        self._lanes = {}
+        self._futures = []
+        self._lock = threading.Lock()
+
+    def path(self, filename):
+        """Nome simples -> dentro de output_dir; caminhos com diretório ficam como estão"""
+        filename = Path(filename)
+        return self.output_dir / filename if filename.parent == Path(".") else filename
+
+    def submit(self, filename, write, lane=None):
+        """
+        Agenda write(caminho_temporário) para gravar `filename`. Tarefas do
+        mesmo arquivo (e da mesma lane) rodam em sequência.
+        """
+        path = self.path(filename)
+        lanes = [str(path)] + ([lane] if lane else [])
+        self._slots.acquire()
+        with self._lock:
+            previous = [self._lanes[key] for key in lanes if key in self._lanes]
+            future = self._pool.submit(self._run, path, write, previous)
+            for key in lanes:
+                self._lanes[key] = future
+            self._futures.append(future)
+        return future
+
+    def _run(self, path, write, previous):
+        for future in previous:
+            future.exception()
+        t0 = time.perf_counter()
+        tmp = path.with_name(path.name + ".part")
+        try:
+            write(tmp)
+            tmp.replace(path)
+            return {"file": str(path), "status": "ok", "seconds": time.perf_counter() - t0,
+                    "bytes": path.stat().st_size, "error": None}
+        except Exception as e:
+            tmp.unlink(missing_ok=True)
+            return {"file": str(path), "status": "error", "seconds": time.perf_counter() - t0,
+                    "bytes": None, "error": f"{type(e).__name__}: {e}"}
+        finally:
+            self._slots.release()
+
+    # ------------------------------------------------------------------
+    # Artefatos
+    # ------------------------------------------------------------------
+
+    def csv(self, df, filename, index=False, columnar=None, **kwargs):
+        df = df.copy(deep=False)
+        future = self.submit(filename, lambda tmp: df.to_csv(tmp, index=index, **kwargs))
+        if self.columnar_copies if columnar is None else columnar:
+            self.dataset(_sheet_frame(df, index), Path(filename).with_suffix(".parquet"))
+        return future
+
+    def dataset(self, df, filename, metadata=None):
+        """Parquet tipado com metadados do projeto (pns_dataset.write_dataset)"""
+        df = df.copy(deep=False)
+        return self.submit(filename, lambda tmp: write_dataset(df, tmp, metadata=metadata))
+
+    def text(self, text, filename, encoding="utf-8"):
+        return self.submit(filename, lambda tmp: Path(tmp).write_text(text, encoding=encoding))
+
+    def figure(self, fig, filename, **kwargs):
+        """Salva a figura em segundo plano e a retira do pyplot (equivale a savefig + close)"""
+        import matplotlib.pyplot as plt
+        kwargs.setdefault("format", Path(filename).suffix.lstrip(".") or None)
+        future = self.submit(filename, lambda tmp: fig.savefig(tmp, **kwargs), lane="figures")
+        plt.close(fig)
+        return future
+
+    def geojson(self, gdf, filename):
+        gdf = gdf.copy(deep=False)
+        return self.submit(filename, lambda tmp: gdf.to_file(tmp, driver="GeoJSON"))
+
+    def workbook(self, filename, sheets, chunk_rows=EXCEL_CHUNK_ROWS):
+        sheets = {name: (frame[0].copy(deep=False), frame[1]) if isinstance(frame, tuple) else frame.copy(deep=False)
+                  for name, frame in sheets.items()}
+        return self.submit(filename, lambda tmp: write_workbook(tmp, sheets, chunk_rows))
+
+    # ------------------------------------------------------------------
+    # Conclusão
+    # ------------------------------------------------------------------
+
+    def wait(self):
+        """Espera tudo o que foi submetido; devolve o manifesto das gravações concluídas agora"""
+        with self._lock:
+            futures, self._futures = self._futures, []
+            self._lanes.clear()
+        results = [future.result() for future in futures]
+        if self.verbose:
+            for row in results:
+                if row["status"] != "ok":
+                    print(f"   ❌ {Path(row['file']).name}: {row['error']}")
+        return pd.DataFrame(results, columns=["file", "status", "seconds", "bytes", "error"])
+
+    def close(self):
+        manifest = self.wait()
+        self._pool.shutdown()
+        return manifest
@@ -0,0 +1,125 @@
+"""
+Mediação X → M → Y por mínimos quadrados ponderados em forma fechada.
+
+Os três modelos de Baron & Kenny (total Y~X, mediador M~X, completo Y~X+M,
+todos com as mesmas covariáveis) saem da mesma matriz de Gram Z'WZ, com
+Z = [1, X, covariáveis, M, Y]: cada modelo é um sub-bloco. Os produtos
+cruzados das colunas de todos os pares X/M são montados uma única vez
+(linhas × termos), então cada bloco de réplicas bootstrap (ou a matriz de
+pesos replicados do desenho) custa um único produto matricial, seguido de
+sistemas lineares pequenos resolvidos em lote.
+"""
+
+import numpy as np
+import pandas as pd
+
+from aai_stats import BOOT_BATCH, bootstrap_counts, make_rng
+
+EFFECTS = ("total", "direct", "indirect", "proportion_mediated")
+
+
+def _pair_terms(data, x, m, outcome, covariates, w):
+    """
+    Produtos cruzados do triângulo superior de Z (linhas inválidas zeradas)
+    e máscara de linhas completas para um par X/M.
+    """
+    cols = [x] + list(covariates) + [m, outcome]
+    Z = data[cols].to_numpy(dtype=np.float64)
+    valid = ~np.isnan(Z).any(axis=1) & ~np.isnan(w)
+    Z = np.column_stack([np.ones(len(Z)), np.where(valid[:, None], Z, 0.0)])
+    Z[~valid, 0] = 0.0
+    iu = np.triu_indices(Z.shape[1])
+    return Z[:, iu[0]] * Z[:, iu[1]], valid, Z.shape[1]
+
+
+def _gram(totals, q):
+    """(R, termos) -> matrizes de Gram simétricas (R, q, q)"""
+    iu = np.triu_indices(q)
+    G = np.zeros(totals.shape[:1] + (q, q))
+    G[:, iu[0], iu[1]] = totals
+    G[:, iu[1], iu[0]] = totals
+    return G
+
+
+def _effects(G):
+    """
+    Efeitos a partir das matrizes de Gram (R, q, q) de Z = [1, X, cov..., M, Y].
+    Retorna array (R, 4): total, direto, indireto, proporção mediada.
+    """
+    q = G.shape[-1]
+    m, y = q - 2, q - 1
+    base = list(range(m))          # 1, X, covariáveis
+    full = base + [m]              # 1, X, covariáveis, M
+
+    G_base = G[:, base][:, :, base]
+    rhs = np.stack([G[:, base, y], G[:, base, m]], axis=-1)
+    coef_base = np.linalg.solve(G_base, rhs)       # (R, p, 2): Y~X e M~X
+    total = coef_base[:, 1, 0]
+    a = coef_base[:, 1, 1]
+
+    coef_full = np.linalg.solve(G[:, full][:, :, full], G[:, full, y][..., None])[..., 0]
+    direct = coef_full[:, 1]
+    b = coef_full[:, -1]
+
+    indirect = a * b
+    with np.errstate(invalid="ignore", divide="ignore"):
+        proportion = np.where(total != 0, indirect / total, np.nan)
+    return np.column_stack([total, direct, indirect, proportion]), np.column_stack([a, b])
+
+
+def mediation(data, pairs, outcome, weight_col, covariates=(), n_boot=500, ci=95, seed=None,
+              design=None, batch_size=BOOT_BATCH):
+    """
+    Efeitos total, direto e indireto (a·b) e proporção mediada de cada par
+    (X, M) de `pairs` sobre `outcome`, ponderados por weight_col.
+
+    Sem design: IC percentil de n_boot réplicas bootstrap (as mesmas réplicas
+    para todos os pares). Com design (aai_design.SurveyDesign construído sobre
+    as mesmas linhas de data): erro padrão e IC dos pesos replicados do desenho.
+    """
+    pairs = [tuple(pair) for pair in pairs]
+    w = data[weight_col].to_numpy(dtype=np.float64)
+    if design is not None and len(design.weights) != len(data):
+        raise ValueError("design e data precisam ter as mesmas linhas")
+
+    blocks, sizes, qs, n_valid = [], [], [], []
+    for x, m in pairs:
+        terms, valid, q = _pair_terms(data, x, m, outcome, covariates, w)
+        blocks.append(terms)
+        sizes.append(terms.shape[1])
+        qs.append(q)
+        n_valid.append(int(valid.sum()))
+    P = np.hstack(blocks)
+    bounds = np.cumsum([0] + sizes)
+
+    def solve(totals):
+        """(R, Σtermos) -> lista por par de (efeitos (R, 4), caminhos a/b (R, 2))"""
+        return [_effects(_gram(totals[:, bounds[i]:bounds[i + 1]], qs[i])) for i in range(len(pairs))]
+
+    w0 = np.nan_to_num(w)
+    point = solve((w0 @ P)[None, :])
+
+    if design is not None:
+        reps = solve((P.T @ np.asarray(design.replicates, dtype=np.float64)).T)
+    else:
+        chunks = [solve((counts * w0) @ P)
+                  for counts in bootstrap_counts(len(data), n_boot, make_rng(seed, "mediation"), batch_size)]
+        reps = [(np.vstack([c[i][0] for c in chunks]), np.vstack([c[i][1] for c in chunks]))
+                for i in range(len(pairs))]
+
+    alpha = (100 - ci) / 2
+    rows = []
+    for (x, m), n, (est, paths), (rep, _) in zip(pairs, n_valid, point, reps):
+        row = {"x": x, "mediator": m, "outcome": outcome, "n": n, "a": paths[0, 0], "b": paths[0, 1]}
+        if design is not None:
+            _, se, lower, upper = design.summarize(est[0], rep.T, ci)
+        else:
+            se = np.nanstd(rep, axis=0, ddof=1)
+            lower, upper = np.nanpercentile(rep, [alpha, 100 - alpha], axis=0)
+        for j, effect in enumerate(EFFECTS):
+            row[effect] = est[0, j]
+            row[f"{effect}_se"] = se[j]
+            row[f"{effect}_lower"] = lower[j]
+            row[f"{effect}_upper"] = upper[j]
+        rows.append(row)
+    return pd.DataFrame(rows)
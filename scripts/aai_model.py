@@ -0,0 +1,110 @@
+"""
+Modelo de vulnerabilidade (Random Forest) treinado com os pesos amostrais.
+
+A busca de hiperparâmetros usa K-fold estratificado sobre a população de
+modelagem inteira, com o peso amostral como sample_weight no ajuste e nas
+métricas. Todas as combinações (candidato × fold) rodam em paralelo em
+threads sobre a mesma matriz de features (sem cópias por processo), e o
+resultado de cada uma fica em cache, indexado pelos dados, parâmetros e fold.
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, f1_score, roc_auc_score
+from sklearn.model_selection import StratifiedKFold
+
+from aai_pipeline import hash_value
+
+# Parâmetros fixos (como no ajuste original) e grade de busca
+BASE_PARAMS = {"n_estimators": 100, "min_samples_split": 20}
+PARAM_GRID = [
+    {"max_depth": max_depth, "min_samples_leaf": leaf, "max_features": max_features}
+    for max_depth in (6, 10, None)
+    for leaf in (10, 50)
+    for max_features in ("sqrt", 0.5)
+]
+N_SPLITS = 5
+
+
+def make_model(params, seed=None, n_jobs=1):
+    return RandomForestClassifier(**{**BASE_PARAMS, **params}, random_state=seed, n_jobs=n_jobs)
+
+
+def weighted_metrics(y, proba, w, threshold=0.5):
+    """AUC, F1 e acurácia ponderados pelos pesos amostrais"""
+    pred = (proba >= threshold).astype(int)
+    return {
+        "auc": roc_auc_score(y, proba, sample_weight=w),
+        "f1": f1_score(y, pred, sample_weight=w, zero_division=0),
+        "accuracy": accuracy_score(y, pred, sample_weight=w),
+    }
+
+
+def _fit_fold(X, y, w, train, test, params, seed):
+    model = make_model(params, seed)
+    model.fit(X[train], y[train], sample_weight=w[train])
+    return weighted_metrics(y[test], model.predict_proba(X[test])[:, 1], w[test])
+
+
+def cv_search(X, y, w, grid=PARAM_GRID, n_splits=N_SPLITS, seed=None, n_jobs=1, cache_dir=None):
+    """
+    Avalia cada candidato da grade em K folds estratificados. Devolve
+    (métricas por candidato × fold, resumo por candidato ordenado por AUC).
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    y = np.asarray(y)
+    w = np.asarray(w, dtype=np.float64)
+    folds = list(StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed).split(X, y))
+
+    cache_dir = Path(cache_dir) if cache_dir else None
+    if cache_dir:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+    data_key = hash_value(X) + hash_value(y) + hash_value(w)
+
+    def run(task):
+        candidate, fold = task
+        params = grid[candidate]
+        cache_file = None
+        if cache_dir:
+            key = hashlib.sha256(
+                json.dumps([data_key, {**BASE_PARAMS, **params}, n_splits, fold, seed], default=str).encode()
+            ).hexdigest()[:24]
+            cache_file = cache_dir / f"rf_cv_{key}.json"
+            if cache_file.exists():
+                with open(cache_file, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        train, test = folds[fold]
+        metrics = _fit_fold(X, y, w, train, test, params, seed)
+        if cache_file:
+            with open(cache_file, "w", encoding="utf-8") as f:
+                json.dump(metrics, f)
+        return metrics
+
+    tasks = [(c, k) for c in range(len(grid)) for k in range(n_splits)]
+    max_workers = os.cpu_count() if n_jobs == -1 else max(1, n_jobs)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(run, tasks))
+
+    folds_df = pd.DataFrame([
+        {"candidate": c, "fold": k, **grid[c], **metrics}
+        for (c, k), metrics in zip(tasks, results)
+    ])
+    summary = (folds_df.groupby("candidate")[["auc", "f1", "accuracy"]]
+               .agg(["mean", "std"]))
+    summary.columns = [f"{metric}_{stat}" for metric, stat in summary.columns]
+    summary = summary.join(pd.DataFrame(grid)).sort_values("auc_mean", ascending=False)
+    return folds_df, summary
+
+
+def fit_final(X, y, w, params, seed=None, n_jobs=-1):
+    """Ajuste final com os melhores parâmetros na população inteira"""
+    model = make_model(params, seed, n_jobs)
+    model.fit(np.asarray(X, dtype=np.float64), np.asarray(y), sample_weight=np.asarray(w, dtype=np.float64))
+    return model
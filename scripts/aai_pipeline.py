@@ -0,0 +1,372 @@
+"""
+Pipeline de etapas com cache por conteúdo para a análise do AAI.
+
+Cada etapa declara entradas (outras etapas ou fontes registradas com put),
+as chaves de configuração de que depende e o código que a executa. A chave de
+cache é o hash de tudo isso: o fonte da etapa, o fonte dos módulos do projeto
+(scripts/) e das funções do notebook que ela chama, e os valores de
+configuração, que a etapa recebe como argumentos. Uma etapa que leia uma
+global de dados não declarada em config é recusada (o cache ficaria velho sem
+aviso). O resultado é gravado em binário (pickle) e reaproveitado enquanto a
+chave não mudar. Etapas independentes rodam em paralelo (threads:
+numpy/sklearn liberam o GIL nas partes pesadas).
+"""
+
+import dis
+import hashlib
+import inspect
+import pickle
+import sys
+import types
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+def hash_value(value):
+    """
+    Hash estável do conteúdo de DataFrames, Series, arrays e objetos serializáveis.
+    Objetos com cache_key (ex.: SurveyDesign) entram pela chave, sem serializar o conteúdo.
+    """
+    digest = hashlib.sha256()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest.update(type(value).__name__.encode())
+        if isinstance(value, pd.DataFrame):
+            digest.update(repr(list(zip(value.columns, map(str, value.dtypes)))).encode())
+        else:
+            digest.update(f"{value.name}|{value.dtype}".encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(f"{value.dtype}|{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (str, bytes, int, float, bool, type(None), tuple, list, dict)):
+        digest.update(repr(value).encode())
+    elif getattr(value, "cache_key", None) is not None:
+        digest.update(f"{type(value).__name__}|{value.cache_key!r}".encode())
+    else:
+        digest.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    return digest.hexdigest()
+
+
+def hash_file(path):
+    """SHA-256 do conteúdo de um arquivo"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Diretório dos módulos do projeto: o fonte deles entra na chave das etapas que os usam
+PROJECT_DIR = Path(__file__).resolve().parent
+
+
+def _source_hash(func):
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        code = func.__code__
+        source = repr((code.co_code, code.co_consts, code.co_names))
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def _global_names(code):
+    """Nomes globais lidos por um code object (inclui funções aninhadas)"""
+    names = set()
+    for instruction in dis.get_instructions(code):
+        if instruction.opname in ("LOAD_GLOBAL", "LOAD_NAME"):
+            names.add(instruction.argval)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _global_names(const)
+    return names
+
+
+def _project_file(obj):
+    """Arquivo-fonte do módulo de obj, se ele for um módulo do projeto"""
+    module = obj if isinstance(obj, types.ModuleType) else inspect.getmodule(obj)
+    path = getattr(module, "__file__", None)
+    if path and Path(path).resolve().parent == PROJECT_DIR:
+        return Path(path).resolve()
+    return None
+
+
+def _is_code(value):
+    return isinstance(value, types.ModuleType) or callable(value)
+
+
+def _local_functions(func):
+    """A função e as funções do mesmo módulo (ex.: o notebook) que ela chama, recursivamente"""
+    found, stack = {}, [func]
+    while stack:
+        f = stack.pop()
+        if id(f) in found:
+            continue
+        found[id(f)] = f
+        for name in _global_names(f.__code__):
+            value = f.__globals__.get(name)
+            if isinstance(value, types.FunctionType) and inspect.getmodule(value) is inspect.getmodule(func):
+                stack.append(value)
+    return list(found.values())
+
+
+def _module_by_file(path):
+    for module in list(sys.modules.values()):
+        file = getattr(module, "__file__", None)
+        if file and Path(file).resolve() == path:
+            return module
+    return None
+
+
+def code_dependencies(func):
+    """
+    Fontes de que a função depende: {rótulo: hash}. Entram o próprio fonte, o
+    das funções do mesmo módulo que ela chama (ex.: helpers do notebook) e o
+    dos módulos do projeto usados por elas (e dos que eles importam do projeto).
+    """
+    hashes, modules = {}, []
+    for f in _local_functions(func):
+        hashes[f"{f.__module__}.{f.__qualname__}"] = _source_hash(f)
+        for name in _global_names(f.__code__):
+            value = f.__globals__.get(name)
+            if _is_code(value) and _project_file(value):
+                modules.append(_project_file(value))
+
+    while modules:
+        path = modules.pop()
+        if str(path) in hashes:
+            continue
+        hashes[str(path)] = hash_file(path)
+        module = _module_by_file(path)
+        for value in vars(module).values() if module else ():
+            if _is_code(value) and _project_file(value):
+                modules.append(_project_file(value))
+    return hashes
+
+
+def undeclared_globals(func, declared=()):
+    """Globais de dados (não módulos nem funções) lidas pela função, ou por helpers dela, fora de declared"""
+    names = set()
+    for f in _local_functions(func):
+        for name in _global_names(f.__code__):
+            if name in declared or name not in f.__globals__:
+                continue
+            if not _is_code(f.__globals__[name]):
+                names.add(name)
+    return sorted(names)
+
+
+def hash_code(func, code=()):
+    """
+    Hash do código da função e de suas dependências (code_dependencies),
+    mais as dependências extras em code (funções ou módulos)
+    """
+    hashes = code_dependencies(func)
+    for extra in code:
+        if isinstance(extra, types.ModuleType):
+            hashes[extra.__name__] = hash_file(extra.__file__)
+        else:
+            hashes.update(code_dependencies(extra))
+    return hashlib.sha256(repr(sorted(hashes.items())).encode("utf-8")).hexdigest()
+
+
+class Stage:
+    def __init__(self, name, func, inputs=(), config=(), files=(), code=()):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.config = tuple(config)
+        self.files = tuple(files)
+        self.code = tuple(code)
+
+
+class Pipeline:
+    """
+    Grafo de etapas com cache em cache_dir. Uso:
+
+        pipeline = Pipeline(OUTPUT_DIR / ".cache", config={"N_BOOTSTRAP": 500})
+        pipeline.put("base", df)
+
+        @pipeline.stage("municipal", inputs=["base"], config=["N_BOOTSTRAP"])
+        def municipal(base, N_BOOTSTRAP):
+            ...
+
+        results = pipeline.run("municipal")
+
+    A etapa recebe as entradas e as chaves de config como argumentos nomeados.
+    code lista dependências de código que a análise automática não vê (ex.:
+    funções passadas por variável); arquivos lidos pela etapa vão em files.
+    """
+
+    def __init__(self, cache_dir, config=None, max_workers=4, verbose=True):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.config = dict(config or {})
+        self.max_workers = max_workers
+        self.verbose = verbose
+        self.stages = {}
+        self.sources = {}
+        self.results = {}
+        self.errors = {}
+        self._keys = {}
+
+    # ------------------------------------------------------------------
+    # Declaração
+    # ------------------------------------------------------------------
+
+    def put(self, name, value):
+        """Registra um valor em memória como fonte (chave = hash do conteúdo)"""
+        self.sources[name] = hash_value(value)
+        self.results[name] = value
+        self._keys.clear()
+        return value
+
+    def configure(self, **values):
+        """Inclui ou troca valores de configuração (ex.: listas definidas mais adiante no notebook)"""
+        self.config.update(values)
+        self._keys.clear()
+
+    def stage(self, name, inputs=(), config=(), files=(), code=()):
+        """Decorador que registra uma etapa"""
+        def register(func):
+            self.stages[name] = Stage(name, func, inputs, config, files, code)
+            self._keys.clear()
+            return func
+        return register
+
+    # ------------------------------------------------------------------
+    # Chaves de cache
+    # ------------------------------------------------------------------
+
+    def key(self, name):
+        """Hash de entradas + código + configuração (recursivo nas dependências)"""
+        if name in self.sources:
+            return self.sources[name]
+        if name in self._keys:
+            return self._keys[name]
+        if name not in self.stages:
+            raise KeyError(f"Etapa ou fonte desconhecida: {name!r}")
+
+        stage = self.stages[name]
+        missing = [k for k in stage.config if k not in self.config]
+        if missing:
+            raise KeyError(f"Etapa {name!r}: configuração ausente {missing}")
+        undeclared = undeclared_globals(stage.func, stage.config + stage.inputs)
+        if undeclared:
+            raise ValueError(f"Etapa {name!r} lê globais fora de config: {undeclared}")
+        parts = [
+            name,
+            hash_code(stage.func, stage.code),
+            repr([(k, self.config[k]) for k in stage.config]),
+            *[f"{dep}={self.key(dep)}" for dep in stage.inputs],
+            *[f"{path}={hash_file(path)}" for path in stage.files],
+        ]
+        key = hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+        self._keys[name] = key
+        return key
+
+    def _cache_file(self, name):
+        return self.cache_dir / f"{name}-{self.key(name)[:16]}.pkl"
+
+    def is_cached(self, name):
+        return name in self.sources or self._cache_file(name).exists()
+
+    # ------------------------------------------------------------------
+    # Execução
+    # ------------------------------------------------------------------
+
+    def _needed(self, targets):
+        """Etapas necessárias para os alvos, em ordem topológica"""
+        order, seen = [], set()
+
+        def visit(name, path=()):
+            if name in path:
+                raise ValueError(f"Ciclo no pipeline: {' -> '.join(path + (name,))}")
+            if name in seen or name in self.sources:
+                return
+            for dep in self.stages[name].inputs:
+                visit(dep, path + (name,))
+            seen.add(name)
+            order.append(name)
+
+        for target in targets:
+            visit(target)
+        return order
+
+    def _execute(self, name):
+        stage = self.stages[name]
+        kwargs = {dep: self.results[dep] for dep in stage.inputs}
+        kwargs.update({k: self.config[k] for k in stage.config})
+        value = stage.func(**kwargs)
+        tmp = self._cache_file(name).with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp.replace(self._cache_file(name))
+        return value
+
+    def _load(self, name):
+        with open(self._cache_file(name), "rb") as f:
+            return pickle.load(f)
+
+    def run(self, *targets, force=(), errors="raise"):
+        """
+        Executa (ou carrega do cache) os alvos e suas dependências. Etapas cujas
+        dependências já estão prontas rodam em paralelo. Retorna {nome: resultado}.
+        Com errors="keep", uma etapa que falha não interrompe as outras: o erro
+        fica em self.errors, as etapas que dependem dela são puladas e o
+        retorno traz só os alvos concluídos.
+        """
+        if errors not in ("raise", "keep"):
+            raise ValueError(f"errors deve ser 'raise' ou 'keep': {errors!r}")
+        targets = targets or tuple(self.stages)
+        order = self._needed(targets)
+        force = set(force)
+        pending = {}
+        for name in order:
+            self.errors.pop(name, None)
+            if name not in force and self.is_cached(name):
+                self.results[name] = self._load(name)
+                if self.verbose:
+                    print(f"   ↺ {name}: cache")
+            else:
+                self.results.pop(name, None)
+                pending[name] = set(self.stages[name].inputs) - set(self.results)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+            while pending or running:
+                for name, deps in list(pending.items()):
+                    failed = sorted(deps & set(self.errors))
+                    if failed:
+                        del pending[name]
+                        self.errors[name] = f"dependência falhou: {', '.join(failed)}"
+                ready = [n for n, deps in pending.items() if not (deps - set(self.results))]
+                for name in ready:
+                    del pending[name]
+                    running[pool.submit(self._execute, name)] = name
+                    if self.verbose:
+                        print(f"   ▶ {name}: executando")
+                if not running:
+                    if pending:
+                        raise RuntimeError(f"Dependências não resolvidas: {sorted(pending)}")
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                    except Exception as e:
+                        if errors == "raise":
+                            raise
+                        self.errors[name] = f"{type(e).__name__}: {e}"
+                        if self.verbose:
+                            print(f"   ❌ {name}: {self.errors[name]}")
+
+        return {name: self.results[name] for name in targets if name in self.results}
+
+    def clear(self):
+        """Remove todos os resultados gravados"""
+        for path in self.cache_dir.glob("*.pkl"):
+            path.unlink()
@@ -0,0 +1,189 @@
+"""
+Pontuador do AAI com parâmetros congelados.
+
+fit() percorre as mesmas etapas do ETL e do notebook (IMC, morbidade,
+funcionalidade, saúde, imputação e domínios do AAI) guardando cada
+estatística populacional usada (médias, desvios, mínimos/máximos, medianas,
+domínios disponíveis). transform() aplica exatamente as mesmas contas com os
+parâmetros guardados, então novos registros são pontuados sem depender do
+resto da amostra e sem alterar os scores já calculados. Os parâmetros são
+gravados em JSON.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+SCORER_VERSION = 2
+
+BINARY_COLS = ["possui_plano_saude", "consulta_12m", "atendimento_sus", "usa_internet", "usa_celular",
+               "depressao_diag", "vacina_influenza", "atividade_fisica", "fumante_atual", "hipertensao",
+               "diabetes", "doenca_cardiaca", "avc", "doenca_respiratoria", "cancer"]
+CHRONIC_COLS = ["hipertensao", "diabetes", "doenca_cardiaca", "avc", "doenca_respiratoria", "cancer", "depressao_diag"]
+ADL_COLS = ["dificuldade_vestir", "dificuldade_banho", "dificuldade_alimentar"]
+IADL_COLS = ["dificuldade_compras", "dificuldade_medico"]
+IMPUTE_COLS = ["num_medicamentos", "idade", "anos_estudo", "renda_percapita"]
+
+# Acima disso a altura está em cm
+ALTURA_MAX_M = 3.0
+
+# Pesos do health_score sobre os z-scores
+HEALTH_WEIGHTS = {"autoav_z": -0.5, "multimorb_z": -0.7, "functional_z": 1.2}
+
+# Domínios do AAI (mesma ordem do notebook) e seus indicadores
+ALL_DOMAINS = ["health_score", "functional_score", "participation_score", "econ_score", "access_score"]
+# Domínios que entram no AAI_total: os que o ETL entrega (participation, econ e access
+# são complementares e ficam fora da média, como no notebook original)
+AAI_DOMAINS = ["health_score", "functional_score"]
+PARTICIPATION_COLS = ["usa_internet", "usa_celular"]
+ECON_COLS = ["anos_estudo"]
+ACCESS_COLS = ["possui_plano_saude", "consulta_12m"]
+
+
+class AAIScorer:
+    """
+    Uso:
+        scorer = AAIScorer().fit(df_referencia)   # guarda os parâmetros
+        scored = scorer.transform(df)             # df_referencia -> mesmos valores do lote
+        scorer.save("aai_scorer.json")
+        novos = AAIScorer.load("aai_scorer.json").transform(df_nova_onda)
+
+    As entradas são os registros do ETL antes dos mapeamentos categóricos
+    (códigos numéricos da PNS).
+    """
+
+    def __init__(self, params=None):
+        self.params = dict(params or {})
+        self._fitting = False
+
+    def _param(self, name, compute):
+        """Parâmetro congelado: calculado no fit, lido no transform"""
+        if self._fitting:
+            value = compute()
+            self.params[name] = value if isinstance(value, list) else float(value)
+        if name not in self.params:
+            raise KeyError(f"Parâmetro '{name}' ausente: o pontuador não foi ajustado com esta coluna")
+        return self.params[name]
+
+    def fit(self, df):
+        self.params = {}
+        self._fitting = True
+        try:
+            self._apply(df)
+        finally:
+            self._fitting = False
+        return self
+
+    def transform(self, df):
+        if not self.params:
+            raise ValueError("Pontuador não ajustado: chame fit() ou load()")
+        return self._apply(df)
+
+    def fit_transform(self, df):
+        self.fit(df)
+        return self.transform(df)
+
+    def transform_batches(self, batches):
+        """Pontua um fluxo de lotes (ex.: blocos de pns_fwf.iter_chunks)"""
+        for batch in batches:
+            yield self.transform(batch)
+
+    # ------------------------------------------------------------------
+    # Etapas (mesmas contas do ETL e do notebook)
+    # ------------------------------------------------------------------
+
+    def _apply(self, df):
+        df = df.copy()
+
+        if "peso_real" in df.columns and "altura" in df.columns:
+            # Altura em cm nos microdados; registros já convertidos (m) não são divididos de novo
+            df["altura"] = df["altura"].where(df["altura"] <= ALTURA_MAX_M, df["altura"] / 100)
+            df["imc"] = df["peso_real"] / (df["altura"] ** 2)
+            df["imc"] = df["imc"].fillna(self._param("imc_median", lambda: df["imc"].median()))
+
+        for col in BINARY_COLS + ADL_COLS + IADL_COLS:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(np.int8)
+
+        if all(c in df.columns for c in CHRONIC_COLS):
+            df["multimorbidity_count"] = df[CHRONIC_COLS].sum(axis=1).astype(np.int16)
+            df["multimorb_cat"] = pd.cut(df["multimorbidity_count"], bins=[-1, 0, 1, 2, 100], labels=["0", "1", "2", "3+"])
+
+        if all(c in df.columns for c in ADL_COLS):
+            df["adl_score"] = df[ADL_COLS].sum(axis=1).astype(np.int16)
+        if all(c in df.columns for c in IADL_COLS):
+            df["iadl_score"] = df[IADL_COLS].sum(axis=1).astype(np.int16)
+
+        if "adl_score" in df.columns or "iadl_score" in df.columns:
+            df["functional_raw"] = np.int16(0)
+            if "adl_score" in df.columns:
+                df["functional_raw"] += df["adl_score"]
+            if "iadl_score" in df.columns:
+                df["functional_raw"] += df["iadl_score"]
+            max_raw = self._param("functional_max", lambda: df["functional_raw"].max() or 1)
+            df["functional_score"] = 1 - (df["functional_raw"] / max_raw)
+
+        if "possui_plano_saude" in df.columns and "atendimento_sus" in df.columns:
+            df["dependencia_SUS"] = ((df["possui_plano_saude"] == 2) & (df["atendimento_sus"] == 1)).astype(np.int8)
+
+        if "vacina_influenza" in df.columns:
+            df["cobertura_influenza"] = df["vacina_influenza"]
+
+        if "autoavaliacao_saude" in df.columns and "multimorbidity_count" in df.columns and "functional_score" in df.columns:
+            for z_col, col in [("autoav_z", "autoavaliacao_saude"), ("multimorb_z", "multimorbidity_count"),
+                               ("functional_z", "functional_score")]:
+                mean = self._param(f"{col}_mean", lambda: df[col].mean())
+                std = self._param(f"{col}_std", lambda: df[col].std(ddof=0))
+                df[z_col] = (df[col].astype(float) - mean) / std
+            df["health_score_raw"] = sum(weight * df[z_col] for z_col, weight in HEALTH_WEIGHTS.items())
+            minv = self._param("health_raw_min", lambda: df["health_score_raw"].min())
+            maxv = self._param("health_raw_max", lambda: df["health_score_raw"].max())
+            df["health_score"] = (df["health_score_raw"] - minv) / (maxv - minv + 1e-9)
+
+        for col in IMPUTE_COLS:
+            if col in df.columns:
+                df[col] = df[col].fillna(self._param(f"{col}_median", lambda: df[col].median()))
+
+        # Domínios do AAI (notebook, seção de scores): Sim (código 1) = 100
+        participation = [(df[col] == 1) * 100.0 for col in PARTICIPATION_COLS if col in df.columns]
+        if participation:
+            df["participation_score"] = pd.concat(participation, axis=1).mean(axis=1)
+
+        econ = []
+        for col in ECON_COLS:
+            if col in df.columns:
+                values = df[col].fillna(self._param(f"econ_{col}_median", lambda: df[col].median()))
+                min_val = self._param(f"econ_{col}_min", lambda: values.min())
+                max_val = self._param(f"econ_{col}_max", lambda: values.max())
+                if max_val == min_val:
+                    econ.append(pd.Series(50.0, index=df.index))
+                else:
+                    econ.append((values - min_val) / (max_val - min_val) * 100)
+        if econ:
+            df["econ_score"] = pd.concat(econ, axis=1).mean(axis=1)
+
+        access = [(df[col] == 1) * 100.0 for col in ACCESS_COLS if col in df.columns]
+        if access:
+            df["access_score"] = pd.concat(access, axis=1).mean(axis=1)
+
+        domains = self._param("domains", lambda: [d for d in AAI_DOMAINS if d in df.columns])
+        df["AAI_total"] = df[domains].mean(axis=1)
+        return df
+
+    # ------------------------------------------------------------------
+    # Persistência
+    # ------------------------------------------------------------------
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"version": SCORER_VERSION, "params": self.params}, f, ensure_ascii=False, indent=1)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != SCORER_VERSION:
+            raise ValueError(f"Versão de pontuador incompatível em {path}")
+        return cls(data["params"])
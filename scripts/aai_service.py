@@ -0,0 +1,417 @@
+"""
+Serviço local HTTP/JSON sobre as estimativas de outputs_aai (sem rede externa).
+
+Na carga, os municípios de municipal_scores_with_ci.csv ficam indexados por
+codmun e UF, e os registros individuais (pns_2019_processed_60plus.parquet ou
+.csv) ganham um índice invertido por dimensão de subgrupo (linhas de cada UF,
+sexo, faixa etária, cluster...). Um subgrupo é a interseção desses índices; a
+média ponderada e o IC bootstrap saem de aai_stats sobre essas linhas, com
+fluxo RNG fixo por consulta (mesma resposta em toda execução). Respostas de
+subgrupos e rankings ficam num cache LRU; consultas repetidas só serializam
+bytes já prontos. A cada requisição (no máximo uma vez a cada RELOAD_CHECK_S)
+o serviço confere data e tamanho dos arquivos e, se mudaram, recarrega os
+índices e esvazia o cache.
+
+Rotas (GET, respostas JSON):
+    /health                                  arquivos carregados e estado do cache
+    /dims                                    dimensões de subgrupo e seus níveis
+    /municipio/<codmun>                      linha do município
+    /municipios?uf=Bahia                     municípios da UF
+    /ranking?k=20&by=AAI_total&order=asc&reliable=1&uf=Bahia
+    /subgroup?value=AAI_total&uf=Bahia&sexo=Feminino&faixa_etaria=80%2B&cluster=2
+        (dimensão repetida = união dos níveis; n_boot e ci opcionais)
+
+Uso (de dentro de scripts/): python aai_service.py
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from aai_stats import make_rng, weighted_bootstrap_ci
+from pns_dataset import read_dataset
+
+OUTPUT_DIR = "../outputs_aai"
+HOST = "127.0.0.1"
+PORT = 8765
+
+MUNICIPAL_FILE = "municipal_scores_with_ci.csv"
+INDIVIDUAL_FILES = ["pns_2019_processed_60plus.parquet", "pns_2019_processed_60plus.csv"]
+WEIGHT_COL = "peso_amostral"
+SUBGROUP_DIMS = ["codmun", "uf", "regiao", "sexo", "raca_cor", "faixa_etaria", "area_urbana", "cluster", "vulnerable"]
+
+# Inferência dos subgrupos (mesmos padrões do notebook)
+N_BOOTSTRAP = 500
+MAX_BOOTSTRAP = 5000
+CI = 95
+SEED = 42
+MIN_N_RELIABLE = 30
+
+CACHE_SIZE = 1024
+RELOAD_CHECK_S = 2.0
+
+
+class QueryError(ValueError):
+    """Parâmetro inválido (HTTP 400)"""
+
+
+class NotFound(KeyError):
+    """Recurso inexistente (HTTP 404)"""
+
+
+def _jsonable(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def _records(df):
+    """Linhas como dicts prontos para JSON (missing -> null)"""
+    block = df.astype(object).where(df.notna(), None)
+    return [{k: _jsonable(v) for k, v in row.items()} for row in block.to_dict("records")]
+
+
+def _inverted_index(series):
+    """{nível (texto): posições ordenadas das linhas}"""
+    codes, levels = pd.factorize(series, sort=True)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.cumsum(np.bincount(codes[codes >= 0], minlength=len(levels)))
+    starts = np.searchsorted(codes[order], 0)
+    positions = np.split(order[starts:], bounds[:-1])
+    return {_level_key(level): pos for level, pos in zip(levels, positions)}
+
+
+def _level_key(level):
+    level = _jsonable(level)
+    if isinstance(level, float) and level.is_integer():
+        level = int(level)
+    return str(level)
+
+
+class LRUCache:
+    """Cache LRU thread-safe com contadores de acerto"""
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+# ==========================================
+# ÍNDICES EM MEMÓRIA
+# ==========================================
+
+class Snapshot:
+    """Índices imutáveis de uma versão dos arquivos (trocados inteiros na recarga)"""
+
+    def __init__(self, municipal, individual, files):
+        self.files = files
+        self.loaded_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+        self.municipal = municipal.reset_index(drop=True)
+        self.records = _records(self.municipal)
+        self.by_codmun = {int(c): i for i, c in enumerate(self.municipal["codmun"])}
+        self.by_uf = (_inverted_index(self.municipal["uf"]) if "uf" in self.municipal.columns else {})
+        self._orders = {}
+
+        self.individual = individual
+        self.dims, self.values, self.index = [], [], {}
+        if individual is not None:
+            self.dims = [d for d in SUBGROUP_DIMS if d in individual.columns]
+            self.index = {dim: _inverted_index(individual[dim]) for dim in self.dims}
+            self.values = [c for c in individual.columns
+                           if c not in self.dims and c != WEIGHT_COL and pd.api.types.is_numeric_dtype(individual[c])]
+            self.w = individual[WEIGHT_COL].to_numpy(dtype=np.float64)
+
+    # ------------------------------------------------------------------
+    # Municípios
+    # ------------------------------------------------------------------
+
+    def municipio(self, codmun):
+        try:
+            return self.records[self.by_codmun[int(codmun)]]
+        except (KeyError, ValueError):
+            raise NotFound(f"Município {codmun!r} não encontrado")
+
+    def municipios(self, uf=None):
+        if uf is None:
+            return self.records
+        if uf not in self.by_uf:
+            raise NotFound(f"UF {uf!r} não encontrada")
+        return [self.records[i] for i in self.by_uf[uf]]
+
+    def ranking(self, k=20, by="AAI_total", order="asc", reliable=True, uf=None):
+        """Os k municípios com menor (asc) ou maior (desc) valor de `by`"""
+        if by not in self.municipal.columns or not pd.api.types.is_numeric_dtype(self.municipal[by]):
+            raise QueryError(f"by deve ser uma coluna numérica de {MUNICIPAL_FILE}: {by!r}")
+        if order not in ("asc", "desc"):
+            raise QueryError(f"order deve ser 'asc' ou 'desc': {order!r}")
+        if k < 1:
+            raise QueryError(f"k deve ser >= 1: {k!r}")
+        key = (by, order)
+        if key not in self._orders:
+            values = self.municipal[by].to_numpy(dtype=np.float64)
+            ranked = np.argsort(values if order == "asc" else -values, kind="stable")
+            self._orders[key] = ranked[~np.isnan(values[ranked])]
+        ranked = self._orders[key]
+        keep = np.ones(len(self.municipal), dtype=bool)
+        if reliable and "reliable" in self.municipal.columns:
+            keep &= self.municipal["reliable"].astype(bool).to_numpy()
+        if uf is not None:
+            in_uf = np.zeros(len(keep), dtype=bool)
+            in_uf[self.by_uf.get(uf, [])] = True
+            keep &= in_uf
+        ranked = ranked[keep[ranked]]
+        return {"by": by, "order": order, "reliable": reliable, "uf": uf, "total": int(len(ranked)),
+                "items": [self.records[i] for i in ranked[:k]]}
+
+    # ------------------------------------------------------------------
+    # Subgrupos
+    # ------------------------------------------------------------------
+
+    def rows(self, filters):
+        """Linhas do subgrupo: união dos níveis de cada dimensão, interseção entre dimensões"""
+        rows = None
+        for dim, levels in filters.items():
+            if dim not in self.index:
+                raise QueryError(f"Dimensão de subgrupo desconhecida: {dim!r} (disponíveis: {self.dims})")
+            parts = [self.index[dim].get(level, np.empty(0, dtype=np.int64)) for level in levels]
+            selected = parts[0] if len(parts) == 1 else np.unique(np.concatenate(parts))
+            rows = selected if rows is None else np.intersect1d(rows, selected, assume_unique=True)
+        return np.arange(len(self.individual)) if rows is None else rows
+
+    def subgroup(self, value="AAI_total", filters=None, n_boot=N_BOOTSTRAP, ci=CI):
+        if self.individual is None:
+            raise NotFound(f"Nenhum arquivo individual em outputs_aai ({', '.join(INDIVIDUAL_FILES)})")
+        if value not in self.values:
+            raise QueryError(f"value deve ser uma de {self.values}: {value!r}")
+        filters = filters or {}
+        rows = self.rows(filters)
+        y = self.individual[value].to_numpy(dtype=np.float64)[rows]
+        w = self.w[rows]
+        valid = ~np.isnan(y) & ~np.isnan(w)
+        y, w = y[valid], w[valid]
+        result = {"value": value, "filters": filters, "n": int(len(y)), "pop_weight_sum": float(w.sum()),
+                  "estimate": None, "ci_lower": None, "ci_upper": None, "ci": ci, "n_boot": n_boot,
+                  "reliable": bool(len(y) >= MIN_N_RELIABLE)}
+        if len(y) and w.sum() > 0:
+            key = json.dumps([value, sorted(filters.items())], ensure_ascii=False)
+            estimate, lower, upper = weighted_bootstrap_ci(y, w, n_boot=n_boot, ci=ci,
+                                                           rng=make_rng(SEED, "subgroup", key))
+            result.update(estimate=float(estimate), ci_lower=float(lower), ci_upper=float(upper))
+        return result
+
+
+class EstimateStore:
+    """Snapshot atual + recarga quando os arquivos mudam + cache LRU das consultas"""
+
+    def __init__(self, output_dir=OUTPUT_DIR, cache_size=CACHE_SIZE, reload_check_s=RELOAD_CHECK_S):
+        self.output_dir = Path(output_dir)
+        self.cache = LRUCache(cache_size)
+        self.reload_check_s = reload_check_s
+        self.snapshot = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+
+    def _paths(self):
+        municipal = self.output_dir / MUNICIPAL_FILE
+        individual = next((self.output_dir / f for f in INDIVIDUAL_FILES if (self.output_dir / f).exists()), None)
+        return municipal, individual
+
+    def _signature(self):
+        signature = {}
+        for path in self._paths():
+            if path is not None and path.exists():
+                stat = path.stat()
+                signature[path.name] = (stat.st_mtime_ns, stat.st_size)
+        return signature
+
+    def refresh(self, force=False):
+        """Recarrega se algum arquivo mudou (verificação limitada a cada reload_check_s)"""
+        now = time.monotonic()
+        if not force and now - self._checked < self.reload_check_s:
+            return False
+        with self._lock:
+            self._checked = now
+            signature = self._signature()
+            if self.snapshot is not None and signature == self.snapshot.files:
+                return False
+            municipal_path, individual_path = self._paths()
+            if not municipal_path.exists():
+                raise FileNotFoundError(f"{municipal_path} não encontrado: rode o notebook (Seção 7)")
+            try:
+                municipal = pd.read_csv(municipal_path)
+                individual = read_dataset(individual_path) if individual_path else None
+                snapshot = Snapshot(municipal, individual, signature)
+            except Exception as e:
+                if self.snapshot is None:
+                    raise
+                print(f"⚠️  Recarga falhou, mantendo a versão anterior: {e}")
+                return False
+            self.snapshot = snapshot
+            self.cache.clear()
+            print(f"OK Índices carregados: {len(snapshot.municipal):,} municípios"
+                  + (f", {len(individual):,} registros individuais" if individual is not None else ""))
+            return True
+
+    def cached(self, key, compute):
+        """Resposta (bytes JSON) do cache ou calculada e guardada -> (bytes, acerto)"""
+        body = self.cache.get(key)
+        if body is not None:
+            return body, True
+        body = _dumps(compute())
+        self.cache.put(key, body)
+        return body, False
+
+    def health(self):
+        snap = self.snapshot
+        return {"status": "ok", "output_dir": str(self.output_dir.resolve()), "loaded_at": snap.loaded_at,
+                "files": {name: {"mtime_ns": sig[0], "bytes": sig[1]} for name, sig in snap.files.items()},
+                "municipios": len(snap.municipal),
+                "registros_individuais": None if snap.individual is None else len(snap.individual),
+                "cache": self.cache.stats()}
+
+    def dims(self):
+        snap = self.snapshot
+        return {"dims": {dim: sorted(snap.index[dim]) for dim in snap.dims if dim != "codmun"},
+                "values": snap.values, "ufs": sorted(snap.by_uf)}
+
+
+# ==========================================
+# HTTP
+# ==========================================
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, default=_jsonable).encode("utf-8")
+
+
+def _single(params, name, default=None, cast=str):
+    if name not in params:
+        return default
+    try:
+        return cast(params[name][-1])
+    except ValueError:
+        raise QueryError(f"Parâmetro inválido: {name}={params[name][-1]!r}")
+
+
+def _flag(text):
+    return text.lower() not in ("0", "false", "no", "nao", "não")
+
+
+def route(store, path, params):
+    """(caminho, parâmetros de parse_qs) -> (bytes JSON, acerto de cache)"""
+    store.refresh()
+    snap = store.snapshot
+    parts = [unquote(p) for p in path.strip("/").split("/") if p]
+
+    if parts == ["health"]:
+        return _dumps(store.health()), False
+    if parts == ["dims"]:
+        return _dumps(store.dims()), False
+    if len(parts) == 2 and parts[0] == "municipio":
+        return _dumps(snap.municipio(parts[1])), False
+    if parts == ["municipios"]:
+        return _dumps(snap.municipios(_single(params, "uf"))), False
+
+    if parts == ["ranking"]:
+        k = _single(params, "k", 20, int)
+        by = _single(params, "by", "AAI_total")
+        order = _single(params, "order", "asc")
+        reliable = _single(params, "reliable", True, _flag)
+        uf = _single(params, "uf")
+        key = ("ranking", k, by, order, reliable, uf)
+        return store.cached(key, lambda: snap.ranking(k, by, order, reliable, uf))
+
+    if parts == ["subgroup"]:
+        value = _single(params, "value", "AAI_total")
+        n_boot = _single(params, "n_boot", N_BOOTSTRAP, int)
+        ci = _single(params, "ci", CI, float)
+        if not 1 <= n_boot <= MAX_BOOTSTRAP or not 0 < ci < 100:
+            raise QueryError(f"n_boot deve estar em [1, {MAX_BOOTSTRAP}] e ci em (0, 100)")
+        filters = {dim: sorted(set(levels)) for dim, levels in params.items() if dim not in ("value", "n_boot", "ci")}
+        key = ("subgroup", value, n_boot, ci, tuple(sorted((d, tuple(v)) for d, v in filters.items())))
+        return store.cached(key, lambda: snap.subgroup(value, filters, n_boot, ci))
+
+    raise NotFound(f"Rota desconhecida: {path}")
+
+
+def make_handler(store, verbose=False):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            t0 = time.perf_counter()
+            url = urlsplit(self.path)
+            try:
+                body, hit = route(store, url.path, parse_qs(url.query))
+                status = 200
+            except QueryError as e:
+                body, hit, status = _dumps({"error": str(e)}), False, 400
+            except NotFound as e:
+                body, hit, status = _dumps({"error": e.args[0]}), False, 404
+            except Exception as e:
+                body, hit, status = _dumps({"error": f"{type(e).__name__}: {e}"}), False, 500
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("X-Cache", "hit" if hit else "miss")
+            self.send_header("X-Elapsed-Ms", f"{(time.perf_counter() - t0) * 1000:.3f}")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            if verbose:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+def serve(output_dir=OUTPUT_DIR, host=HOST, port=PORT, verbose=False):
+    store = EstimateStore(output_dir)
+    server = ThreadingHTTPServer((host, port), make_handler(store, verbose))
+    print(f"OK Servindo {Path(output_dir).resolve()} em http://{host}:{server.server_port}")
+    print("   Rotas: /health /dims /municipio/<codmun> /municipios?uf= /ranking?k=20 /subgroup?value=AAI_total&uf=")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return store
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,129 @@
+"""
+SHAP em blocos sobre toda a população de modelagem.
+
+As linhas são divididas em blocos de CHUNK_ROWS, explicadas por
+shap.TreeExplainer (um por processo) e gravadas à medida que ficam prontas
+num array float32 mapeado em disco. O arquivo é indexado pelo hash do modelo
+e dos dados: blocos já calculados não são refeitos (uma execução interrompida
+continua de onde parou, e re-execuções só de gráficos não recalculam nada).
+A importância (média ponderada de |SHAP|) e suas bandas bootstrap saem da
+mesma matriz gravada.
+"""
+
+import hashlib
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from aai_stats import bootstrap_counts, make_rng
+
+# Linhas por bloco (uma tarefa por bloco)
+CHUNK_ROWS = 2000
+
+_explainer = None
+
+
+def model_fingerprint(model):
+    """Hash do modelo serializado"""
+    return hashlib.sha256(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+
+def data_fingerprint(X):
+    """Hash da matriz de features (tipo, forma e conteúdo)"""
+    digest = hashlib.sha256(f"{X.dtype}|{X.shape}".encode())
+    digest.update(np.ascontiguousarray(X).tobytes())
+    return digest.hexdigest()
+
+
+def positive_class(values):
+    """Valores SHAP da classe positiva (lista por classe, array 3D ou já 2D)"""
+    if isinstance(values, list):
+        values = values[1] if len(values) == 2 else values[-1]
+    values = np.asarray(values)
+    if values.ndim == 3:
+        values = values[:, :, 1]
+    return values
+
+
+def _init_worker(model):
+    global _explainer
+    import shap
+    _explainer = shap.TreeExplainer(model)
+
+
+def _explain(X_chunk):
+    return positive_class(_explainer.shap_values(X_chunk)).astype(np.float32)
+
+
+def shap_matrix(model, X, cache_dir, chunk_rows=CHUNK_ROWS, n_jobs=1):
+    """
+    Valores SHAP (classe positiva) de todas as linhas de X como array float32
+    (n_linhas × n_features) mapeado em disco em cache_dir.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    n, p = X.shape
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    key = f"{model_fingerprint(model)[:16]}_{data_fingerprint(X)[:16]}"
+    values_path = cache_dir / f"shap_{key}.npy"
+    done_path = cache_dir / f"shap_{key}_done.npy"
+
+    n_chunks = -(-n // chunk_rows)
+    if values_path.exists() and done_path.exists():
+        values = np.load(values_path, mmap_mode="r+")
+        done = np.load(done_path)
+    else:
+        values = np.lib.format.open_memmap(values_path, mode="w+", dtype=np.float32, shape=(n, p))
+        done = np.zeros(n_chunks, dtype=bool)
+
+    todo = [i for i in range(n_chunks) if not done[i]]
+    if todo:
+        chunks = (X[i * chunk_rows:(i + 1) * chunk_rows] for i in todo)
+        if n_jobs == 1:
+            _init_worker(model)
+            results, pool = map(_explain, chunks), None
+        else:
+            pool = ProcessPoolExecutor(max_workers=None if n_jobs == -1 else n_jobs, mp_context=get_context("spawn"),
+                                       initializer=_init_worker, initargs=(model,))
+            results = pool.map(_explain, chunks)
+        try:
+            for i, block in zip(todo, results):
+                values[i * chunk_rows:i * chunk_rows + len(block)] = block
+                values.flush()
+                done[i] = True
+                np.save(done_path, done)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    del values
+    return np.load(values_path, mmap_mode="r")
+
+
+def weighted_shap_importance(shap_values, w, features, n_boot=500, ci=95, seed=None):
+    """
+    Importância = média ponderada de |SHAP| por feature, com IC percentil
+    bootstrap (linhas reamostradas, todas as features na mesma réplica).
+    """
+    abs_values = np.abs(np.asarray(shap_values, dtype=np.float64))
+    w = np.asarray(w, dtype=np.float64)
+    point = w @ abs_values / w.sum()
+
+    terms = np.column_stack([abs_values * w[:, None], w])
+    estimates = []
+    for counts in bootstrap_counts(len(w), n_boot, make_rng(seed, "shap_importance")):
+        totals = counts @ terms
+        estimates.append(totals[:, :-1] / totals[:, -1:])
+    alpha = (100 - ci) / 2
+    lower, upper = np.percentile(np.vstack(estimates), [alpha, 100 - alpha], axis=0)
+
+    return pd.DataFrame({
+        "Feature": list(features),
+        "SHAP_Importance": point,
+        "SHAP_lower": lower,
+        "SHAP_upper": upper,
+    }).sort_values("SHAP_Importance", ascending=False).reset_index(drop=True)
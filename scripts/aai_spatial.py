@@ -0,0 +1,213 @@
+"""
+Vizinhança municipal em cache e Moran global/local com permutações em lote.
+
+A contiguidade (queen ou rook) é calculada uma única vez por shapefile a
+partir da geometria e guardada como matriz CSR esparsa (mais os códigos de
+município de 6 dígitos) indexada pelo hash do shapefile; a geometria vai
+para um GeoParquet ao lado. Cada execução só recorta as linhas/colunas dos
+municípios confiáveis. As permutações de Moran's I e do LISA são avaliadas
+em blocos: um bloco de rotulações aleatórias vira uma matriz densa
+(municípios × permutações) e as defasagens espaciais saem de um único
+produto esparso-denso. Os blocos rodam em processos, cada um com seu
+próprio fluxo RNG (o resultado não depende de n_jobs).
+"""
+
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from aai_pipeline import hash_file
+from aai_stats import make_rng
+
+KINDS = ("queen", "rook")
+SIDECARS = (".shp", ".shx", ".dbf", ".prj")
+
+# Permutações por bloco (uma tarefa por bloco)
+PERM_BATCH = 256
+
+
+def shapefile_fingerprint(path):
+    """Hash do shapefile e dos arquivos auxiliares (.shx, .dbf, .prj)"""
+    digest = hashlib.sha256()
+    for suffix in SIDECARS:
+        part = Path(path).with_suffix(suffix)
+        if part.exists():
+            digest.update(f"{suffix}:{hash_file(part)}".encode())
+    return digest.hexdigest()
+
+
+class Contiguity:
+    """Matriz binária de vizinhança (CSR) com os códigos de município em ordem"""
+
+    def __init__(self, ids, matrix):
+        self.ids = np.asarray(ids)
+        self.matrix = sparse.csr_matrix(matrix)
+        self.matrix.sort_indices()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_geodataframe(cls, gdf, id_col, kind="queen"):
+        """Contiguidade a partir da geometria (etapa cara, feita uma vez por shapefile)"""
+        if kind not in KINDS:
+            raise ValueError(f"kind deve ser um de {KINDS}: {kind!r}")
+        import libpysal
+        builder = libpysal.weights.Queen if kind == "queen" else libpysal.weights.Rook
+        w = builder.from_dataframe(gdf, use_index=False, silence_warnings=True)
+        return cls(gdf[id_col].to_numpy(), w.sparse)
+
+    def save(self, path):
+        np.savez(path, ids=self.ids, indptr=self.matrix.indptr, indices=self.matrix.indices,
+                 data=self.matrix.data, shape=self.matrix.shape)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            matrix = sparse.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"]))
+            return cls(f["ids"], matrix)
+
+    def weights(self, ids, transform="r"):
+        """
+        Submatriz dos municípios `ids` (na ordem dada); transform='r' padroniza
+        as linhas (municípios sem vizinhos ficam com linha zero).
+        """
+        order = np.argsort(self.ids, kind="stable")
+        pos = np.searchsorted(self.ids, ids, sorter=order)
+        pos = order[np.minimum(pos, len(order) - 1)]
+        if not np.array_equal(self.ids[pos], np.asarray(ids)):
+            raise KeyError("Há municípios fora da matriz de vizinhança")
+        W = self.matrix[pos][:, pos].astype(np.float64)
+        if transform == "r":
+            row_sums = np.asarray(W.sum(axis=1)).ravel()
+            W = sparse.diags(np.divide(1.0, row_sums, out=np.zeros_like(row_sums), where=row_sums > 0)) @ W
+        W = sparse.csr_matrix(W)
+        W.sort_indices()
+        return W
+
+
+def load_municipalities(shapefile, cache_dir, kind="queen", id_col="CD_MUN", id_digits=6):
+    """
+    (GeoDataFrame, Contiguity) do shapefile municipal. Na primeira execução lê
+    o shapefile, trunca id_col para id_digits dígitos (código da PNS) e grava
+    GeoParquet + CSR em cache_dir; depois só lê o cache.
+    """
+    import geopandas as gpd
+
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    key = shapefile_fingerprint(shapefile)[:16]
+    geo_path = cache_dir / f"municipios_{key}.parquet"
+    graph_path = cache_dir / f"contiguity_{kind}_{key}.npz"
+
+    if geo_path.exists():
+        gdf = gpd.read_parquet(geo_path)
+    else:
+        gdf = gpd.read_file(shapefile)
+        gdf[id_col] = gdf[id_col].astype(str).str[:id_digits].astype(int)
+        gdf.to_parquet(geo_path)
+
+    if graph_path.exists():
+        graph = Contiguity.load(graph_path)
+    else:
+        graph = Contiguity.from_geodataframe(gdf, id_col, kind)
+        graph.save(graph_path)
+    return gdf, graph
+
+
+# ==========================================
+# PERMUTAÇÕES EM LOTE
+# ==========================================
+
+def _p_sim(larger, permutations):
+    """Pseudo p-valor unicaudal no sentido do valor observado (como no esda)"""
+    larger = np.where(permutations - larger < larger, permutations - larger, larger)
+    return (larger + 1.0) / (permutations + 1.0)
+
+
+def _permutations(rng, n, size):
+    """Bloco de `size` permutações de 0..n-1 -> (n, size)"""
+    return rng.permuted(np.tile(np.arange(n), (size, 1)), axis=1).T
+
+
+def _global_batch(z, W, size, seed_keys):
+    perm = _permutations(make_rng(*seed_keys), len(z), size)
+    Z = z[perm]
+    return (Z * (W @ Z)).sum(axis=0)
+
+
+def _local_batch(z, W, size, seed_keys):
+    """
+    Defasagens sob permutação condicional (z_i fixo em i): rotulação aleatória
+    de todos os valores e, quando o próprio z_i cai num vizinho p de i, troca
+    com o valor que caiu em i. Cada coluna é uma permutação uniforme dos demais.
+    """
+    n = len(z)
+    perm = _permutations(make_rng(*seed_keys), n, size)
+    Z = z[perm]
+    lag = W @ Z
+
+    inverse = np.empty_like(perm)
+    inverse[perm, np.arange(size)] = np.arange(n)[:, None]
+    rows = np.repeat(np.arange(n), np.diff(W.indptr))
+    keys = rows.astype(np.int64) * n + W.indices
+    query = np.arange(n, dtype=np.int64)[:, None] * n + inverse
+    hit = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    w_ip = np.where(keys[hit] == query, W.data[hit], 0.0) if len(keys) else np.zeros(query.shape)
+    lag += w_ip * (Z - z[:, None])
+    return z[:, None] * lag
+
+
+def _run_batches(func, z, W, permutations, seed, key, n_jobs):
+    tasks = [(z, W, min(PERM_BATCH, permutations - start), (seed, key, block))
+             for block, start in enumerate(range(0, permutations, PERM_BATCH))]
+    if n_jobs == 1 or len(tasks) <= 1:
+        results = [func(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=None if n_jobs == -1 else n_jobs, mp_context=get_context("spawn")) as pool:
+            results = list(pool.map(func, *zip(*tasks)))
+    return np.concatenate(results, axis=-1)
+
+
+def moran(y, W, permutations=999, seed=None, n_jobs=1):
+    """
+    Moran's I global com inferência por permutação. W: CSR (normalmente
+    padronizada por linha). Retorna dict com I, EI, p_sim, z_sim e n.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    z = y - y.mean()
+    scale = n / W.sum() / (z @ z)
+    I = scale * (z @ (W @ z))
+    sims = scale * _run_batches(_global_batch, z, W, permutations, seed, "moran", n_jobs)
+    larger = (sims >= I).sum()
+    return {
+        "I": float(I),
+        "EI": -1.0 / (n - 1),
+        "p_sim": float(_p_sim(larger, permutations)),
+        "z_sim": float((I - sims.mean()) / sims.std()),
+        "n": n,
+    }
+
+
+def moran_local(y, W, permutations=9999, seed=None, n_jobs=1):
+    """
+    LISA (Moran local) com permutação condicional. Retorna DataFrame com
+    I, lag, q (1 HH, 2 LH, 3 LL, 4 HL) e p_sim por unidade, na ordem de y.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    z = (y - y.mean()) / y.std()
+    scale = (n - 1) / (z @ z)
+    lag = W @ z
+    Is = scale * z * lag
+    sims = scale * _run_batches(_local_batch, z, W, permutations, seed, "moran_local", n_jobs)
+    larger = (sims >= Is[:, None]).sum(axis=1)
+    q = np.select([(z > 0) & (lag > 0), (z < 0) & (lag > 0), (z < 0) & (lag < 0)], [1, 2, 3], default=4)
+    return pd.DataFrame({"I": Is, "lag": lag, "q": q, "p_sim": _p_sim(larger, permutations)})
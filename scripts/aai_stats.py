@@ -0,0 +1,307 @@
+"""
+Estimadores ponderados do AAI com bootstrap vetorizado.
+
+Em vez de um laço Python por réplica (np.random.choice + iloc), todas as
+réplicas de um bloco são sorteadas de uma vez como matriz de contagens
+(réplicas × observações) e cada estimativa sai de um produto matriz-vetor.
+"""
+
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+# Réplicas por bloco: limita a matriz de contagens a BOOT_BATCH × n floats
+BOOT_BATCH = 64
+
+# Grupos (municípios) por bloco no bootstrap agrupado; cada bloco tem seu
+# próprio fluxo RNG, então o resultado não depende de n_jobs
+GROUP_BLOCK = 256
+
+STATISTICS = ("mean", "proportion", "ratio")
+
+
+def make_rng(seed, *keys):
+    """
+    Gerador independente e reprodutível por chamada: o mesmo (seed, chaves)
+    sempre produz o mesmo fluxo, e chaves diferentes produzem fluxos distintos.
+    """
+    entropy = [seed if seed is not None else 0]
+    entropy += [zlib.crc32(str(k).encode("utf-8")) for k in keys]
+    return np.random.default_rng(np.random.SeedSequence(entropy))
+
+
+def bootstrap_counts(n, n_boot, rng, batch_size=BOOT_BATCH):
+    """
+    Sorteia as réplicas em blocos como matriz de contagens (quantas vezes cada
+    observação entra na réplica), equivalente a reamostrar n com reposição.
+    """
+    for start in range(0, n_boot, batch_size):
+        size = min(batch_size, n_boot - start)
+        idx = rng.integers(0, n, size=(size, n))
+        idx += (np.arange(size) * n)[:, None]
+        yield np.bincount(idx.ravel(), minlength=size * n).reshape(size, n).astype(np.float64)
+
+
+def replicate_estimates(y, w, x=None, statistic="mean", n_boot=500, rng=None, batch_size=BOOT_BATCH):
+    """
+    Estimativas bootstrap de Σw·y / Σw (mean/proportion) ou Σw·y / Σw·x (ratio)
+    para n_boot réplicas. Entradas já sem missing.
+    """
+    if statistic not in STATISTICS:
+        raise ValueError(f"statistic deve ser um de {STATISTICS}: {statistic!r}")
+    if statistic == "ratio" and x is None:
+        raise ValueError("statistic='ratio' requer x (denominador)")
+
+    y = np.asarray(y, dtype=np.float64)
+    w = np.asarray(w, dtype=np.float64)
+    rng = rng if rng is not None else np.random.default_rng()
+
+    # Colunas: [Σw·y, denominador]; uma multiplicação por bloco de réplicas
+    terms = np.column_stack([
+        w * y,
+        w * np.asarray(x, dtype=np.float64) if statistic == "ratio" else w,
+    ])
+
+    estimates = np.empty(n_boot)
+    start = 0
+    for counts in bootstrap_counts(len(y), n_boot, rng, batch_size):
+        totals = counts @ terms
+        estimates[start:start + len(counts)] = totals[:, 0] / totals[:, 1]
+        start += len(counts)
+    return estimates
+
+
+def weighted_bootstrap_ci(y, w, x=None, statistic="mean", n_boot=500, ci=95, rng=None,
+                          batch_size=BOOT_BATCH):
+    """Estimativa pontual ponderada e IC percentil bootstrap -> (estimativa, inferior, superior)"""
+    y = np.asarray(y, dtype=np.float64)
+    w = np.asarray(w, dtype=np.float64)
+    if statistic == "ratio":
+        point = (w * y).sum() / (w * np.asarray(x, dtype=np.float64)).sum()
+    else:
+        point = (w * y).sum() / w.sum()
+
+    estimates = replicate_estimates(y, w, x, statistic, n_boot, rng, batch_size)
+    alpha = (100 - ci) / 2
+    lower, upper = np.percentile(estimates, [alpha, 100 - alpha])
+    return point, lower, upper
+
+
+# ==========================================
+# BOOTSTRAP AGRUPADO (MUNICÍPIOS)
+# ==========================================
+
+def _group_index(codes):
+    """Grupos distintos, posição de cada linha no grupo e ordem estável por grupo"""
+    groups, inverse = np.unique(np.asarray(codes), return_inverse=True)
+    return groups, inverse.ravel(), np.argsort(inverse, kind="stable")
+
+
+def grouped_weighted_mean(inverse, n_groups, values, w):
+    """Média ponderada por grupo, ignorando missing (NaN se o grupo não tem dados)"""
+    values = np.asarray(values, dtype=np.float64)
+    w = np.asarray(w, dtype=np.float64)
+    valid = ~(np.isnan(values) | np.isnan(w))
+    num = np.bincount(inverse, weights=np.where(valid, w * values, 0.0), minlength=n_groups)
+    den = np.bincount(inverse, weights=np.where(valid, w, 0.0), minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, num / den, np.nan)
+
+
+def _bootstrap_segments(y, w, sizes, n_boot, ci, seed_keys, batch_size=BOOT_BATCH):
+    """
+    Bootstrap dentro de cada grupo para um bloco de grupos contíguos (y, w já
+    ordenados por grupo). Cada réplica reamostra n_g linhas do próprio grupo;
+    as somas por grupo saem de uma redução por segmentos (np.add.reduceat).
+    """
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    row_start = np.repeat(starts, sizes)
+    row_size = np.repeat(sizes, sizes)
+    wy = w * y
+    rng = make_rng(*seed_keys)
+
+    estimates = np.empty((len(sizes), n_boot))
+    for b0 in range(0, n_boot, batch_size):
+        b = min(batch_size, n_boot - b0)
+        idx = row_start + (rng.random((b, len(y))) * row_size).astype(np.int64)
+        num = np.add.reduceat(wy[idx], starts, axis=1)
+        den = np.add.reduceat(w[idx], starts, axis=1)
+        estimates[:, b0:b0 + b] = (num / den).T
+
+    alpha = (100 - ci) / 2
+    lower, upper = np.percentile(estimates, [alpha, 100 - alpha], axis=1)
+    return lower, upper
+
+
+def grouped_bootstrap_ci(codes, y, w, n_boot=500, ci=95, seed=None, key=None, min_n=10,
+                         n_jobs=1, block_groups=GROUP_BLOCK):
+    """
+    Média ponderada e IC bootstrap percentil para todos os grupos numa só
+    passada. Linhas com y ou w ausente são descartadas; grupos com menos de
+    min_n linhas válidas recebem IC NaN (como no bootstrap por grupo).
+    Retorna (grupos, n_validos, estimativa, inferior, superior).
+    """
+    y = np.asarray(y, dtype=np.float64)
+    w = np.asarray(w, dtype=np.float64)
+    valid = ~(np.isnan(y) | np.isnan(w))
+    codes, y, w = np.asarray(codes)[valid], y[valid], w[valid]
+
+    groups, inverse, order = _group_index(codes)
+    sizes = np.bincount(inverse, minlength=len(groups))
+    point = grouped_weighted_mean(inverse, len(groups), y, w)
+    lower = np.full(len(groups), np.nan)
+    upper = np.full(len(groups), np.nan)
+
+    # Só os grupos com n suficiente entram no bootstrap
+    eligible = np.flatnonzero(sizes >= min_n)
+    keep = np.isin(inverse[order], eligible)
+    y_sorted, w_sorted = y[order][keep], w[order][keep]
+    offsets = np.concatenate([[0], np.cumsum(sizes[eligible])])
+
+    tasks = []
+    for block, g0 in enumerate(range(0, len(eligible), block_groups)):
+        g1 = min(g0 + block_groups, len(eligible))
+        rows = slice(offsets[g0], offsets[g1])
+        tasks.append((eligible[g0:g1], (y_sorted[rows], w_sorted[rows], sizes[eligible[g0:g1]],
+                                        n_boot, ci, (seed, key, block))))
+
+    if n_jobs == 1 or len(tasks) <= 1:
+        results = [_bootstrap_segments(*args) for _, args in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=None if n_jobs == -1 else n_jobs, mp_context=get_context("spawn")) as pool:
+            results = list(pool.map(_bootstrap_segments, *zip(*[args for _, args in tasks])))
+
+    for (group_ids, _), (lo, hi) in zip(tasks, results):
+        lower[group_ids] = lo
+        upper[group_ids] = hi
+    return groups, sizes, point, lower, upper
+
+
+def aggregate_by_group(data, group_col, weight_col, value_col="AAI_total", domains=(),
+                       n_boot=500, ci=95, seed=None, min_n_reliable=30, n_jobs=1):
+    """
+    Agregação municipal vetorizada: mesmas colunas de aggregate_municipal_robust
+    (n_obs, pop_weight_sum, <value>, AAI_ci_lower/upper/width, domínios, reliable).
+    """
+    groups, inverse, _ = _group_index(data[group_col].to_numpy())
+    w = data[weight_col].to_numpy(dtype=np.float64)
+
+    result = pd.DataFrame({group_col: groups})
+    result["n_obs"] = np.bincount(inverse, minlength=len(groups))
+    result["pop_weight_sum"] = np.bincount(inverse, weights=np.nan_to_num(w), minlength=len(groups))
+
+    if value_col in data.columns:
+        boot_groups, _, point, lower, upper = grouped_bootstrap_ci(
+            data[group_col].to_numpy(), data[value_col].to_numpy(dtype=np.float64), w,
+            n_boot=n_boot, ci=ci, seed=seed, key=value_col, n_jobs=n_jobs
+        )
+        pos = np.searchsorted(groups, boot_groups)
+        for name, values in [(value_col, point), ("AAI_ci_lower", lower), ("AAI_ci_upper", upper)]:
+            column = np.full(len(groups), np.nan)
+            column[pos] = values
+            result[name] = column
+        result["AAI_ci_width"] = result["AAI_ci_upper"] - result["AAI_ci_lower"]
+
+    for domain in domains:
+        if domain in data.columns:
+            result[domain] = grouped_weighted_mean(inverse, len(groups), data[domain].to_numpy(dtype=np.float64), w)
+
+    result["reliable"] = result["n_obs"] >= min_n_reliable
+    return result
+
+
+# ==========================================
+# QUANTIS PONDERADOS
+# ==========================================
+
+QUANTILE_METHODS = ("linear", "inverted_cdf")
+
+
+def _quantile_positions(cum, w, total, method):
+    """Posição de cada observação ordenada na escala [0, 1] da distribuição ponderada"""
+    if method == "linear":
+        # Ponto médio do peso de cada observação (interpolação entre vizinhos)
+        return (cum - 0.5 * w) / total
+    return cum / total
+
+
+def weighted_quantiles(values, w, q, method="linear"):
+    """
+    Quantis ponderados para um vetor de níveis q a partir de uma única
+    ordenação. method="linear" interpola entre os pontos médios dos pesos;
+    "inverted_cdf" devolve o primeiro valor com peso acumulado >= q (versão antiga).
+    """
+    if method not in QUANTILE_METHODS:
+        raise ValueError(f"method deve ser um de {QUANTILE_METHODS}: {method!r}")
+    values = np.asarray(values, dtype=np.float64)
+    w = np.asarray(w, dtype=np.float64)
+    q = np.asarray(q, dtype=np.float64)
+    valid = ~(np.isnan(values) | np.isnan(w))
+    values, w = values[valid], w[valid]
+    if len(values) == 0:
+        return np.full(q.shape, np.nan)
+
+    order = np.argsort(values, kind="stable")
+    values, w = values[order], w[order]
+    cum = np.cumsum(w)
+    pos = _quantile_positions(cum, w, cum[-1], method)
+    if method == "linear":
+        return np.interp(q, pos, values)
+    return values[np.minimum(np.searchsorted(pos, q), len(values) - 1)]
+
+
+def grouped_weighted_quantiles(codes, values, w, q, method="linear"):
+    """
+    Quantis ponderados de todos os grupos numa só ordenação (grupo, valor).
+    As posições acumuladas de cada grupo são deslocadas pelo índice do grupo
+    (g + p), então uma única busca ordenada responde todos os grupos e níveis.
+    Retorna (grupos, matriz n_grupos × len(q)).
+    """
+    if method not in QUANTILE_METHODS:
+        raise ValueError(f"method deve ser um de {QUANTILE_METHODS}: {method!r}")
+    values = np.asarray(values, dtype=np.float64)
+    w = np.asarray(w, dtype=np.float64)
+    q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+    codes = np.asarray(codes)
+    valid = ~(np.isnan(values) | np.isnan(w))
+
+    groups, inverse = np.unique(codes, return_inverse=True)
+    inverse = inverse.ravel()
+    result = np.full((len(groups), len(q)), np.nan)
+    if not valid.any():
+        return groups, result
+
+    # Só os grupos com algum valor válido entram na busca; os demais ficam NaN
+    present, g = np.unique(inverse[valid], return_inverse=True)
+    g, values, w = g.ravel(), values[valid], w[valid]
+    order = np.lexsort((values, g))
+    g, values, w = g[order], values[order], w[order]
+
+    n_present = len(present)
+    sizes = np.bincount(g, minlength=n_present)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    totals = np.bincount(g, weights=w, minlength=n_present)
+    cum = np.cumsum(w)
+    cum -= np.repeat(cum[starts] - w[starts], sizes)
+    key = g + _quantile_positions(cum, w, totals[g], method)
+
+    gi = np.repeat(np.arange(n_present), len(q))
+    qi = np.tile(np.arange(len(q)), n_present)
+    target = gi + q[qi]
+
+    first, last = starts[gi], starts[gi] + sizes[gi] - 1
+    hi = np.clip(np.searchsorted(key, target, side="left"), first, last)
+    if method == "linear":
+        lo = np.clip(hi - 1, first, last)
+        span = key[hi] - key[lo]
+        frac = np.where(span > 0, np.clip((target - key[lo]) / np.where(span > 0, span, 1), 0, 1), 1.0)
+        # Abaixo do primeiro ponto médio do grupo: valor mínimo do grupo
+        frac = np.where(target <= key[first], 0.0, frac)
+        lo = np.where(target <= key[first], first, lo)
+        result[present[gi], qi] = values[lo] + (values[hi] - values[lo]) * frac
+    else:
+        result[present[gi], qi] = values[hi]
+    return groups, result
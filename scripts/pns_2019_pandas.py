@@ -4,14 +4,42 @@
 # a small synthetic example for demonstration.
 
 import os
+import json
 import pandas as pd
 import numpy as np
-import re
+
+from pns_layout import load_layout
+from pns_fwf import open_records, extract_columns, iter_chunks, min_age_predicate
+from pns_index import load_index, INDEX_KEYS
+from pns_dataset import compact_frame, write_dataset
+from aai_scorer import AAIScorer
+from pns_runreport import RunReport
 
 # Caminhos
 RAW_FILE = "../data/raw/PNS_2019.txt"
 SAS_FILE = "../data/raw/input_PNS_2019.sas"
-OUTPUT_CSV = "../data/processed/pns_2019_pandas.csv"
+LABELS_FILE = "../data/processed/pns_mappings.json"
+LAYOUT_CACHE_DIR = "../data/processed"
+OUTPUT_PARQUET = "../data/processed/pns_2019_pandas.parquet"
+SCORER_FILE = "../data/processed/aai_scorer.json"
+REFERENCE_SCORER = None  # ex.: SCORER_FILE de uma execução anterior para pontuar sem reajustar
+
+# Relatório de execução (tempo, memória, linhas e bytes por etapa) em REPORT_DIR;
+# PROFILE_STAGE (ex.: "extract") perfila uma etapa com PROFILER ('cprofile' ou 'sampling')
+REPORT_DIR = "../outputs_aai/run_reports"
+PROFILE_STAGE = None
+PROFILER = "cprofile"
+
+# Leitura em streaming: decodifica C008 primeiro e só extrai as demais colunas
+# das linhas 60+. UF_FILTER (ex.: ["35", "33"]) e UPA_FILTER usam o índice de
+# registros (pns_index_PNS_2019.npz, criado na primeira vez) para ler só as
+# faixas do arquivo dessas UFs/UPAs
+STREAMING = True
+UF_FILTER = None
+UPA_FILTER = None
+
+# Processos para decodificar os blocos em paralelo (1 = sequencial, -1 = todos os núcleos)
+N_WORKERS = 1
 
 # Colunas desejadas com códigos
 DESIRED_COLUMNS = {
@@ -21,10 +49,9 @@ DESIRED_COLUMNS = {
     "V0024": "estrato",
     "V0015": "id_domicilio",
     "V0028": "id_individuo",
-    "V0029": "area_urbana",
+    "V0026": "area_urbana",
     "V0029A": "cod_mun_ibge",
     "V0031": "area_metropolitana",
-    "V00293": "regiao",
     "C006": "sexo",
     "C008": "idade",
     "C009": "raca_cor",
@@ -32,7 +59,7 @@ DESIRED_COLUMNS = {
     "E01602": "renda_percapita",
     "C011": "situacao_ocupacional",
     "C004": "mora_sozinho",
-    "V0026": "num_pessoas_domicilio",
+    "V0022": "num_pessoas_domicilio",
     "P00102": "autoavaliacao_saude",
     "Q00201": "hipertensao",
     "Q03001": "diabetes",
@@ -60,123 +87,86 @@ DESIRED_COLUMNS = {
     "K05401": "queda_12m",
     "J026": "atendimento_sus",
     "P00103": "peso_real",
-    "P00402": "altura",
+    "P00403": "altura",
 }
 
-def parse_sas_positions(sas_file):
-    """Parse SAS file to get positions"""
-    positions = {}
-    pattern = re.compile(r'@(\d{5})\s*(\w+)\s*(\$?\d+(?:\.\d*)?)')
-    with open(sas_file, 'r', encoding='latin-1') as f:
-        for line in f:
-            match = pattern.search(line)
-            if match:
-                pos = int(match.group(1)) - 1  # 0-based
-                code = match.group(2)
-                length_str = match.group(3).replace('$', '').split('.')[0]
-                length = int(length_str)
-                positions[code] = (pos, length)
-    return positions
-
-def load_and_extract(raw_file, positions, desired_columns):
-    """Load raw file and extract columns"""
+def load_and_extract(raw_file, positions, desired_columns, numeric_cols=()):
+    """Load raw file (memory-mapped) and extract columns; numeric ones parsed from bytes"""
     print("OK Carregando arquivo raw...")
-    with open(raw_file, 'r', encoding='latin-1') as f:
-        lines = f.readlines()
-    
-    data = {}
-    for code, (pos, length) in positions.items():
-        if code in desired_columns:
-            col_name = desired_columns[code]
-            data[col_name] = [line[pos:pos+length].strip() for line in lines]
-    
+    records = open_records(raw_file)
+    data = extract_columns(records, positions, desired_columns, numeric_cols)
     df = pd.DataFrame(data)
     print(f"OK Extraido: {df.shape}")
     return df
 
+# Módulos inteiros do questionário a extrair além de DESIRED_COLUMNS (ex.: ["K", "Q"]);
+# as colunas mantêm o código PNS como nome
+EXTRA_MODULES = []
+
 # Executar
-positions = parse_sas_positions(SAS_FILE)
-# Corrigir lengths erradas
-positions["P00402"] = (602, 3)  # altura: 3 dígitos
-positions["V0029"] = (1381, 1)  # area_urbana: 1 dígito
-positions["V00293"] = (1503, 1)  # regiao: 1 dígito
+report = RunReport("etl_pandas", REPORT_DIR, profile_stage=PROFILE_STAGE, profiler=PROFILER, config={
+    "RAW_FILE": RAW_FILE, "STREAMING": STREAMING, "UF_FILTER": UF_FILTER, "UPA_FILTER": UPA_FILTER,
+    "N_WORKERS": N_WORKERS, "EXTRA_MODULES": EXTRA_MODULES, "REFERENCE_SCORER": REFERENCE_SCORER,
+})
+report.start("layout")
+layout = load_layout(SAS_FILE, cache_dir=LAYOUT_CACHE_DIR, labels_file=LABELS_FILE)
+extra_codes = [code for code in layout.module(*EXTRA_MODULES) if code not in DESIRED_COLUMNS]
+DESIRED_COLUMNS.update({code: code for code in extra_codes})
+positions = layout.positions(DESIRED_COLUMNS)
+print(f"OK Layout: {len(layout)} variáveis (LRECL={layout.record_length})")
 print("Posições encontradas para desejadas:")
 for code in DESIRED_COLUMNS:
     if code in positions:
         print(f"{code}: pos={positions[code][0]}, len={positions[code][1]}")
     else:
         print(f"{code}: não encontrado")
-df = load_and_extract(RAW_FILE, positions, DESIRED_COLUMNS)
+# Colunas numéricas: convertidas direto dos bytes na extração
+numeric_cols = ["peso_amostral", "idade", "anos_estudo", "renda_percapita", "num_medicamentos", "peso_real", "altura", "autoavaliacao_saude",
+                "num_pessoas_domicilio", "internacoes_12m"]
+numeric_cols += layout.numeric_codes(extra_codes)
+report.stop(rows_out=len(positions), read=[SAS_FILE])
+
+report.start("extract")
+if STREAMING:
+    predicate = min_age_predicate(60)
+    ranges = None
+    if UF_FILTER or UPA_FILTER:
+        index = load_index(RAW_FILE, layout.positions(INDEX_KEYS.values()), cache_dir=LAYOUT_CACHE_DIR)
+        ranges = index.ranges(ufs=UF_FILTER, upas=UPA_FILTER)
+        print(f"OK Índice: {index.count(ranges):,} de {index.n_records:,} registros em {len(ranges)} faixa(s)")
+    print(f"OK Carregando arquivo raw em blocos (filtro 60+ antecipado, {N_WORKERS} processo(s))...")
+    df = pd.concat(iter_chunks(RAW_FILE, positions, DESIRED_COLUMNS, numeric_cols, predicate,
+                               n_workers=N_WORKERS, ranges=ranges), ignore_index=True)
+    print(f"OK Extraido: {df.shape}")
+else:
+    df = load_and_extract(RAW_FILE, positions, DESIRED_COLUMNS, numeric_cols)
+report.stop(rows_out=len(df), read=[RAW_FILE])
 
-# Converter tipos
-numeric_cols = ["peso_amostral", "idade", "anos_estudo", "renda_percapita", "num_medicamentos", "peso_real", "altura", "autoavaliacao_saude"]
-for col in numeric_cols:
-    if col in df.columns:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
+# Região: 1º dígito do código IBGE da UF (1=Norte ... 5=Centro-Oeste)
+df["regiao"] = df["uf"].str[:1]
+
+# Município: 6 primeiros dígitos da UPA (mesma regra usada no notebook)
+df["codmun"] = df["upa"].str[:6].astype(int)
 
 # Filtro 60+
+report.start("filter_60plus", rows_in=len(df))
 df = df[df["idade"] >= 60].copy()
-
-# Calcular IMC
-if "peso_real" in df.columns and "altura" in df.columns:
-    df["altura"] = df["altura"] / 100  # assumir cm
-    df["imc"] = df["peso_real"] / (df["altura"] ** 2)
-    df["imc"] = df["imc"].fillna(df["imc"].median())
-
-# Coerce binary
-binary_cols = ["possui_plano_saude", "consulta_12m", "atendimento_sus", "usa_internet", "usa_celular", "depressao_diag", "vacina_influenza", "atividade_fisica", "fumante_atual", "hipertensao", "diabetes", "doenca_cardiaca", "avc", "doenca_respiratoria", "cancer"]
-for col in binary_cols:
-    if col in df.columns:
-        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(int)
-
-# Derived vars
-chronic_cols = ["hipertensao", "diabetes", "doenca_cardiaca", "avc", "doenca_respiratoria", "cancer", "depressao_diag"]
-if all(c in df.columns for c in chronic_cols):
-    df["multimorbidity_count"] = df[chronic_cols].sum(axis=1)
-    df["multimorb_cat"] = pd.cut(df["multimorbidity_count"], bins=[-1,0,1,2,100], labels=["0","1","2","3+"])
-
-adl_cols = ["dificuldade_vestir", "dificuldade_banho", "dificuldade_alimentar"]
-iadl_cols = ["dificuldade_compras", "dificuldade_medico"]
-# Convert to numeric for summing
-for col in adl_cols + iadl_cols:
-    if col in df.columns:
-        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(int)
-
-if all(c in df.columns for c in adl_cols):
-    df["adl_score"] = df[adl_cols].sum(axis=1)
-if all(c in df.columns for c in iadl_cols):
-    df["iadl_score"] = df[iadl_cols].sum(axis=1)
-
-if "adl_score" in df.columns or "iadl_score" in df.columns:
-    df["functional_raw"] = 0
-    if "adl_score" in df.columns:
-        df["functional_raw"] += df["adl_score"]
-    if "iadl_score" in df.columns:
-        df["functional_raw"] += df["iadl_score"]
-    max_raw = df["functional_raw"].max() or 1
-    df["functional_score"] = 1 - (df["functional_raw"] / max_raw)
-
-if "possui_plano_saude" in df.columns and "atendimento_sus" in df.columns:
-    df["dependencia_SUS"] = ((df["possui_plano_saude"] == 2) & (df["atendimento_sus"] == 1)).astype(int)
-
-if "vacina_influenza" in df.columns:
-    df["cobertura_influenza"] = df["vacina_influenza"]
-
-# Health score
-if "autoavaliacao_saude" in df.columns and "multimorbidity_count" in df.columns and "functional_score" in df.columns:
-    df["autoav_z"] = (df["autoavaliacao_saude"].astype(float) - df["autoavaliacao_saude"].mean()) / df["autoavaliacao_saude"].std(ddof=0)
-    df["multimorb_z"] = (df["multimorbidity_count"].astype(float) - df["multimorbidity_count"].mean()) / df["multimorbidity_count"].std(ddof=0)
-    df["functional_z"] = (df["functional_score"].astype(float) - df["functional_score"].mean()) / df["functional_score"].std(ddof=0)
-    df["health_score_raw"] = (-0.5 * df["autoav_z"]) + (-0.7 * df["multimorb_z"]) + (1.2 * df["functional_z"])
-    minv = df["health_score_raw"].min()
-    maxv = df["health_score_raw"].max()
-    df["health_score"] = (df["health_score_raw"] - minv) / (maxv - minv + 1e-9)
-
-# Impute
-impute_cols = ["num_medicamentos", "idade", "anos_estudo", "renda_percapita"]
-for col in impute_cols:
-    if col in df.columns:
-        df[col] = df[col].fillna(df[col].median())
+report.stop(rows_out=len(df))
+
+# Variáveis derivadas e scores (IMC, morbidade, funcionalidade, saúde, imputação
+# e domínios do AAI) com parâmetros congelados: numa execução de referência os
+# parâmetros são ajustados e gravados em SCORER_FILE; com REFERENCE_SCORER os
+# registros (ex.: nova onda) são pontuados com os parâmetros já gravados
+report.start("derive", rows_in=len(df))
+if REFERENCE_SCORER:
+    scorer = AAIScorer.load(REFERENCE_SCORER)
+    print(f"OK Pontuador de referência: {REFERENCE_SCORER}")
+else:
+    scorer = AAIScorer().fit(df)
+    scorer.save(SCORER_FILE)
+    print(f"OK Parâmetros do pontuador salvos em {SCORER_FILE}")
+df = scorer.transform(df)
+report.stop(rows_out=len(df))
 
 # Mapeamentos categóricos
 MAPPINGS = {
@@ -220,13 +210,41 @@ MAPPINGS = {
     # Adicionar mais conforme necessário
 }
 
+def map_categorical(series, mapping):
+    """
+    Converte uma coluna de códigos em Categorical a partir da tabela código→rótulo.
+    Os códigos distintos são normalizados uma única vez (strip, sem zeros à
+    esquerda, vazio = "0"); códigos fora da tabela viram categorias próprias e
+    missing continua missing.
+    """
+    codes, uniques = pd.factorize(series)
+    keys = pd.Index(uniques).astype(str).str.strip().str.lstrip("0").str.replace(r"^$", "0", regex=True)
+    labels = [mapping.get(key, str(raw)) for key, raw in zip(keys, uniques)]
+    observed = set(labels)
+    categories = [v for v in dict.fromkeys(mapping.values()) if v in observed]
+    categories += [v for v in dict.fromkeys(labels) if v not in categories]
+    position = {label: i for i, label in enumerate(categories)}
+    lookup = np.array([position[label] for label in labels] + [-1], dtype=np.int16)
+    return pd.Categorical.from_codes(lookup[codes], categories=categories)
+
 # Aplicar mapeamentos
+report.start("mappings", rows_in=len(df))
 for col, mapping in MAPPINGS.items():
     if col in df.columns:
-        print(f"OK Mapeando {col}: valores unicos antes: {df[col].unique()[:5]}")
-        df[col] = df[col].astype(str).str.strip().str.lstrip('0').replace('', '0').map(mapping).fillna(df[col])  # Converte para string, remove zeros à esquerda e map
-        print(f"Valores unicos depois: {df[col].unique()[:5]}")
-
-# Salvar CSV
-df.to_csv(OUTPUT_CSV, index=False)
-print(f"OK Arquivo salvo em {OUTPUT_CSV}")
+        df[col] = map_categorical(df[col], mapping)
+        print(f"OK Mapeando {col}: {len(df[col].cat.categories)} categorias")
+
+# Tipos compactos no restante: contagens lidas como número viram inteiros pequenos,
+# scores float32 depois de calculados em float64 (peso e renda mantêm float64)
+INTEGER_COLS = ["idade", "anos_estudo", "num_medicamentos", "num_pessoas_domicilio", "internacoes_12m"]
+df = compact_frame(df, integer=INTEGER_COLS, keep_float64=["peso_amostral", "renda_percapita"])
+report.stop(rows_out=len(df))
+
+# Salvar Parquet com os mapeamentos e o dicionário de rótulos embutidos
+report.start("export", rows_in=len(df))
+with open(LABELS_FILE, "r", encoding="utf-8") as f:
+    labels = json.load(f)
+write_dataset(df, OUTPUT_PARQUET, metadata={"mappings": MAPPINGS, "labels": labels})
+print(f"OK Arquivo salvo em {OUTPUT_PARQUET} ({df.memory_usage(deep=True).sum() / 1024**2:.1f} MB em memória)")
+report.stop(rows_out=len(df), wrote=[OUTPUT_PARQUET])
+report.save()
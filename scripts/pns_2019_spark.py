@@ -8,20 +8,37 @@ Mantém a mesma lógica de extração, transformação e derivação de variáve
 
 import os
 import sys
-import re
+import time
 from pathlib import Path
-import pandas as pd
-import numpy as np
+
+from pns_layout import load_layout
+from pns_runreport import RunReport
 
 # ==========================================
 # CONFIGURAÇÕES
 # ==========================================
 
-BASE_PATH = Path("c:/Users/gafeb/Downloads/PNS_2019_20220525")
+# PNS_BASE_PATH sobrepõe o diretório base (ex.: diretório isolado do pns_benchmark)
+BASE_PATH = Path(os.environ.get("PNS_BASE_PATH", "c:/Users/gafeb/Downloads/PNS_2019_20220525"))
 RAW_FILE = BASE_PATH / "data" / "raw" / "PNS_2019.txt"
 SAS_FILE = BASE_PATH / "data" / "raw" / "input_PNS_2019.sas"
+LABELS_FILE = BASE_PATH / "data" / "processed" / "pns_mappings.json"
+LAYOUT_CACHE_DIR = BASE_PATH / "data" / "processed"
 OUTPUT_DIR = BASE_PATH / "pns_2019_processado"
-OUTPUT_CSV = OUTPUT_DIR / "pns_2019_final_completo.csv"
+OUTPUT_PARQUET = OUTPUT_DIR / "pns_2019_final_completo.parquet"
+
+# Precisão do percentile_approx (medianas de imputação e do resumo)
+MEDIAN_ACCURACY = 10000
+
+# Filtros aplicados na linha bruta, antes da extração das demais colunas
+MIN_AGE = 60
+UF_FILTER = None  # ex.: ["35", "33"] para rodadas regionais
+
+# Relatório de execução por etapa (JSON/CSV); PROFILE_STAGE perfila uma etapa
+# do driver com PROFILER ('cprofile' ou 'sampling')
+REPORT_DIR = BASE_PATH / "outputs_aai" / "run_reports"
+PROFILE_STAGE = None
+PROFILER = "cprofile"
 
 # Criar diretório de saída
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -37,10 +54,9 @@ DESIRED_COLUMNS = {
     "V0024": "estrato",
     "V0015": "id_domicilio",
     "V0028": "id_individuo",
-    "V0029": "area_urbana",
+    "V0026": "area_urbana",
     "V0029A": "cod_mun_ibge",
     "V0031": "area_metropolitana",
-    "V00293": "regiao",
     "C006": "sexo",
     "C008": "idade",
     "C009": "raca_cor",
@@ -48,7 +64,7 @@ DESIRED_COLUMNS = {
     "E01602": "renda_percapita",
     "C011": "situacao_ocupacional",
     "C004": "mora_sozinho",
-    "V0026": "num_pessoas_domicilio",
+    "V0022": "num_pessoas_domicilio",
     "P00102": "autoavaliacao_saude",
     "Q00201": "hipertensao",
     "Q03001": "diabetes",
@@ -76,14 +92,7 @@ DESIRED_COLUMNS = {
     "K05401": "queda_12m",
     "J026": "atendimento_sus",
     "P00103": "peso_real",
-    "P00402": "altura",
-}
-
-# Correções de posições (do código Pandas)
-POSITION_CORRECTIONS = {
-    "P00402": (602, 3),   # altura: 3 dígitos
-    "V0029": (1381, 1),   # area_urbana: 1 dígito
-    "V00293": (1503, 1),  # regiao: 1 dígito
+    "P00403": "altura",
 }
 
 # ==========================================
@@ -139,6 +148,13 @@ print("="*70)
 print("🚀 ETL PNS 2019 - VERSÃO PYSPARK FINAL")
 print("="*70)
 
+# Etapas 2 a 4 só montam o plano (avaliação preguiçosa): o custo da leitura e
+# da extração aparece na etapa 5, cujo count materializa o cache
+report = RunReport("etl_spark", REPORT_DIR, profile_stage=PROFILE_STAGE, profiler=PROFILER, config={
+    "RAW_FILE": str(RAW_FILE), "MIN_AGE": MIN_AGE, "UF_FILTER": UF_FILTER, "MEDIAN_ACCURACY": MEDIAN_ACCURACY,
+})
+report.start("spark_setup")
+
 # Configurar ambiente Windows
 os.environ['HADOOP_HOME'] = ''
 os.environ['hadoop.home.dir'] = ''
@@ -147,7 +163,10 @@ os.environ['PYSPARK_DRIVER_PYTHON'] = sys.executable
 
 # Imports PySpark
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import col, substring, when, lit, trim, regexp_replace, length as spark_length
+from pyspark.sql.functions import (
+    col, substring, when, lit, trim, regexp_replace, create_map, coalesce, mean, stddev_pop,
+    percentile_approx, min as spark_min, max as spark_max, length as spark_length
+)
 from pyspark.sql.types import DoubleType, IntegerType, StringType
 import findspark
 
@@ -162,83 +181,73 @@ spark = SparkSession.builder \
     .config("spark.sql.shuffle.partitions", "32") \
     .config("spark.serializer", "org.apache.spark.serializer.KryoSerializer") \
     .config("spark.sql.adaptive.enabled", "true") \
-    .config("spark.sql.execution.arrow.pyspark.enabled", "false") \
+    .config("spark.sql.execution.arrow.pyspark.enabled", "true") \
     .getOrCreate()
 
 spark.sparkContext.setLogLevel("ERROR")
 print(f"✅ Spark {spark.version} iniciado\n")
+report.stop()
 
 # ==========================================
 # FUNÇÕES AUXILIARES
 # ==========================================
 
-def parse_sas_positions(sas_file):
-    """Parse SAS file para obter posições (0-based)"""
-    positions = {}
-    pattern = re.compile(r'@(\d{5})\s*(\w+)\s*(\$?\d+(?:\.\d*)?)')
-    
-    with open(sas_file, 'r', encoding='latin-1') as f:
-        for line in f:
-            match = pattern.search(line)
-            if match:
-                pos = int(match.group(1)) - 1  # 0-based como no Pandas
-                code = match.group(2)
-                length_str = match.group(3).replace('$', '').split('.')[0]
-                length = int(length_str)
-                positions[code] = (pos, length)
-    
-    # Aplicar correções
-    positions.update(POSITION_CORRECTIONS)
-    
-    return positions
-
-def clean_and_map_column(df, col_name, mapping):
+def clean_code(column):
+    """Trim + remove zeros à esquerda (mantém '0' se for só zeros)"""
+    stripped = regexp_replace(trim(column), "^0+", "")
+    return when(stripped == "", lit("0")).otherwise(stripped)
+
+def clean_and_map_column(col_name, mapping):
     """
-    Limpa coluna (remove zeros à esquerda, trim) e aplica mapeamento.
-    Replica lógica do Pandas: .strip().lstrip('0').replace('', '0')
+    Expressão única de limpeza + mapeamento para a coluna.
+    Replica lógica do Pandas: .strip().lstrip('0').replace('', '0').map(mapping),
+    mantendo o código limpo quando ele não está no mapeamento. A busca é feita
+    num map literal (um nó no plano), não numa cadeia de when() por chave.
     """
-    # Trim
-    df = df.withColumn(col_name, trim(col(col_name)))
-    
-    # Remover zeros à esquerda (mas manter '0' se for só zeros)
-    df = df.withColumn(
-        col_name,
-        when(regexp_replace(col(col_name), "^0+", "") == "", "0")
-        .otherwise(regexp_replace(col(col_name), "^0+", ""))
-    )
-    
-    # Aplicar mapeamento
-    mapping_expr = col(col_name)
-    for key, value in mapping.items():
-        mapping_expr = when(col(col_name) == key, value).otherwise(mapping_expr)
-    
-    df = df.withColumn(col_name, mapping_expr)
-    return df
+    code = clean_code(col(col_name))
+    lookup = create_map(*[lit(item) for pair in mapping.items() for item in pair])
+    return coalesce(lookup[code], code).alias(col_name)
+
+def plan_size(df):
+    """Tamanho (em caracteres) do plano lógico otimizado"""
+    return len(df._jdf.queryExecution().optimizedPlan().toString())
 
 # ==========================================
 # ETAPA 1: PARSE POSIÇÕES
 # ==========================================
 
-print("📖 [1/6] Parseando posições do SAS...")
-positions = parse_sas_positions(SAS_FILE)
+print("📖 [1/6] Carregando layout compilado do SAS...")
+report.start("layout")
+layout = load_layout(SAS_FILE, cache_dir=LAYOUT_CACHE_DIR, labels_file=LABELS_FILE)
+positions = layout.positions()
 
-print(f"✅ {len(positions)} posições encontradas\n")
+print(f"✅ {len(positions)} posições encontradas (LRECL={layout.record_length})\n")
 print("📋 Posições para colunas desejadas:")
 for code in list(DESIRED_COLUMNS.keys())[:10]:
     if code in positions:
         print(f"   {code:15} → pos={positions[code][0]:4}, len={positions[code][1]}")
 print(f"   ... e mais {len(DESIRED_COLUMNS) - 10}")
+report.stop(rows_out=len(positions), read=[SAS_FILE])
 
 # ==========================================
 # ETAPA 2: EXTRAÇÃO COM SPARK
 # ==========================================
 
 print("\n📥 [2/6] Extraindo colunas do arquivo raw...")
+report.start("extract")
 
 # Ler arquivo como texto
 df_raw = spark.read.text(str(RAW_FILE), lineSep="\n")
-n_total = df_raw.count()
-print(f"   ✓ {n_total:,} registros lidos")
+
+# Predicado antecipado: só C008 (e V0001) são lidos antes do filtro, as demais
+# colunas são extraídas apenas das linhas que passam
+age_pos, age_len = positions["C008"]
+raw_age = trim(substring(col("value"), age_pos + 1, age_len))
+df_raw = df_raw.filter(raw_age.rlike("^[0-9]+$") & (raw_age.cast(IntegerType()) >= MIN_AGE))
+if UF_FILTER:
+    uf_pos, uf_len = positions["V0001"]
+    df_raw = df_raw.filter(substring(col("value"), uf_pos + 1, uf_len).isin([str(uf).zfill(2) for uf in UF_FILTER]))
+    print(f"   ✓ Filtro de UF: {', '.join(UF_FILTER)}")
 
 # Extrair apenas colunas desejadas
 extract_expr = []
@@ -253,48 +262,46 @@ for code, col_name in DESIRED_COLUMNS.items():
     else:
         print(f"   ⚠️  {code} não encontrado no SAS")
 
+# Região: 1º dígito do código IBGE da UF (1=Norte ... 5=Centro-Oeste)
+extract_expr.append(substring(col("value"), positions["V0001"][0] + 1, 1).alias("regiao"))
+
 df_extracted = df_raw.select(*extract_expr)
 print(f"   ✓ {len(extract_expr)} colunas extraídas")
+report.stop()
 
 # ==========================================
 # ETAPA 3: CONVERSÃO DE TIPOS
 # ==========================================
 
 print("\n🔢 [3/6] Convertendo tipos de dados...")
+report.start("types")
 
 # Colunas numéricas
 numeric_cols = [
     "peso_amostral", "idade", "anos_estudo", "renda_percapita", 
     "num_medicamentos", "peso_real", "altura", "autoavaliacao_saude",
-    "internacoes_12m"
+    "internacoes_12m", "num_pessoas_domicilio"
 ]
 
-# Converter numéricas
-for col_name in numeric_cols:
-    if col_name in df_extracted.columns:
-        df_extracted = df_extracted.withColumn(
-            col_name,
-            when(
-                trim(col(col_name)).rlike("^[0-9]+$") & (trim(col(col_name)) != ""),
-                col(col_name).cast(DoubleType())
-            ).otherwise(lit(None))
-        )
-
-# Trim em todas as strings
-string_cols = [c for c in df_extracted.columns if c not in numeric_cols]
-for col_name in string_cols:
-    df_extracted = df_extracted.withColumn(col_name, trim(col(col_name)))
+# Uma única projeção: numéricas convertidas, strings com trim
+df_extracted = df_extracted.select(*[
+    when(trim(col(c)).rlike("^[0-9]+$"), trim(col(c)).cast(DoubleType())).alias(c)
+    if c in numeric_cols else trim(col(c)).alias(c)
+    for c in df_extracted.columns
+])
 
 print(f"   ✓ {len(numeric_cols)} colunas numéricas convertidas")
+report.stop()
 
 # ==========================================
 # ETAPA 4: FILTRO 60+ ANOS
 # ==========================================
 
 print("\n🎯 [4/6] Filtrando população 60+ anos...")
-df_filtered = df_extracted.filter(col("idade") >= 60)
-n_60plus = df_filtered.count()
-print(f"   ✓ {n_total:,} → {n_60plus:,} registros ({(n_60plus/n_total)*100:.1f}%)")
+# O filtro já foi aplicado na linha bruta (etapa 2); mantido como salvaguarda
+report.start("filter_60plus")
+df_filtered = df_extracted.filter(col("idade") >= MIN_AGE)
+report.stop()
 
 # ==========================================
 # ETAPA 5: MAPEAMENTOS CATEGÓRICOS
@@ -302,35 +309,64 @@ print(f"   ✓ {n_total:,} → {n_60plus:,} registros ({(n_60plus/n_total)*100:.
 
 print("\n🏷️  [5/6] Aplicando mapeamentos categóricos...")
 
-mapped_count = 0
-for col_name, mapping in MAPPINGS.items():
-    if col_name in df_filtered.columns:
-        print(f"   Mapeando {col_name}...", end="")
-        df_filtered = clean_and_map_column(df_filtered, col_name, mapping)
-        mapped_count += 1
-        print(" ✓")
+report.start("mappings")
+t0 = time.perf_counter()
+plan_before = plan_size(df_filtered)
+
+# Uma única projeção com um lookup por coluna mapeada
+mapped_cols = [c for c in df_filtered.columns if c in MAPPINGS]
+df_filtered = df_filtered.select(*[
+    clean_and_map_column(c, MAPPINGS[c]) if c in MAPPINGS else col(c)
+    for c in df_filtered.columns
+])
+plan_after = plan_size(df_filtered)
+
+# Cache único do recorte 60+ mapeado; o count materializa o cache
+df_filtered = df_filtered.cache()
+n_60plus = df_filtered.count()
+elapsed = time.perf_counter() - t0
 
-print(f"   ✓ {mapped_count} colunas mapeadas")
+print(f"   ✓ {len(mapped_cols)} colunas mapeadas")
+print(f"   ✓ {n_60plus:,} registros 60+ em cache")
+print(f"   ✓ Plano: {plan_before:,} → {plan_after:,} caracteres | tempo: {elapsed:.1f}s")
+report.stop(rows_out=n_60plus, read=[RAW_FILE])
 
 # ==========================================
 # ETAPA 6: VARIÁVEIS DERIVADAS
 # ==========================================
 
 print("\n🧮 [6/6] Criando variáveis derivadas...")
+report.start("derive", rows_in=n_60plus)
 
-# Converter para Pandas para operações complexas
-print("   Convertendo para Pandas...")
-df_pandas = df_filtered.toPandas()
+# Tudo em expressões Spark nativas: nada é coletado no driver além dos
+# escalares das agregações globais (medianas aproximadas, média/DP, min/max)
 
-# 1. IMC
+def to_flag(column):
+    """'Sim' → 1; 'Não'/'Não sabe'/'Ignorado' → 0; outros códigos numéricos mantidos; resto → 0"""
+    return (
+        when(column == "Sim", lit(1))
+        .when(column.isin("Não", "Não sabe", "Ignorado"), lit(0))
+        .otherwise(coalesce(column.cast(DoubleType()).cast(IntegerType()), lit(0)))
+    )
+
+def sum_cols(cols):
+    """Soma linha a linha de uma lista de colunas"""
+    total = lit(0)
+    for c in cols:
+        total = total + col(c)
+    return total
+
+# 1. IMC (bruto; mediana imputada após a agregação global)
 print("   [a] Calculando IMC...")
-if "peso_real" in df_pandas.columns and "altura" in df_pandas.columns:
-    df_pandas["altura_m"] = df_pandas["altura"] / 100  # cm para metros
-    df_pandas["imc"] = df_pandas["peso_real"] / (df_pandas["altura_m"] ** 2)
-    df_pandas["imc"] = df_pandas["imc"].fillna(df_pandas["imc"].median())
-    print(f"      ✓ IMC calculado (média: {df_pandas['imc'].mean():.2f})")
+has_imc = "peso_real" in df_filtered.columns and "altura" in df_filtered.columns
+if has_imc:
+    df_filtered = (
+        df_filtered
+        .withColumn("altura_m", col("altura") / 100)  # cm para metros
+        .withColumn("imc", col("peso_real") / (col("altura_m") * col("altura_m")))
+    )
 
-# 2. Converter binários para 0/1
+# 2. Converter binários para 0/1 e dificuldades para numérico
 print("   [b] Convertendo variáveis binárias...")
 binary_cols = [
     "possui_plano_saude", "consulta_12m", "atendimento_sus", "usa_internet",
@@ -339,112 +375,123 @@ binary_cols = [
     "doenca_respiratoria", "cancer"
 ]
 
-for col_name in binary_cols:
-    if col_name in df_pandas.columns:
-        # Converter 'Sim'/'Não' para 1/0
-        df_pandas[col_name] = df_pandas[col_name].replace({"Sim": 1, "Não": 0, "Não sabe": 0, "Ignorado": 0})
-        df_pandas[col_name] = pd.to_numeric(df_pandas[col_name], errors='coerce').fillna(0).astype(int)
+# Dificuldades: Nenhuma=0, Alguma=1, Muita=2, Não consegue=3
+adl_cols = ["dificuldade_vestir", "dificuldade_banho", "dificuldade_alimentar"]
+iadl_cols = ["dificuldade_compras", "dificuldade_medico"]
+difficulty_mapping = {"Nenhuma": 0, "Alguma": 1, "Muita": 2, "Não consegue": 3, "Ignorado": 0}
+difficulty_lookup = create_map(*[lit(item) for pair in difficulty_mapping.items() for item in pair])
+
+df_filtered = df_filtered.select(*[
+    to_flag(col(c)).alias(c) if c in binary_cols
+    else coalesce(difficulty_lookup[col(c)], col(c).cast(DoubleType()).cast(IntegerType()), lit(0)).alias(c)
+    if c in adl_cols + iadl_cols
+    else col(c)
+    for c in df_filtered.columns
+])
 
 # 3. Multimorbidade
 print("   [c] Calculando multimorbidade...")
 chronic_cols = ["hipertensao", "diabetes", "doenca_cardiaca", "avc", "doenca_respiratoria", "cancer", "depressao_diag"]
-chronic_present = [c for c in chronic_cols if c in df_pandas.columns]
+chronic_present = [c for c in chronic_cols if c in df_filtered.columns]
 
 if chronic_present:
-    df_pandas["multimorbidade_count"] = df_pandas[chronic_present].sum(axis=1)
-    df_pandas["multimorbidade_cat"] = pd.cut(
-        df_pandas["multimorbidade_count"],
-        bins=[-1, 0, 1, 2, 100],
-        labels=["0", "1", "2", "3+"]
-    ).astype(str)
-    print(f"      ✓ Multimorbidade (média: {df_pandas['multimorbidade_count'].mean():.2f})")
+    df_filtered = (
+        df_filtered
+        .withColumn("multimorbidade_count", sum_cols(chronic_present))
+        .withColumn(
+            "multimorbidade_cat",
+            when(col("multimorbidade_count") <= 0, "0")
+            .when(col("multimorbidade_count") == 1, "1")
+            .when(col("multimorbidade_count") == 2, "2")
+            .otherwise("3+")
+        )
+    )
 
 # 4. Escores funcionais (ADL/IADL)
 print("   [d] Calculando escores funcionais...")
-adl_cols = ["dificuldade_vestir", "dificuldade_banho", "dificuldade_alimentar"]
-iadl_cols = ["dificuldade_compras", "dificuldade_medico"]
-
-# Converter dificuldades para numérico (Nenhuma=0, Alguma=1, Muita=2, Não consegue=3)
-difficulty_mapping = {"Nenhuma": 0, "Alguma": 1, "Muita": 2, "Não consegue": 3, "Ignorado": 0}
-
-for col_name in adl_cols + iadl_cols:
-    if col_name in df_pandas.columns:
-        df_pandas[col_name] = df_pandas[col_name].replace(difficulty_mapping)
-        df_pandas[col_name] = pd.to_numeric(df_pandas[col_name], errors='coerce').fillna(0).astype(int)
-
-adl_present = [c for c in adl_cols if c in df_pandas.columns]
-iadl_present = [c for c in iadl_cols if c in df_pandas.columns]
+adl_present = [c for c in adl_cols if c in df_filtered.columns]
+iadl_present = [c for c in iadl_cols if c in df_filtered.columns]
 
 if adl_present:
-    df_pandas["adl_score"] = df_pandas[adl_present].sum(axis=1)
-    print(f"      ✓ ADL Score (média: {df_pandas['adl_score'].mean():.2f})")
-
+    df_filtered = df_filtered.withColumn("adl_score", sum_cols(adl_present))
 if iadl_present:
-    df_pandas["iadl_score"] = df_pandas[iadl_present].sum(axis=1)
-    print(f"      ✓ IADL Score (média: {df_pandas['iadl_score'].mean():.2f})")
-
-# 5. Functional Score normalizado
+    df_filtered = df_filtered.withColumn("iadl_score", sum_cols(iadl_present))
 if adl_present or iadl_present:
-    df_pandas["functional_raw"] = 0
-    if "adl_score" in df_pandas.columns:
-        df_pandas["functional_raw"] += df_pandas["adl_score"]
-    if "iadl_score" in df_pandas.columns:
-        df_pandas["functional_raw"] += df_pandas["iadl_score"]
-    
-    max_raw = df_pandas["functional_raw"].max() if df_pandas["functional_raw"].max() > 0 else 1
-    df_pandas["functional_score"] = 1 - (df_pandas["functional_raw"] / max_raw)
-    print(f"      ✓ Functional Score (média: {df_pandas['functional_score'].mean():.3f})")
+    df_filtered = df_filtered.withColumn(
+        "functional_raw", sum_cols([c for c in ("adl_score", "iadl_score") if c in df_filtered.columns])
+    )
 
 # 6. Dependência SUS
 print("   [e] Calculando dependência SUS...")
-if "possui_plano_saude" in df_pandas.columns and "atendimento_sus" in df_pandas.columns:
-    df_pandas["dependencia_SUS"] = (
-        (df_pandas["possui_plano_saude"] == 0) & (df_pandas["atendimento_sus"] == 1)
-    ).astype(int)
-    print(f"      ✓ Dependência SUS ({df_pandas['dependencia_SUS'].sum():,} pessoas, {df_pandas['dependencia_SUS'].mean()*100:.1f}%)")
+if "possui_plano_saude" in df_filtered.columns and "atendimento_sus" in df_filtered.columns:
+    df_filtered = df_filtered.withColumn(
+        "dependencia_SUS",
+        ((col("possui_plano_saude") == 0) & (col("atendimento_sus") == 1)).cast(IntegerType())
+    )
 
 # 7. Cobertura influenza
-if "vacina_influenza" in df_pandas.columns:
-    df_pandas["cobertura_influenza"] = df_pandas["vacina_influenza"]
+if "vacina_influenza" in df_filtered.columns:
+    df_filtered = df_filtered.withColumn("cobertura_influenza", col("vacina_influenza"))
+
+# 8. Autoavaliação para numérico (entrada do Health Score)
+health_mapping = {"Muito boa": 1, "Boa": 2, "Regular": 3, "Ruim": 4, "Muito ruim": 5}
+has_health = all(c in df_filtered.columns for c in ["autoavaliacao_saude", "multimorbidade_count", "functional_raw"])
+if has_health:
+    health_lookup = create_map(*[lit(item) for pair in health_mapping.items() for item in pair])
+    df_filtered = df_filtered.withColumn(
+        "autoav_numeric",
+        coalesce(health_lookup[col("autoavaliacao_saude")], col("autoavaliacao_saude").cast(DoubleType()))
+    )
+
+# Agregação global única: medianas aproximadas, máximo funcional, média/DP dos z-scores
+impute_cols = [c for c in ["num_medicamentos", "idade", "anos_estudo", "renda_percapita"] if c in df_filtered.columns]
+median_cols = (["imc"] if has_imc else []) + impute_cols
+aggs = [percentile_approx(col(c), 0.5, MEDIAN_ACCURACY).alias(f"median_{c}") for c in median_cols]
+if "functional_raw" in df_filtered.columns:
+    aggs.append(spark_max("functional_raw").alias("max_functional_raw"))
+if has_health:
+    for c in ["autoav_numeric", "multimorbidade_count", "functional_raw"]:
+        aggs += [mean(c).alias(f"mean_{c}"), stddev_pop(c).alias(f"std_{c}")]
+stats = df_filtered.agg(*aggs).first().asDict() if aggs else {}
+
+# 5. Functional Score normalizado
+if "functional_raw" in df_filtered.columns:
+    max_raw = stats["max_functional_raw"] or 1
+    df_filtered = df_filtered.withColumn("functional_score", 1 - col("functional_raw") / max_raw)
 
 # 8. Health Score composto
 print("   [f] Calculando Health Score...")
-required_cols = ["autoavaliacao_saude", "multimorbidade_count", "functional_score"]
-if all(c in df_pandas.columns for c in required_cols):
-    # Converter autoavaliação para numérico
-    health_mapping = {"Muito boa": 1, "Boa": 2, "Regular": 3, "Ruim": 4, "Muito ruim": 5}
-    df_pandas["autoav_numeric"] = df_pandas["autoavaliacao_saude"].replace(health_mapping)
-    df_pandas["autoav_numeric"] = pd.to_numeric(df_pandas["autoav_numeric"], errors='coerce')
-    
-    # Z-scores
-    df_pandas["autoav_z"] = (df_pandas["autoav_numeric"] - df_pandas["autoav_numeric"].mean()) / df_pandas["autoav_numeric"].std(ddof=0)
-    df_pandas["multimorb_z"] = (df_pandas["multimorbidade_count"] - df_pandas["multimorbidade_count"].mean()) / df_pandas["multimorbidade_count"].std(ddof=0)
-    df_pandas["functional_z"] = (df_pandas["functional_score"] - df_pandas["functional_score"].mean()) / df_pandas["functional_score"].std(ddof=0)
-    
-    # Score composto
-    df_pandas["health_score_raw"] = (
-        (-0.5 * df_pandas["autoav_z"]) +
-        (-0.7 * df_pandas["multimorb_z"]) +
-        (1.2 * df_pandas["functional_z"])
+if has_health:
+    # functional_score = 1 - raw/max: média e DP derivados dos do functional_raw
+    mean_fs = 1 - stats["mean_functional_raw"] / max_raw
+    std_fs = stats["std_functional_raw"] / max_raw
+    df_filtered = (
+        df_filtered
+        .withColumn("autoav_z", (col("autoav_numeric") - stats["mean_autoav_numeric"]) / stats["std_autoav_numeric"])
+        .withColumn("multimorb_z", (col("multimorbidade_count") - stats["mean_multimorbidade_count"]) / stats["std_multimorbidade_count"])
+        .withColumn("functional_z", (col("functional_score") - mean_fs) / std_fs)
+        .withColumn(
+            "health_score_raw",
+            (-0.5 * col("autoav_z")) + (-0.7 * col("multimorb_z")) + (1.2 * col("functional_z"))
+        )
     )
-    
+
     # Normalizar 0-1
-    min_val = df_pandas["health_score_raw"].min()
-    max_val = df_pandas["health_score_raw"].max()
-    df_pandas["health_score"] = (df_pandas["health_score_raw"] - min_val) / (max_val - min_val + 1e-9)
-    print(f"      ✓ Health Score (média: {df_pandas['health_score'].mean():.3f})")
+    bounds = df_filtered.agg(spark_min("health_score_raw").alias("min"), spark_max("health_score_raw").alias("max")).first()
+    df_filtered = df_filtered.withColumn(
+        "health_score", (col("health_score_raw") - bounds["min"]) / (bounds["max"] - bounds["min"] + 1e-9)
+    )
+    print("      ✓ Health Score")
 
-# 9. Imputação
+# 9. Imputação (medianas aproximadas da agregação global)
 print("   [g] Imputando valores faltantes...")
-impute_cols = ["num_medicamentos", "idade", "anos_estudo", "renda_percapita"]
-for col_name in impute_cols:
-    if col_name in df_pandas.columns:
-        missing = df_pandas[col_name].isnull().sum()
-        if missing > 0:
-            df_pandas[col_name] = df_pandas[col_name].fillna(df_pandas[col_name].median())
-            print(f"      • {col_name}: {missing:,} valores imputados")
+fill_values = {c: stats[f"median_{c}"] for c in median_cols if stats.get(f"median_{c}") is not None}
+if fill_values:
+    df_filtered = df_filtered.fillna(fill_values)
+    print(f"      • {', '.join(fill_values)}: medianas imputadas")
 
 print("\n✅ Todas as variáveis derivadas criadas!")
+report.stop()
 
 # ==========================================
 # EXPORTAÇÃO FINAL
@@ -454,15 +501,17 @@ print("\n" + "="*70)
 print("💾 EXPORTAÇÃO FINAL")
 print("="*70)
 
-# Salvar CSV
-print(f"\n📝 Salvando {OUTPUT_CSV.name}...")
-df_pandas.to_csv(OUTPUT_CSV, index=False, encoding='utf-8')
-file_size = OUTPUT_CSV.stat().st_size / 1024**2
+# Parquet particionado por UF, escrito pelos executores (sem coletar no driver)
+print(f"\n📝 Salvando {OUTPUT_PARQUET.name}...")
+report.start("export", rows_in=n_60plus)
+df_filtered.write.mode("overwrite").partitionBy("uf").parquet(str(OUTPUT_PARQUET))
+file_size = sum(f.stat().st_size for f in OUTPUT_PARQUET.rglob("*.parquet")) / 1024**2
+report.stop(rows_out=n_60plus, wrote=[OUTPUT_PARQUET])
 
 print(f"✅ Arquivo salvo com sucesso!")
-print(f"   📁 Caminho: {OUTPUT_CSV}")
-print(f"   📊 Registros: {len(df_pandas):,}")
-print(f"   📋 Colunas: {len(df_pandas.columns)}")
+print(f"   📁 Caminho: {OUTPUT_PARQUET}")
+print(f"   📊 Registros: {n_60plus:,}")
+print(f"   📋 Colunas: {len(df_filtered.columns)}")
 print(f"   💾 Tamanho: {file_size:.1f} MB")
 
 # Salvar metadados
@@ -471,17 +520,18 @@ with open(metadata_file, 'w', encoding='utf-8') as f:
     f.write("="*70 + "\n")
     f.write("PNS 2019 - DATASET COMPLETO COM VARIÁVEIS DERIVADAS\n")
     f.write("="*70 + "\n\n")
-    f.write(f"Registros: {len(df_pandas):,}\n")
-    f.write(f"Colunas: {len(df_pandas.columns)}\n\n")
+    f.write(f"Registros: {n_60plus:,}\n")
+    f.write(f"Colunas: {len(df_filtered.columns)}\n\n")
     f.write("COLUNAS:\n")
     f.write("-"*70 + "\n")
-    for col in df_pandas.columns:
-        f.write(f"{col:35} {df_pandas[col].dtype}\n")
+    for field in df_filtered.schema.fields:
+        f.write(f"{field.name:35} {field.dataType.simpleString()}\n")
 
 print(f"\n📋 Metadados salvos: {metadata_file.name}")
 
 # Resumo estatístico
 print("\n📊 RESUMO ESTATÍSTICO:")
+report.start("summary")
 print("-"*70)
 
 summary_vars = {
@@ -493,17 +543,27 @@ summary_vars = {
     "Dependência SUS": "dependencia_SUS"
 }
 
+dtypes = dict(df_filtered.dtypes)
+numeric_summary = [v for v in summary_vars.values() if v in dtypes and dtypes[v] != "string"]
+summary = df_filtered.agg(*[
+    agg for v in numeric_summary
+    for agg in (mean(v).alias(f"mean_{v}"), percentile_approx(v, 0.5, MEDIAN_ACCURACY).alias(f"median_{v}"))
+]).first() if numeric_summary else None
+
 for label, var in summary_vars.items():
-    if var in df_pandas.columns:
-        if df_pandas[var].dtype in ['object', 'category']:
-            top_value = df_pandas[var].value_counts().head(1)
-            if len(top_value) > 0:
-                print(f"{label:20} (categórica) - Mais comum: {top_value.index[0]} ({top_value.values[0]:,})")
+    if var in dtypes:
+        if dtypes[var] == "string":
+            top_value = df_filtered.groupBy(var).count().orderBy(col("count").desc()).first()
+            if top_value is not None:
+                print(f"{label:20} (categórica) - Mais comum: {top_value[var]} ({top_value['count']:,})")
         else:
-            mean_val = df_pandas[var].mean()
-            median_val = df_pandas[var].median()
+            mean_val = summary[f"mean_{var}"]
+            median_val = summary[f"median_{var}"]
             print(f"{label:20} (numérica)    - Média: {mean_val:.2f}, Mediana: {median_val:.2f}")
 
+report.stop()
+report.save()
+
 print("\n" + "="*70)
 print("🎉 ETL CONCLUÍDO COM SUCESSO!")
 print("="*70)
@@ -511,4 +571,4 @@ print("\n✨ Dataset pronto para análise!")
 
 # Encerrar Spark
 spark.stop()
-print("\n🔌 Spark encerrado")
\ No newline at end of file
+print("\n🔌 Spark encerrado")
@@ -0,0 +1,352 @@
+"""
+Benchmarks dos caminhos críticos sobre microdados sintéticos (pns_synth).
+
+Para cada escala, o arquivo sintético e os insumos intermediários (recorte
+60+ extraído e pontuado) são preparados uma vez, fora da medição. Cada caso
+roda num processo novo (spawn): a preparação do caso não é medida, o pico de
+memória é zerado logo antes do trecho medido (/proc/self/clear_refs) e o
+resultado registra tempo de parede, pico de RSS e vazão (registros/s). Os
+ETLs completos (Pandas e Spark) rodam como subprocessos num diretório
+isolado que reproduz data/ e scripts/.
+
+Cada execução acrescenta uma linha por caso em RESULTS_FILE (JSON Lines) com
+o commit atual, e a tabela final compara com a última medição do mesmo caso
+e escala feita em outro commit.
+
+Uso (de dentro de scripts/): python pns_benchmark.py
+"""
+
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pns_runreport import git_commit, peak_rss_mb, reset_peak_rss
+from pns_synth import SEED, SAS_FILE, LAYOUT_CACHE_DIR, ETL_SCRIPT, generate, script_constants, synthetic_path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+LABELS_FILE = "../data/processed/pns_mappings.json"
+RESULTS_FILE = "../outputs_aai/benchmarks.jsonl"
+WORK_DIR = "../data/synthetic/bench"
+
+# Escalas (× o arquivo original) e casos a medir (None = todos)
+SCALES = [1]
+CASES = None
+N_BOOTSTRAP = 500
+N_JOBS = 1
+WEIGHT_COL = "peso_amostral"
+
+NUMERIC_COLS = ["peso_amostral", "idade", "anos_estudo", "renda_percapita", "num_medicamentos",
+                "peso_real", "altura", "autoavaliacao_saude", "num_pessoas_domicilio", "internacoes_12m"]
+
+
+# ==========================================
+# MEDIÇÃO
+# ==========================================
+
+def _run_command(args, cwd, env=None):
+    """Roda um script como subprocesso -> pico de RSS (MB) do filho"""
+    with open(os.devnull, "wb") as devnull:
+        proc = subprocess.Popen(args, cwd=cwd, env=env, stdout=devnull, stderr=subprocess.PIPE)
+        _, status, usage = os.wait4(proc.pid, 0)
+        stderr = proc.stderr.read().decode("utf-8", "replace")
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{Path(args[-1]).name} terminou com código {proc.returncode}: {stderr[-500:]}")
+    return {"peak_rss_mb": usage.ru_maxrss / 1024}
+
+
+def _measure(name, ctx):
+    """Executado num processo novo: preparação do caso, depois o trecho medido"""
+    case = CASE_FUNCS[name](ctx)
+    if case is None:
+        return {"status": "skipped"}
+    run, n_records = case
+    reset_peak_rss()
+    t0 = time.perf_counter()
+    out = run()
+    wall = time.perf_counter() - t0
+    peak = out["peak_rss_mb"] if isinstance(out, dict) else peak_rss_mb()
+    return {"status": "ok", "wall_s": wall, "peak_rss_mb": peak, "records": n_records,
+            "records_per_s": n_records / wall if wall > 0 else None}
+
+
+# ==========================================
+# INSUMOS
+# ==========================================
+
+def prepare(scale, work_dir=WORK_DIR):
+    """Arquivo sintético e recortes 60+ (extraído e pontuado) de uma escala"""
+    from pns_fwf import iter_chunks, min_age_predicate
+    from pns_dataset import write_dataset
+    from pns_layout import load_layout
+    from aai_scorer import AAIScorer
+
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    raw = synthetic_path(scale)
+    if not raw.exists():
+        print(f"Gerando arquivo sintético {raw} (escala {scale:g})...")
+        generate(raw, scale, verbose=False)
+
+    desired, = script_constants(ETL_SCRIPT, "DESIRED_COLUMNS")
+    stem = raw.stem
+    extract_path = work_dir / f"{stem}_extract.parquet"
+    scored_path = work_dir / f"{stem}_scored.parquet"
+    if not (extract_path.exists() and scored_path.exists()):
+        layout = load_layout(SAS_FILE, cache_dir=LAYOUT_CACHE_DIR)
+        positions = layout.positions(desired)
+        extract = pd.concat(iter_chunks(raw, positions, desired, NUMERIC_COLS, min_age_predicate(60)),
+                            ignore_index=True)
+        extract["regiao"] = extract["uf"].str[:1]
+        extract["codmun"] = extract["upa"].str[:6].astype(int)
+        extract = extract[extract["idade"] >= 60].reset_index(drop=True)
+        write_dataset(extract, extract_path)
+        # Análises usam o morador selecionado (com peso)
+        scored = AAIScorer().fit_transform(extract[extract[WEIGHT_COL].notna()])
+        write_dataset(scored.reset_index(drop=True), scored_path)
+
+    return {
+        "scale": scale,
+        "raw": str(raw.resolve()),
+        "n_records": _count_records(raw),
+        "extract": str(extract_path.resolve()),
+        "scored": str(scored_path.resolve()),
+        "work_dir": str(work_dir.resolve()),
+    }
+
+
+def _count_records(raw):
+    from pns_fwf import open_records
+    return len(open_records(raw))
+
+
+def _sandbox(ctx):
+    """Diretório com data/ e scripts/ para rodar os ETLs sobre o arquivo sintético"""
+    root = Path(ctx["work_dir"]) / f"etl_{Path(ctx['raw']).stem}"
+    (root / "data" / "raw").mkdir(parents=True, exist_ok=True)
+    (root / "data" / "processed").mkdir(parents=True, exist_ok=True)
+    (root / "scripts").mkdir(exist_ok=True)
+    links = {
+        root / "data" / "raw" / "PNS_2019.txt": Path(ctx["raw"]),
+        root / "data" / "raw" / "input_PNS_2019.sas": (SCRIPTS_DIR / SAS_FILE).resolve(),
+        root / "data" / "processed" / "pns_mappings.json": (SCRIPTS_DIR / LABELS_FILE).resolve(),
+    }
+    for link, target in links.items():
+        if not link.exists():
+            link.symlink_to(target)
+    return root
+
+
+# ==========================================
+# CASOS
+# ==========================================
+
+def _case_extract(ctx):
+    """Extração completa em memória (equivalente ao load_and_extract do ETL)"""
+    from pns_fwf import open_records, extract_columns
+    from pns_layout import load_layout
+    desired, = script_constants(ETL_SCRIPT, "DESIRED_COLUMNS")
+    positions = load_layout(SAS_FILE, cache_dir=LAYOUT_CACHE_DIR).positions(desired)
+
+    def run():
+        pd.DataFrame(extract_columns(open_records(ctx["raw"]), positions, desired, NUMERIC_COLS))
+    return run, ctx["n_records"]
+
+
+def _case_extract_streaming(ctx):
+    """Extração em blocos com filtro 60+ antecipado"""
+    from pns_fwf import iter_chunks, min_age_predicate
+    from pns_layout import load_layout
+    desired, = script_constants(ETL_SCRIPT, "DESIRED_COLUMNS")
+    positions = load_layout(SAS_FILE, cache_dir=LAYOUT_CACHE_DIR).positions(desired)
+
+    def run():
+        pd.concat(iter_chunks(ctx["raw"], positions, desired, NUMERIC_COLS, min_age_predicate(60),
+                              n_workers=N_JOBS), ignore_index=True)
+    return run, ctx["n_records"]
+
+
+def _case_etl_pandas(ctx):
+    """ETL Pandas completo (extração, pontuação, mapeamentos, Parquet)"""
+    root = _sandbox(ctx)
+    args = [sys.executable, str(SCRIPTS_DIR / "pns_2019_pandas.py")]
+    return (lambda: _run_command(args, cwd=root / "scripts")), ctx["n_records"]
+
+
+def _case_etl_spark(ctx):
+    """ETL PySpark completo (extração, mapeamentos, derivadas, Parquet)"""
+    if importlib.util.find_spec("pyspark") is None or shutil.which("java") is None:
+        return None
+    root = _sandbox(ctx)
+    env = dict(os.environ, PNS_BASE_PATH=str(root))
+    args = [sys.executable, str(SCRIPTS_DIR / "pns_2019_spark.py")]
+    return (lambda: _run_command(args, cwd=root / "scripts", env=env)), ctx["n_records"]
+
+
+def _case_derive(ctx):
+    """Variáveis derivadas e domínios do AAI (AAIScorer.fit_transform)"""
+    from pns_dataset import read_dataset
+    from aai_scorer import AAIScorer
+    data = read_dataset(ctx["extract"])
+    data = data[data[WEIGHT_COL].notna()]
+    return (lambda: AAIScorer().fit_transform(data)), len(data)
+
+
+def _case_bootstrap_ci(ctx):
+    """IC bootstrap da média ponderada do AAI"""
+    from pns_dataset import read_dataset
+    from aai_stats import weighted_bootstrap_ci, make_rng
+    data = read_dataset(ctx["scored"], columns=["AAI_total", WEIGHT_COL]).dropna()
+    y, w = data["AAI_total"].to_numpy(), data[WEIGHT_COL].to_numpy()
+    return (lambda: weighted_bootstrap_ci(y, w, n_boot=N_BOOTSTRAP, rng=make_rng(SEED, "bench"))), len(data)
+
+
+def _case_municipal(ctx):
+    """Agregação municipal com IC bootstrap por município"""
+    from pns_dataset import read_dataset
+    from aai_stats import aggregate_by_group
+    from aai_scorer import AAI_DOMAINS
+    data = read_dataset(ctx["scored"])
+
+    def run():
+        aggregate_by_group(data, "codmun", WEIGHT_COL, "AAI_total", AAI_DOMAINS,
+                           n_boot=N_BOOTSTRAP, seed=SEED, n_jobs=N_JOBS)
+    return run, len(data)
+
+
+def _case_clustering(ctx):
+    """Padronização + k-means ponderado para todos os k"""
+    from pns_dataset import read_dataset
+    from aai_cluster import prepare_features, kmeans_range
+    from aai_scorer import ALL_DOMAINS
+    data = read_dataset(ctx["scored"])
+    features = [d for d in ALL_DOMAINS if d in data.columns]
+
+    def run():
+        X, w = prepare_features(data, features, WEIGHT_COL)
+        kmeans_range(X, w, seed=SEED, n_jobs=N_JOBS)
+    return run, len(data)
+
+
+def _case_shap(ctx):
+    """Valores SHAP de toda a população de modelagem (sem cache)"""
+    if importlib.util.find_spec("shap") is None:
+        return None
+    from sklearn.ensemble import RandomForestClassifier
+    from pns_dataset import read_dataset
+    from aai_shap import shap_matrix
+    features = ["idade", "anos_estudo", "renda_percapita", "num_medicamentos"]
+    data = read_dataset(ctx["scored"], columns=features + ["AAI_total", WEIGHT_COL]).dropna()
+    X = data[features].to_numpy(dtype=np.float64)
+    y = (data["AAI_total"] <= data["AAI_total"].quantile(0.2)).astype(int).to_numpy()
+    model = RandomForestClassifier(n_estimators=50, max_depth=8, random_state=SEED, n_jobs=N_JOBS)
+    model.fit(X, y, sample_weight=data[WEIGHT_COL].to_numpy())
+    cache_dir = tempfile.mkdtemp(prefix="bench_shap_", dir=ctx["work_dir"])
+
+    def run():
+        try:
+            shap_matrix(model, X, cache_dir, n_jobs=N_JOBS)
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    return run, len(X)
+
+
+def _case_excel(ctx):
+    """Sumário executivo em Excel (streaming write-only, abas como na Seção 14)"""
+    if importlib.util.find_spec("openpyxl") is None:
+        return None
+    from pns_dataset import read_dataset
+    from aai_stats import aggregate_by_group
+    from aai_export import write_workbook
+    data = read_dataset(ctx["scored"])
+    municipal = aggregate_by_group(data, "codmun", WEIGHT_COL, "AAI_total", n_boot=50, seed=SEED)
+    priority = municipal[municipal["AAI_total"] <= municipal["AAI_total"].quantile(0.2)]
+    metadata = pd.DataFrame({"Item": ["Registros", "Municípios"], "Valor": [len(data), len(municipal)]})
+    path = Path(ctx["work_dir"]) / "bench_summary.xlsx"
+    sheets = {"Municipal_Scores": municipal, "Priority_Municipalities": priority, "Metadata": metadata}
+    return (lambda: write_workbook(path, sheets)), len(municipal) + len(priority)
+
+
+CASE_FUNCS = {
+    "extract": _case_extract,
+    "extract_streaming": _case_extract_streaming,
+    "etl_pandas": _case_etl_pandas,
+    "etl_spark": _case_etl_spark,
+    "derive": _case_derive,
+    "bootstrap_ci": _case_bootstrap_ci,
+    "municipal": _case_municipal,
+    "clustering": _case_clustering,
+    "shap": _case_shap,
+    "excel": _case_excel,
+}
+
+
+# ==========================================
+# EXECUÇÃO E COMPARAÇÃO
+# ==========================================
+
+def load_results(path=RESULTS_FILE):
+    path = Path(path)
+    if not path.exists():
+        return pd.DataFrame()
+    with open(path, "r", encoding="utf-8") as f:
+        return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+
+def run_benchmarks(scales=SCALES, cases=CASES, results_file=RESULTS_FILE):
+    """Mede os casos em cada escala, grava em results_file e devolve o DataFrame da execução"""
+    cases = list(CASE_FUNCS) if cases is None else list(cases)
+    previous = load_results(results_file)
+    commit = git_commit()
+    run_id = time.strftime("%Y-%m-%dT%H:%M:%S")
+    rows = []
+    Path(results_file).parent.mkdir(parents=True, exist_ok=True)
+
+    for scale in scales:
+        ctx = prepare(scale)
+        print(f"\nEscala {scale:g}× ({ctx['n_records']:,} registros, commit {commit})")
+        for name in cases:
+            try:
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                    result = pool.submit(_measure, name, ctx).result()
+            except Exception as e:
+                result = {"status": "error", "error": str(e)[-500:]}
+            row = {"run": run_id, "commit": commit, "case": name, "scale": scale,
+                   "file_records": ctx["n_records"], "n_jobs": N_JOBS, "n_bootstrap": N_BOOTSTRAP,
+                   "python": platform.python_version(), "machine": platform.node(), **result}
+            rows.append(row)
+            with open(results_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            _print_row(row, previous)
+    return pd.DataFrame(rows)
+
+
+def _print_row(row, previous):
+    if row["status"] != "ok":
+        print(f"   {row['case']:18s} {row['status']}" + (f": {row['error']}" if row.get("error") else ""))
+        return
+    line = (f"   {row['case']:18s} {row['wall_s']:9.2f} s {row['peak_rss_mb']:9.0f} MB "
+            f"{row['records_per_s']:14,.0f} reg/s")
+    if not previous.empty:
+        same = previous[(previous["case"] == row["case"]) & (previous["scale"] == row["scale"])
+                        & (previous["status"] == "ok") & (previous["commit"] != row["commit"])]
+        if not same.empty:
+            base = same.iloc[-1]
+            line += f"   ({row['wall_s'] / base['wall_s']:.2f}× o tempo de {base['commit']})"
+    print(line)
+
+
+if __name__ == "__main__":
+    run_benchmarks()
@@ -0,0 +1,102 @@
+"""
+Camada processada em formato colunar tipado (Parquet via pyarrow).
+
+Colunas mapeadas viram categóricas (codificação por dicionário no Parquet),
+flags e contagens declaradas viram inteiros pequenos e scores float32. Metadados do
+projeto (mapeamentos, dicionário de rótulos) vão embutidos no schema do
+arquivo, e a leitura carrega só as colunas pedidas.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+METADATA_PREFIX = "pns."
+COMPRESSION = "zstd"
+
+
+def compact_frame(df, categorical=(), integer=(), keep_float64=()):
+    """
+    Reduz os tipos do DataFrame:
+    - colunas em categorical -> category (valores como texto; vazio = missing)
+    - colunas em integer (flags e contagens) sem missing e com valores inteiros
+      -> menor inteiro que comporta; bool -> int8
+    - demais floats -> float32 (exceto keep_float64, ex.: pesos amostrais)
+    Colunas contínuas nunca viram inteiro, mesmo que os valores sejam redondos:
+    o schema do Parquet não depende dos dados.
+    """
+    out = {}
+    categorical = set(categorical)
+    integer = set(integer)
+    keep_float64 = set(keep_float64)
+    for col in df.columns:
+        s = df[col]
+        if col in categorical and not isinstance(s.dtype, pd.CategoricalDtype):
+            s = s.where(s.isna(), s.astype(str))
+            s = s.mask(s == "").astype("category")
+        elif pd.api.types.is_bool_dtype(s):
+            s = s.astype(np.int8)
+        elif col in integer and pd.api.types.is_numeric_dtype(s):
+            values = s.to_numpy(dtype=np.float64)
+            if not np.isnan(values).any() and np.array_equal(values, np.round(values)):
+                s = pd.to_numeric(s.astype(np.int64), downcast="integer")
+            elif pd.api.types.is_float_dtype(s):
+                s = s.astype(np.float32)
+        elif pd.api.types.is_float_dtype(s) and col not in keep_float64:
+            s = s.astype(np.float32)
+        out[col] = s
+    return pd.DataFrame(out, index=df.index)
+
+
+def write_dataset(df, path, metadata=None, compression=COMPRESSION):
+    """Grava df em Parquet com metadados do projeto (JSON) no schema"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    schema_meta = dict(table.schema.metadata or {})
+    for key, value in (metadata or {}).items():
+        schema_meta[(METADATA_PREFIX + key).encode()] = json.dumps(value, ensure_ascii=False).encode("utf-8")
+    table = table.replace_schema_metadata(schema_meta)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(table, path, compression=compression)
+    return path
+
+
+def read_dataset(path, columns=None):
+    """
+    Lê o dataset processado carregando só as colunas pedidas (None = todas).
+    Arquivos .csv antigos continuam aceitos, com a mesma projeção.
+    """
+    path = Path(path)
+    if path.suffix == ".csv":
+        wanted = None if columns is None else set(columns).__contains__
+        return pd.read_csv(path, usecols=wanted, low_memory=False)
+    if columns is not None:
+        available = set(_schema(path).names)
+        columns = [c for c in columns if c in available]
+    return pq.read_table(path, columns=columns).to_pandas()
+
+
+def _schema(path):
+    """Schema de um arquivo Parquet ou de um diretório particionado (Spark)"""
+    path = Path(path)
+    if path.is_dir():
+        return pq.ParquetDataset(path).schema
+    return pq.read_schema(path)
+
+
+def read_metadata(path):
+    """Metadados do projeto embutidos no arquivo ({chave: objeto JSON})"""
+    meta = _schema(path).metadata or {}
+    return {
+        key.decode()[len(METADATA_PREFIX):]: json.loads(value)
+        for key, value in meta.items()
+        if key.decode().startswith(METADATA_PREFIX)
+    }
+
+
+def read_columns(path):
+    """Nomes das colunas sem ler os dados"""
+    return _schema(path).names
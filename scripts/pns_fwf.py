@@ -0,0 +1,233 @@
+"""
+Leitura vetorizada do arquivo de microdados PNS_2019.txt (largura fixa).
+
+O arquivo é mapeado em memória como uma matriz de bytes (registros × LRECL),
+de modo que cada coluna é um fatiamento direto da matriz: nenhuma linha vira
+objeto Python. Campos numéricos são convertidos diretamente dos bytes.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+# LRECL declarado no INFILE de input_PNS_2019.sas
+RECORD_LENGTH = 1548
+
+# Registros por bloco no modo streaming (~77 MB de bytes brutos por bloco)
+CHUNK_RECORDS = 50_000
+
+
+def open_records(raw_file, record_length=RECORD_LENGTH):
+    """Mapeia o arquivo raw como matriz uint8 (n_registros, record_length)"""
+    raw = np.memmap(raw_file, dtype=np.uint8, mode="r")
+    if raw.size < record_length:
+        return np.zeros((0, record_length), dtype=np.uint8)
+
+    # Terminador de linha: '\n' (Unix) ou '\r\n' (arquivo original do IBGE)
+    stride = record_length
+    if raw.size > record_length and raw[record_length] in (10, 13):
+        stride += 2 if raw[record_length] == 13 else 1
+
+    n_records = (raw.size - record_length) // stride + 1
+    return np.lib.stride_tricks.as_strided(
+        raw, shape=(n_records, record_length), strides=(stride, 1), writeable=False
+    )
+
+
+def decode_numeric(block):
+    """
+    Converte um bloco de bytes (n, largura) em float64.
+    Equivale a pd.to_numeric(texto.strip(), errors="coerce"): campos vazios
+    ou não numéricos viram NaN. Dígitos com ponto decimal e sinal opcional
+    (o formato do layout da PNS) são convertidos direto dos bytes; as linhas
+    raras fora desse formato (ex.: expoente, 1E3) passam pelo pd.to_numeric.
+    """
+    n, width = block.shape
+    if width == 0:
+        return np.full(n, np.nan)
+
+    is_digit = (block >= 48) & (block <= 57)
+    is_dot = block == 46
+    is_space = block == 32
+
+    # Espaços só são aceitos nas bordas (como em texto.strip())
+    filled = np.cumsum(~is_space, axis=1)
+    inner_space = is_space & (filled > 0) & (filled < filled[:, -1:])
+
+    # Sinal só como primeiro caractere não vazio
+    is_sign = ((block == 43) | (block == 45)) & (filled == 1)
+    negative = ((block == 45) & is_sign).any(axis=1)
+
+    n_dots = is_dot.sum(axis=1)
+    valid = (
+        (is_digit | is_dot | is_space | is_sign).all(axis=1)
+        & ~inner_space.any(axis=1)
+        & is_digit.any(axis=1)
+        & (n_dots <= 1)
+    )
+
+    # Acumula os dígitos coluna a coluna (largura pequena, vetorizado nas linhas)
+    values = np.zeros(n, dtype=np.float64)
+    decimals = np.zeros(n, dtype=np.int64)
+    seen_dot = np.zeros(n, dtype=bool)
+    for j in range(width):
+        digit = is_digit[:, j]
+        values = np.where(digit, values * 10 + (block[:, j].astype(np.float64) - 48), values)
+        decimals += digit & seen_dot
+        seen_dot |= is_dot[:, j]
+
+    values /= 10.0 ** decimals
+    values[negative] *= -1
+    values[~valid] = np.nan
+
+    # Campos preenchidos fora do formato: mesma regra do pd.to_numeric
+    other = np.flatnonzero(~valid & ~is_space.all(axis=1))
+    if len(other):
+        values[other] = pd.to_numeric(pd.Series(decode_text(block[other])), errors="coerce").to_numpy(dtype=np.float64)
+    return values
+
+
+def decode_text(block, encoding="latin-1"):
+    """
+    Converte um bloco de bytes (n, largura) em array de strings sem espaços nas
+    bordas. Só os valores distintos são decodificados; as linhas compartilham
+    os mesmos objetos str.
+    """
+    n, width = block.shape
+    if n == 0 or width == 0:
+        return np.full(n, "", dtype=object)
+
+    fixed = np.ascontiguousarray(block).view(f"S{width}").ravel()
+    uniques, inverse = np.unique(fixed, return_inverse=True)
+    labels = np.array([u.decode(encoding).strip() for u in uniques], dtype=object)
+    return labels[inverse.ravel()]
+
+
+def extract_columns(records, positions, desired_columns, numeric_cols=()):
+    """Extrai as colunas desejadas de uma matriz de registros -> dict de arrays"""
+    numeric_cols = set(numeric_cols)
+    data = {}
+    for code, (pos, length) in positions.items():
+        if code not in desired_columns:
+            continue
+        col_name = desired_columns[code]
+        block = records[:, pos:pos + length]
+        if col_name in numeric_cols:
+            data[col_name] = decode_numeric(block)
+        else:
+            data[col_name] = decode_text(block)
+    return data
+
+
+# ==========================================
+# STREAMING COM FILTRO ANTECIPADO
+# ==========================================
+
+def _min_age_mask(chunk, positions, min_age, age_code):
+    pos, length = positions[age_code]
+    return decode_numeric(chunk[:, pos:pos + length]) >= min_age
+
+
+def _uf_mask(chunk, positions, wanted, uf_code):
+    pos, length = positions[uf_code]
+    return np.isin(decode_text(chunk[:, pos:pos + length]), wanted)
+
+
+def _all_of_mask(chunk, positions, predicates):
+    mask = np.ones(len(chunk), dtype=bool)
+    for pred in predicates:
+        mask &= pred(chunk, positions)
+    return mask
+
+
+# Predicados são partial de funções do módulo para poderem ir aos processos
+def min_age_predicate(min_age=60, age_code="C008"):
+    """Predicado: idade (C008) >= min_age, decodificando só o campo de idade"""
+    return partial(_min_age_mask, min_age=min_age, age_code=age_code)
+
+
+def uf_predicate(ufs, uf_code="V0001"):
+    """Predicado: UF (V0001) dentro da lista informada (códigos IBGE, ex.: "35")"""
+    wanted = np.array([str(uf).zfill(2) for uf in ufs], dtype=object)
+    return partial(_uf_mask, wanted=wanted, uf_code=uf_code)
+
+
+def all_of(*predicates):
+    """Combina predicados com E lógico"""
+    return partial(_all_of_mask, predicates=predicates)
+
+
+def _rows(ranges):
+    """Índices dos registros de um conjunto de faixas [início, fim)"""
+    lengths = ranges[:, 1] - ranges[:, 0]
+    offsets = np.repeat(ranges[:, 0] - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.arange(lengths.sum()) + offsets
+
+
+def _split_ranges(ranges, chunk_records):
+    """Agrupa faixas em tarefas de até chunk_records registros (faixas longas são cortadas)"""
+    pieces = []
+    for first, last in ranges:
+        for start in range(int(first), int(last), chunk_records):
+            pieces.append((start, min(start + chunk_records, int(last))))
+    pieces = np.array(pieces, dtype=np.int64).reshape(-1, 2)
+    filled = np.cumsum(pieces[:, 1] - pieces[:, 0])
+    task = (filled - 1) // chunk_records
+    cuts = np.flatnonzero(np.diff(task)) + 1
+    return np.split(pieces, cuts) if len(pieces) else []
+
+
+def read_range(raw_file, ranges, positions, desired_columns, numeric_cols=(), predicate=None):
+    """
+    Decodifica os registros das faixas [início, fim) do arquivo -> DataFrame
+    (filtrado pelo predicado). Uma faixa única é um fatiamento sem cópia.
+    """
+    records = open_records(raw_file)
+    ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+    if len(ranges) == 0:
+        chunk = records[:0]
+    elif len(ranges) == 1:
+        chunk = records[ranges[0, 0]:ranges[0, 1]]
+    else:
+        chunk = records[_rows(ranges)]
+    if predicate is not None:
+        chunk = chunk[predicate(chunk, positions)]
+    return pd.DataFrame(extract_columns(chunk, positions, desired_columns, numeric_cols))
+
+
+def iter_chunks(raw_file, positions, desired_columns, numeric_cols=(),
+                predicate=None, chunk_records=CHUNK_RECORDS, n_workers=1, ranges=None):
+    """
+    Lê o arquivo raw em blocos de chunk_records registros e devolve um
+    DataFrame por bloco. O predicado é avaliado antes da extração, então só as
+    linhas aceitas têm as demais colunas decodificadas; a memória de pico fica
+    limitada pelo tamanho do bloco, não do arquivo.
+
+    ranges restringe a leitura a faixas [início, fim) de registros (ex.: as de
+    uma UF, vindas de pns_index.RecordIndex.ranges); o resto do arquivo nem é
+    tocado. Faixas curtas são agrupadas no mesmo bloco.
+
+    Com n_workers > 1 (ou -1 = todos os núcleos) os blocos são decodificados
+    em processos, cada um mapeando sua faixa de bytes do arquivo; os blocos
+    saem na ordem do arquivo, então o resultado é idêntico ao sequencial. Os
+    processos usam fork (o script não precisa de guarda __main__); onde fork
+    não existe (Windows), a leitura continua sequencial.
+    """
+    if ranges is None:
+        ranges = [(0, len(open_records(raw_file)))]
+    # Seleção vazia ainda devolve um bloco (vazio) com as colunas
+    tasks = _split_ranges(ranges, chunk_records) or [np.zeros((0, 2), dtype=np.int64)]
+    read = partial(read_range, raw_file, positions=positions, desired_columns=desired_columns,
+                   numeric_cols=tuple(numeric_cols), predicate=predicate)
+
+    if n_workers == 1 or len(tasks) <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        for task in tasks:
+            yield read(task)
+        return
+
+    max_workers = None if n_workers == -1 else n_workers
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("fork")) as pool:
+        yield from pool.map(read, tasks)
@@ -0,0 +1,180 @@
+"""
+Índice de registros por UF e UPA para o arquivo PNS_2019.txt.
+
+Os registros têm tamanho fixo, então o registro i começa no byte
+i × (LRECL + terminador). O índice guarda, para cada UF (V0001) e cada UPA
+(UPA_PNS), as faixas contíguas [início, fim) de registros em que aparece; é
+construído uma vez por arquivo raw e gravado ao lado dele (.npz). Com ele a
+leitura de uma UF ou de um conjunto de UPAs vai direto aos registros, sem
+decodificar o arquivo nacional inteiro.
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+from pns_fwf import open_records, CHUNK_RECORDS
+
+INDEX_VERSION = 1
+
+# Chaves indexadas: nome -> código da variável no layout
+INDEX_KEYS = {"uf": "V0001", "upa": "UPA_PNS"}
+
+
+def file_fingerprint(path):
+    """Tamanho + data de modificação do arquivo (evita reler 1,6 GB só para validar)"""
+    st = os.stat(path)
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+
+def _runs(values):
+    """Faixas [início, fim) de valores iguais consecutivos"""
+    change = np.flatnonzero(values[1:] != values[:-1]) + 1
+    starts = np.concatenate([[0], change])
+    stops = np.concatenate([change, [len(values)]])
+    return values[starts], starts, stops
+
+
+def _merge(ranges):
+    """Ordena e une faixas sobrepostas ou adjacentes -> array (k, 2)"""
+    if len(ranges) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    ranges = ranges[np.argsort(ranges[:, 0], kind="stable")]
+    reach = np.maximum.accumulate(ranges[:, 1])
+    new = np.ones(len(ranges), dtype=bool)
+    new[1:] = ranges[1:, 0] > reach[:-1]
+    group = np.cumsum(new) - 1
+    stops = np.zeros(group[-1] + 1, dtype=np.int64)
+    np.maximum.at(stops, group, ranges[:, 1])
+    return np.column_stack([ranges[new, 0], stops])
+
+
+def _intersect(a, b):
+    """Interseção de duas listas de faixas ordenadas e disjuntas"""
+    out, i, j = [], 0, 0
+    while i < len(a) and j < len(b):
+        start, stop = max(a[i, 0], b[j, 0]), min(a[i, 1], b[j, 1])
+        if start < stop:
+            out.append((start, stop))
+        if a[i, 1] < b[j, 1]:
+            i += 1
+        else:
+            j += 1
+    return np.array(out, dtype=np.int64).reshape(-1, 2)
+
+
+class RecordIndex:
+    """Faixas de registros por valor de cada chave indexada"""
+
+    def __init__(self, tables, n_records, fingerprint=None):
+        # tables: {nome: (valores ordenados, ponteiros, inícios, fins)}
+        self.tables = tables
+        self.n_records = n_records
+        self.fingerprint = fingerprint
+
+    def values(self, name):
+        """Valores distintos de uma chave (ex.: UFs presentes no arquivo)"""
+        return list(self.tables[name][0])
+
+    def lookup(self, name, wanted):
+        """Faixas de registros dos valores pedidos de uma chave"""
+        keys, ptr, starts, stops = self.tables[name]
+        parts = []
+        for value in wanted:
+            i = np.searchsorted(keys, value)
+            if i < len(keys) and keys[i] == value:
+                parts.append(np.column_stack([starts[ptr[i]:ptr[i + 1]], stops[ptr[i]:ptr[i + 1]]]))
+        return _merge(np.concatenate(parts) if parts else np.zeros((0, 2), dtype=np.int64))
+
+    def ranges(self, ufs=None, upas=None):
+        """
+        Faixas [início, fim) dos registros das UFs e/ou UPAs pedidas. Com as
+        duas seleções, devolve a interseção (UPAs dentro das UFs).
+        """
+        selected = None
+        if ufs:
+            selected = self.lookup("uf", [str(uf).zfill(2) for uf in ufs])
+        if upas:
+            by_upa = self.lookup("upa", [str(upa).zfill(9) for upa in upas])
+            selected = by_upa if selected is None else _intersect(selected, by_upa)
+        if selected is None:
+            return np.array([[0, self.n_records]], dtype=np.int64)
+        return selected
+
+    @staticmethod
+    def count(ranges):
+        return int((ranges[:, 1] - ranges[:, 0]).sum())
+
+    def save(self, path):
+        arrays = {"version": np.array(INDEX_VERSION), "n_records": np.array(self.n_records),
+                  "fingerprint": np.array(self.fingerprint or "")}
+        for name, (keys, ptr, starts, stops) in self.tables.items():
+            arrays.update({f"{name}_keys": keys, f"{name}_ptr": ptr,
+                           f"{name}_starts": starts, f"{name}_stops": stops})
+        with open(path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data["version"]) != INDEX_VERSION:
+                raise ValueError(f"Versão de índice incompatível: {path}")
+            tables = {
+                name: tuple(data[f"{name}_{part}"] for part in ("keys", "ptr", "starts", "stops"))
+                for name in INDEX_KEYS
+            }
+            return cls(tables, int(data["n_records"]), str(data["fingerprint"]))
+
+
+def build_index(raw_file, positions, chunk_records=CHUNK_RECORDS):
+    """
+    Varre o arquivo uma vez lendo só os bytes de V0001 e UPA_PNS e monta as
+    faixas de registros de cada valor.
+    """
+    records = open_records(raw_file)
+    columns = {name: [] for name in INDEX_KEYS}
+    for start in range(0, len(records), chunk_records):
+        chunk = records[start:start + chunk_records]
+        for name, code in INDEX_KEYS.items():
+            pos, length = positions[code]
+            columns[name].append(np.ascontiguousarray(chunk[:, pos:pos + length]).view(f"S{length}").ravel())
+
+    tables = {}
+    for name, parts in columns.items():
+        values = np.concatenate(parts) if parts else np.zeros(0, dtype="S1")
+        if len(values) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            tables[name] = (np.zeros(0, dtype="U1"), np.zeros(1, dtype=np.int64), empty, empty)
+            continue
+        run_values, starts, stops = _runs(values)
+        order = np.argsort(run_values, kind="stable")
+        keys, counts = np.unique(run_values[order], return_counts=True)
+        ptr = np.concatenate([[0], np.cumsum(counts)])
+        keys = np.char.strip(np.char.decode(keys, "latin-1"))
+        tables[name] = (keys, ptr, starts[order], stops[order])
+    return RecordIndex(tables, len(records), file_fingerprint(raw_file))
+
+
+def load_index(raw_file, positions, cache_dir=None, chunk_records=CHUNK_RECORDS):
+    """
+    Carrega o índice do cache (cache_dir/pns_index_<arquivo>.npz) ou o constrói
+    e grava. O índice é refeito se o arquivo raw mudar (tamanho ou data).
+    Por padrão o índice fica ao lado do arquivo raw.
+    """
+    raw_file = Path(raw_file)
+    cache_dir = Path(cache_dir) if cache_dir else raw_file.parent
+    index_file = cache_dir / f"pns_index_{raw_file.stem}.npz"
+
+    if index_file.exists():
+        try:
+            index = RecordIndex.load(index_file)
+            if index.fingerprint == file_fingerprint(raw_file):
+                return index
+        except (ValueError, KeyError):
+            pass
+
+    index = build_index(raw_file, positions, chunk_records)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    index.save(index_file)
+    return index
@@ -0,0 +1,173 @@
+"""
+Layout compilado do arquivo de microdados PNS 2019.
+
+Lê o bloco INPUT de input_PNS_2019.sas uma única vez e gera um artefato
+validado (posição, largura, tipo e rótulo das 1.088 variáveis), salvo em JSON
+e indexado pelo hash do arquivo SAS. Execuções seguintes só carregam o JSON.
+"""
+
+import hashlib
+import json
+import re
+from collections import namedtuple
+from pathlib import Path
+
+Variable = namedtuple("Variable", ["code", "offset", "width", "decimals", "type", "label"])
+
+LAYOUT_VERSION = 1
+
+_INFILE_RE = re.compile(r"LRECL\s*=\s*(\d+)", re.IGNORECASE)
+_INPUT_RE = re.compile(
+    r"^\s*@(\d+)\s+(\w+)\s+(\$?)(\d+)\.(\d*)\s*(?:/\*(.*?)\*/)?", re.IGNORECASE
+)
+
+
+def file_sha256(path):
+    """SHA-256 do arquivo (hex)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Layout:
+    """Layout de largura fixa: variáveis em ordem de posição"""
+
+    def __init__(self, variables, record_length, sas_sha256=None):
+        self.variables = {v.code: v for v in variables}
+        self.record_length = record_length
+        self.sas_sha256 = sas_sha256
+        self.labels_sha256 = None
+
+    def __len__(self):
+        return len(self.variables)
+
+    def __contains__(self, code):
+        return code in self.variables
+
+    def __getitem__(self, code):
+        return self.variables[code]
+
+    def positions(self, codes=None):
+        """{código: (offset 0-based, largura)} no formato usado pelos extratores"""
+        wanted = None if codes is None else set(codes)
+        return {
+            v.code: (v.offset, v.width)
+            for v in self.variables.values()
+            if wanted is None or v.code in wanted
+        }
+
+    def numeric_codes(self, codes=None):
+        """Códigos declarados como numéricos (sem '$') no SAS"""
+        wanted = None if codes is None else set(codes)
+        return [
+            v.code for v in self.variables.values()
+            if v.type == "num" and (wanted is None or v.code in wanted)
+        ]
+
+    def module(self, *prefixes):
+        """Códigos de um ou mais módulos do questionário (ex.: "K", "Q")"""
+        return [v.code for v in self.variables.values() if v.code.startswith(prefixes)]
+
+    def validate(self):
+        """Verifica sobreposição de campos e limites do registro"""
+        end = 0
+        for v in self.variables.values():
+            if v.width <= 0:
+                raise ValueError(f"{v.code}: largura inválida ({v.width})")
+            if v.offset < end:
+                raise ValueError(f"{v.code}: sobrepõe o campo anterior (offset {v.offset} < {end})")
+            end = v.offset + v.width
+        if end > self.record_length:
+            raise ValueError(f"Layout ultrapassa LRECL={self.record_length} (fim em {end})")
+        return self
+
+    def to_dict(self):
+        return {
+            "version": LAYOUT_VERSION,
+            "sas_sha256": self.sas_sha256,
+            "labels_sha256": self.labels_sha256,
+            "record_length": self.record_length,
+            "variables": [v._asdict() for v in self.variables.values()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        layout = cls([Variable(**v) for v in data["variables"]], data["record_length"], data.get("sas_sha256"))
+        layout.labels_sha256 = data.get("labels_sha256")
+        return layout
+
+
+def load_labels(labels_file):
+    """Rótulos do dicionário PNS ({código: {sigla: descrição}}) -> {código: descrição}"""
+    with open(labels_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {
+        code: " ".join(str(text).split())
+        for code, entry in data.items()
+        for text in (entry.values() if isinstance(entry, dict) else [entry])
+    }
+
+
+def compile_layout(sas_file, labels_file=None):
+    """
+    Compila o bloco INPUT do programa SAS em um Layout validado. Variáveis sem
+    comentário no SAS recebem o rótulo do dicionário (labels_file), se houver.
+    """
+    labels = load_labels(labels_file) if labels_file else {}
+    record_length = None
+    variables = []
+    with open(sas_file, "r", encoding="latin-1") as f:
+        for line in f:
+            if record_length is None:
+                match = _INFILE_RE.search(line)
+                if match:
+                    record_length = int(match.group(1))
+                    continue
+            match = _INPUT_RE.match(line)
+            if not match:
+                continue
+            start, code, is_char, width, decimals, label = match.groups()
+            variables.append(Variable(
+                code=code,
+                offset=int(start) - 1,  # SAS é 1-based
+                width=int(width),
+                decimals=int(decimals or 0),
+                type="char" if is_char else "num",
+                label=(label or "").strip() or labels.get(code, ""),
+            ))
+
+    if record_length is None:
+        raise ValueError(f"LRECL não encontrado em {sas_file}")
+    if not variables:
+        raise ValueError(f"Nenhuma variável encontrada no INPUT de {sas_file}")
+
+    variables.sort(key=lambda v: v.offset)
+    return Layout(variables, record_length, file_sha256(sas_file)).validate()
+
+
+def load_layout(sas_file, cache_dir=None, labels_file=None):
+    """
+    Carrega o layout do cache (cache_dir/pns_layout_<hash>.json) ou compila o
+    SAS e grava o cache. Por padrão o cache fica ao lado do arquivo SAS.
+    """
+    sas_file = Path(sas_file)
+    cache_dir = Path(cache_dir) if cache_dir else sas_file.parent
+    sha = file_sha256(sas_file)
+    labels_sha = file_sha256(labels_file) if labels_file else None
+    cache_file = cache_dir / f"pns_layout_{sha[:16]}.json"
+
+    if cache_file.exists():
+        with open(cache_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if (data.get("version") == LAYOUT_VERSION and data.get("sas_sha256") == sha
+                and data.get("labels_sha256") == labels_sha):
+            return Layout.from_dict(data)
+
+    layout = compile_layout(sas_file, labels_file)
+    layout.labels_sha256 = labels_sha
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with open(cache_file, "w", encoding="utf-8") as f:
+        json.dump(layout.to_dict(), f, ensure_ascii=False)
+    return layout
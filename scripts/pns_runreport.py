@@ -0,0 +1,492 @@
+"""
+Instrumentação por etapa e relatório de execução em JSON/CSV.
+
+Cada etapa (passo do ETL ou seção do notebook) registra tempo de parede,
+tempo de CPU (incluindo processos filhos já encerrados), pico de RSS da
+etapa, memória ao final, linhas de entrada/saída e bytes lidos/gravados. Uma
+etapa escolhida pode ser perfilada (cProfile ou amostragem via pyinstrument).
+O relatório é gravado em report_dir como <nome>_<data-hora>.json (execução
+completa) e .csv (uma linha por etapa); duas execuções se comparam com
+compare_reports ou pela linha de comando:
+
+    python pns_runreport.py ../outputs_aai/run_reports/etl_pandas_A.json ../outputs_aai/run_reports/etl_pandas_B.json
+    python pns_runreport.py etl_pandas      # as duas últimas execuções com esse nome
+
+Pico de memória: no Linux o pico do processo é zerado no início de cada etapa
+(/proc/self/clear_refs), então cada etapa mede o seu próprio pico; em outros
+sistemas usa psutil (Windows: pico da vida do processo) ou resource. Bytes:
+os arquivos declarados com read()/wrote(), ou, se nenhum for declarado, os
+contadores de E/S do processo (/proc/self/io; leituras via memmap não entram).
+No Spark só o driver Python é medido e, pela avaliação preguiçosa, o tempo
+cai na etapa que dispara a ação (count, cache, write).
+"""
+
+import atexit
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+REPORT_DIR = "../outputs_aai/run_reports"
+PROFILERS = ("cprofile", "sampling")
+# Etapas com tempo acima deste múltiplo da execução de referência (e pelo menos
+# REGRESSION_MIN_S segundos mais lentas) são sinalizadas
+REGRESSION_RATIO = 1.2
+REGRESSION_MIN_S = 0.5
+PROFILE_TOP = 40
+
+# Callbacks registrados por watch_ipython, por shell (reexecutar a célula troca o relatório)
+_WATCHERS = {}
+
+STAGE_COLUMNS = ["stage", "parent", "status", "start_s", "wall_s", "cpu_s", "peak_rss_mb", "rss_end_mb",
+                 "rows_in", "rows_out", "bytes_read", "bytes_written", "error"]
+
+
+# ==========================================
+# MEDIDAS DO PROCESSO
+# ==========================================
+
+def git_commit(cwd=None):
+    """Commit atual (hash curto, com sufixo -dirty se houver alterações)"""
+    cwd = cwd or Path(__file__).resolve().parent
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=cwd,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "-uno"], cwd=cwd,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def reset_peak_rss():
+    """Zera o pico de RSS do processo (Linux); False se não suportado"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _proc_status(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    """Pico de RSS desde o último reset_peak_rss (ou desde o início do processo)"""
+    peak = _proc_status("VmHWM")
+    if peak is not None:
+        return peak
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1024**2
+    except ImportError:
+        pass
+    import resource
+    # ru_maxrss: KB no Linux, bytes no macOS
+    scale = 1024**2 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def rss_mb():
+    """RSS atual do processo"""
+    rss = _proc_status("VmRSS")
+    if rss is not None:
+        return rss
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024**2
+    except ImportError:
+        return None
+
+
+def _cpu_seconds():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def _io_counters():
+    """(bytes lidos, bytes gravados) por chamadas de sistema, se disponível"""
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(":") for line in f)
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def path_size(path):
+    """Tamanho de um arquivo ou de um diretório (ex.: saída Parquet do Spark)"""
+    path = Path(path)
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+    return path.stat().st_size if path.exists() else 0
+
+
+# ==========================================
+# ETAPAS E RELATÓRIO
+# ==========================================
+
+class StageRecord:
+    """Etapa em andamento; rows_out e os arquivos podem ser preenchidos durante a etapa"""
+
+    def __init__(self, name, parent, rows_in, t0):
+        self.name = name
+        self.parent = parent
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.files_read = []
+        self.files_written = []
+        self.status = "running"
+        self.error = None
+        self.start = time.perf_counter()
+        self.start_s = self.start - t0
+        self.cpu = _cpu_seconds()
+        self.io = _io_counters()
+        self.peak = 0.0
+
+    def read(self, *paths):
+        self.files_read.extend(paths)
+        return self
+
+    def wrote(self, *paths):
+        self.files_written.extend(paths)
+        return self
+
+    def close(self, status, error=None):
+        wall = time.perf_counter() - self.start
+        io = _io_counters()
+        io_delta = (io[0] - self.io[0], io[1] - self.io[1]) if io and self.io else (None, None)
+        bytes_read = sum(path_size(p) for p in self.files_read) if self.files_read else io_delta[0]
+        bytes_written = sum(path_size(p) for p in self.files_written) if self.files_written else io_delta[1]
+        self.status = status
+        return {
+            "stage": self.name, "parent": self.parent, "status": status,
+            "start_s": round(self.start_s, 4), "wall_s": round(wall, 4),
+            "cpu_s": round(_cpu_seconds() - self.cpu, 4),
+            "peak_rss_mb": None if self.peak is None else round(self.peak, 1),
+            "rss_end_mb": rss_mb(),
+            "rows_in": self.rows_in, "rows_out": self.rows_out,
+            "bytes_read": bytes_read, "bytes_written": bytes_written,
+            "error": error,
+        }
+
+
+class RunReport:
+    """
+    Uso (scripts):
+        report = RunReport("etl_pandas", REPORT_DIR, config={"STREAMING": STREAMING})
+        report.start("extract")
+        ...
+        report.stop(rows_out=len(df), read=[RAW_FILE])
+        report.save()
+
+    ou, em blocos:
+        with report.stage("derive", rows_in=len(df)) as stage:
+            ...
+            stage.rows_out = len(df)
+
+    Etapas podem ser aninhadas (parent = etapa de fora). profile_stage (parte
+    do nome, sem diferenciar maiúsculas) escolhe a etapa perfilada; profiler é
+    'cprofile' ou 'sampling' (pyinstrument; cai para cProfile se ausente).
+    Etapas ainda abertas quando o processo termina são fechadas como
+    'interrupted' e o relatório é gravado.
+    """
+
+    def __init__(self, name, report_dir=REPORT_DIR, config=None, profile_stage=None, profiler="cprofile",
+                 verbose=True):
+        if profiler not in PROFILERS:
+            raise ValueError(f"profiler deve ser um de {PROFILERS}: {profiler!r}")
+        self.name = name
+        self.report_dir = Path(report_dir)
+        self.config = {k: v if isinstance(v, (str, int, float, bool, type(None))) else repr(v)
+                       for k, v in (config or {}).items()}
+        self.profile_stage = profile_stage
+        self.profiler = profiler
+        self.verbose = verbose
+        self.run_id = time.strftime("%Y%m%d-%H%M%S")
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.commit = git_commit()
+        self.stages = []
+        self.profile_files = []
+        self._stack = []
+        self._profile = None
+        self._t0 = time.perf_counter()
+        self._cpu0 = _cpu_seconds()
+        self._peak = 0.0
+        self._per_stage_peak = reset_peak_rss()
+        atexit.register(self._finalize)
+
+    # ------------------------------------------------------------------
+    # Etapas
+    # ------------------------------------------------------------------
+
+    def _absorb_peak(self):
+        """Leva o pico atual para as etapas abertas e para o total antes de um reset"""
+        peak = peak_rss_mb()
+        if peak is None:
+            return
+        self._peak = max(self._peak, peak)
+        for record in self._stack:
+            record.peak = max(record.peak, peak)
+
+    def start(self, name, rows_in=None):
+        """Abre uma etapa (aninhada na etapa aberta, se houver)"""
+        self._absorb_peak()
+        parent = self._stack[-1].name if self._stack else None
+        record = StageRecord(name, parent, rows_in, self._t0)
+        if self._per_stage_peak:
+            reset_peak_rss()
+        self._stack.append(record)
+        if self._profile is None and self.profile_stage and self.profile_stage.lower() in name.lower():
+            self._start_profile(record)
+        return record
+
+    def stop(self, rows_out=None, read=(), wrote=(), status="ok", error=None):
+        """Fecha a etapa aberta mais interna e devolve o registro"""
+        self._absorb_peak()
+        record = self._stack.pop()
+        if rows_out is not None:
+            record.rows_out = rows_out
+        record.read(*read).wrote(*wrote)
+        if self._profile is not None and self._profile[0] is record:
+            self._stop_profile()
+        row = record.close(status, error)
+        self.stages.append(row)
+        if self.verbose:
+            rows = f" | {row['rows_out']:,} linhas" if isinstance(row["rows_out"], int) else ""
+            peak = f" | pico {row['peak_rss_mb']:,.0f} MB" if row["peak_rss_mb"] else ""
+            print(f"   ⏱ {record.name}: {row['wall_s']:.2f}s{peak}{rows}")
+        return row
+
+    def stage(self, name, rows_in=None):
+        return _StageContext(self, name, rows_in)
+
+    # ------------------------------------------------------------------
+    # Perfil
+    # ------------------------------------------------------------------
+
+    def _start_profile(self, record):
+        if self.profiler == "sampling":
+            try:
+                from pyinstrument import Profiler
+                profiler = Profiler()
+                profiler.start()
+                self._profile = (record, "sampling", profiler)
+                return
+            except ImportError:
+                print("   ⚠️  pyinstrument não instalado; perfil com cProfile")
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        self._profile = (record, "cprofile", profiler)
+
+    def _stop_profile(self):
+        record, kind, profiler = self._profile
+        self._profile = None
+        self.report_dir.mkdir(parents=True, exist_ok=True)
+        stem = self.report_dir / f"{self.name}_{self.run_id}_{_slug(record.name)}"
+        if kind == "sampling":
+            profiler.stop()
+            path = stem.with_suffix(".profile.txt")
+            path.write_text(profiler.output_text(unicode=True, show_all=False), encoding="utf-8")
+            self.profile_files.append(str(path))
+            return
+        import io
+        import pstats
+        profiler.disable()
+        profiler.dump_stats(stem.with_suffix(".prof"))
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        path = stem.with_suffix(".profile.txt")
+        path.write_text(text.getvalue(), encoding="utf-8")
+        self.profile_files += [str(stem.with_suffix(".prof")), str(path)]
+
+    # ------------------------------------------------------------------
+    # Notebook
+    # ------------------------------------------------------------------
+
+    def watch_ipython(self, ip, frame="df"):
+        """
+        Registra cada célula executada como uma etapa (nome = cabeçalho
+        'SEÇÃO ...' ou primeiro comentário da célula); rows_in/rows_out =
+        len(frame) no namespace do notebook antes/depois. O relatório é
+        regravado ao fim de cada célula. Um relatório anterior no mesmo shell
+        deixa de ser alimentado.
+        """
+        def rows():
+            value = ip.user_ns.get(frame)
+            return len(value) if hasattr(value, "__len__") else None
+
+        def pre(info=None):
+            cell = getattr(info, "raw_cell", "") or ""
+            self.start(_cell_title(cell), rows_in=rows())
+
+        def post(result=None):
+            if not self._stack:
+                return
+            error = getattr(result, "error_in_exec", None) if result is not None else None
+            self.stop(rows_out=rows(), status="error" if error else "ok",
+                      error=f"{type(error).__name__}: {error}" if error else None)
+            self.save(verbose=False)
+
+        for event, callback in _WATCHERS.pop(id(ip), ()):
+            ip.events.unregister(event, callback)
+        _WATCHERS[id(ip)] = [("pre_run_cell", pre), ("post_run_cell", post)]
+        for event, callback in _WATCHERS[id(ip)]:
+            ip.events.register(event, callback)
+        return self
+
+    # ------------------------------------------------------------------
+    # Saída
+    # ------------------------------------------------------------------
+
+    def to_frame(self):
+        return pd.DataFrame(self.stages, columns=STAGE_COLUMNS)
+
+    def to_dict(self):
+        self._absorb_peak()
+        return {
+            "name": self.name,
+            "run_id": self.run_id,
+            "started": self.started,
+            "updated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": self.commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.node(),
+            "cpu_count": os.cpu_count(),
+            "config": self.config,
+            "profile": {"stage": self.profile_stage, "profiler": self.profiler, "files": self.profile_files},
+            "totals": {
+                "wall_s": round(time.perf_counter() - self._t0, 4),
+                "cpu_s": round(_cpu_seconds() - self._cpu0, 4),
+                "peak_rss_mb": round(self._peak, 1),
+            },
+            "stages": self.stages,
+        }
+
+    def save(self, verbose=None):
+        """Grava <nome>_<run_id>.json e .csv em report_dir; devolve o caminho do JSON"""
+        self.report_dir.mkdir(parents=True, exist_ok=True)
+        path = self.report_dir / f"{self.name}_{self.run_id}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False, default=str)
+        frame = self.to_frame()
+        frame.insert(0, "run_id", self.run_id)
+        frame.insert(0, "run", self.name)
+        frame.to_csv(path.with_suffix(".csv"), index=False)
+        if self.verbose if verbose is None else verbose:
+            print(f"📋 Relatório de execução: {path}")
+        return path
+
+    def _finalize(self):
+        if not self._stack:
+            return
+        while self._stack:
+            self.stop(status="interrupted")
+        self.save()
+
+
+class _StageContext:
+    def __init__(self, report, name, rows_in):
+        self.report = report
+        self.name = name
+        self.rows_in = rows_in
+
+    def __enter__(self):
+        self.record = self.report.start(self.name, self.rows_in)
+        return self.record
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.report.stop()
+        else:
+            self.report.stop(status="error", error=f"{exc_type.__name__}: {exc}")
+            self.report.save()
+        return False
+
+
+def _slug(name):
+    return "".join(c if c.isalnum() else "_" for c in name.lower()).strip("_")[:40] or "stage"
+
+
+def _cell_title(cell):
+    """'SEÇÃO n: ...' do cabeçalho da célula, ou o primeiro comentário/linha"""
+    lines = [line.strip("# ").strip() for line in cell.strip().splitlines()]
+    lines = [line for line in lines if line and set(line) != {"="}]
+    for line in lines:
+        if line.upper().startswith("SEÇÃO"):
+            return line
+    return lines[0][:80] if lines else "célula vazia"
+
+
+# ==========================================
+# COMPARAÇÃO DE EXECUÇÕES
+# ==========================================
+
+def load_report(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def latest_reports(name, report_dir=REPORT_DIR, n=2):
+    """Caminhos das n últimas execuções com esse nome (mais antiga primeiro)"""
+    return sorted(Path(report_dir).glob(f"{name}_*.json"))[-n:]
+
+
+def compare_reports(base, new, ratio=REGRESSION_RATIO, min_seconds=REGRESSION_MIN_S):
+    """
+    Etapas de duas execuções lado a lado (caminhos ou dicts), na ordem da
+    referência. Etapas repetidas são pareadas pela ordem de ocorrência.
+    regression = tempo acima de ratio × a referência e min_seconds mais lento.
+    """
+    frames = []
+    for suffix, report in (("base", base), ("new", new)):
+        report = load_report(report) if isinstance(report, (str, Path)) else report
+        frame = pd.DataFrame(report["stages"], columns=STAGE_COLUMNS)
+        frame = frame.sort_values("start_s", kind="stable")
+        frame["occurrence"] = frame.groupby("stage").cumcount()
+        frame["order"] = range(len(frame))
+        frames.append(frame.set_index(["stage", "occurrence"])
+                      [["order", "wall_s", "cpu_s", "peak_rss_mb", "rows_out", "bytes_read", "bytes_written"]]
+                      .add_suffix(f"_{suffix}").reset_index())
+    diff = (frames[0].merge(frames[1], on=["stage", "occurrence"], how="outer")
+            .sort_values(["order_base", "order_new"]).drop(columns=["order_base", "order_new"])
+            .reset_index(drop=True))
+    diff["wall_ratio"] = diff["wall_s_new"] / diff["wall_s_base"]
+    diff["peak_rss_diff_mb"] = diff["peak_rss_mb_new"] - diff["peak_rss_mb_base"]
+    diff["rows_changed"] = diff["rows_out_new"].ne(diff["rows_out_base"]) & diff[["rows_out_base", "rows_out_new"]].notna().all(axis=1)
+    diff["regression"] = (diff["wall_ratio"] > ratio) & (diff["wall_s_new"] - diff["wall_s_base"] > min_seconds)
+    return diff
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if len(args) == 1:
+        args = latest_reports(args[0])
+    if len(args) != 2:
+        sys.exit("Uso: python pns_runreport.py <base.json> <nova.json> | <nome da execução>")
+    base, new = load_report(args[0]), load_report(args[1])
+    print(f"Base: {base['name']} {base['run_id']} ({base['commit']}) | "
+          f"Nova: {new['name']} {new['run_id']} ({new['commit']})")
+    print(f"Total: {base['totals']['wall_s']:.2f}s → {new['totals']['wall_s']:.2f}s, "
+          f"pico {base['totals']['peak_rss_mb']:.0f} → {new['totals']['peak_rss_mb']:.0f} MB\n")
+    diff = compare_reports(base, new)
+    with pd.option_context("display.width", 200, "display.max_columns", 20, "display.max_rows", 200):
+        print(diff[["stage", "wall_s_base", "wall_s_new", "wall_ratio", "peak_rss_mb_base", "peak_rss_mb_new",
+                    "rows_out_base", "rows_out_new", "regression"]].round(3).to_string(index=False))
@@ -0,0 +1,368 @@
+"""
+Gerador de microdados sintéticos da PNS 2019 em largura fixa.
+
+Os registros seguem o layout de input_PNS_2019.sas (mesmas posições, LRECL e
+terminador de linha) e a estrutura do desenho: UF → estrato → UPA →
+domicílio → morador, com um morador selecionado (15+) por domicílio, pesos
+de domicílio (V0028) e do morador selecionado (V00291) coerentes com a
+população de cada UF, e campos dos módulos individuais preenchidos só para o
+selecionado. Os códigos das variáveis categóricas saem dos conjuntos de
+MAPPINGS do ETL (lidos de pns_2019_pandas.py sem executá-lo) e as
+prevalências variam com idade, sexo, escolaridade e renda.
+
+A escala é relativa ao arquivo original (BASE_RECORDS registros): 1, 10 ou
+100 geram 1×, 10× ou 100× o volume. O arquivo é escrito em blocos de UPAs,
+com memória limitada pelo tamanho do bloco; o mesmo (seed, escala) sempre
+gera os mesmos bytes.
+"""
+
+import ast
+from pathlib import Path
+
+import numpy as np
+
+from aai_stats import make_rng
+from pns_layout import load_layout
+
+# Registros do PNS_2019.txt original
+BASE_RECORDS = 293_726
+
+# Caminhos (relativos a scripts/, como nos ETLs)
+SAS_FILE = "../data/raw/input_PNS_2019.sas"
+LAYOUT_CACHE_DIR = "../data/processed"
+ETL_SCRIPT = Path(__file__).with_name("pns_2019_pandas.py")
+SYNTH_DIR = "../data/synthetic"
+SCALES = [1]
+SEED = 2019
+
+# Estrutura do desenho
+HOUSEHOLDS_PER_UPA = 15
+UPAS_PER_STRATUM = 8
+UPAS_PER_BLOCK = 1000
+
+# População residente por UF em 2019 (milhões, projeção IBGE); a amostra é
+# alocada por raiz da população (UFs pequenas sobre-representadas)
+UF_POPULATION = {
+    "11": 1.78, "12": 0.88, "13": 4.14, "14": 0.61, "15": 8.60, "16": 0.85, "17": 1.57,
+    "21": 7.08, "22": 3.27, "23": 9.13, "24": 3.51, "25": 4.02, "26": 9.56, "27": 3.34, "28": 2.30, "29": 14.87,
+    "31": 21.17, "32": 4.02, "33": 17.26, "35": 45.92,
+    "41": 11.43, "42": 7.16, "43": 11.38,
+    "50": 2.78, "51": 3.48, "52": 7.02, "53": 3.02,
+}
+# Renda relativa por região (1º dígito da UF)
+REGION_INCOME = {"1": 0.75, "2": 0.65, "3": 1.2, "4": 1.2, "5": 1.1}
+
+
+def script_constants(path, *names):
+    """Lê constantes literais (ex.: MAPPINGS) de um script sem executá-lo"""
+    tree = ast.parse(Path(path).read_text(encoding="utf-8"))
+    found = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and target.id in names:
+                    found[target.id] = ast.literal_eval(node.value)
+    missing = set(names) - set(found)
+    if missing:
+        raise KeyError(f"Constantes ausentes em {path}: {sorted(missing)}")
+    return [found[name] for name in names]
+
+
+def _normalize(code):
+    """Mesma normalização de código do map_categorical do ETL"""
+    code = str(code).strip().split(".")[0].lstrip("0")
+    return code or "0"
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _yes_no(rng, p):
+    """1 (Sim) com probabilidade p, senão 2 (Não)"""
+    return np.where(rng.random(len(p)) < p, 1, 2)
+
+
+def _choice(rng, codes, probs, n):
+    return np.asarray(codes)[rng.choice(len(codes), size=n, p=np.asarray(probs) / np.sum(probs))]
+
+
+# ==========================================
+# ESTRUTURA (UPAs E MORADORES)
+# ==========================================
+
+def allocate(scale):
+    """Registros por UF: BASE_RECORDS × escala, alocados por raiz da população"""
+    total = int(round(BASE_RECORDS * scale))
+    share = np.sqrt(np.array(list(UF_POPULATION.values())))
+    counts = np.floor(total * share / share.sum()).astype(np.int64)
+    counts[np.argsort(-share)[:total - counts.sum()]] += 1
+    return dict(zip(UF_POPULATION, counts))
+
+
+def _households(rng, n_upa):
+    """Tamanho de cada domicílio e UPA a que pertence"""
+    per_upa = 1 + rng.poisson(HOUSEHOLDS_PER_UPA - 1, n_upa)
+    upa_of = np.repeat(np.arange(n_upa), per_upa)
+    size = np.minimum(1 + rng.poisson(1.9, len(upa_of)), 12)
+    return upa_of, size
+
+
+def _people(rng, size):
+    """Idade, sexo e condição no domicílio (1 responsável, 2 cônjuge, 3 filho, 4 outro parente)"""
+    hh = np.repeat(np.arange(len(size)), size)
+    order = np.arange(len(hh)) - np.repeat(np.cumsum(size) - size, size)
+    ref_age = np.clip(rng.normal(50, 16, len(size)), 18, 100)[hh]
+
+    relation = np.select([order == 0, order == 1], [1, 2], default=3)
+    relation = np.where((order >= 2) & (rng.random(len(hh)) < 0.1), 4, relation)
+    age = np.select(
+        [relation == 1, relation == 2, relation == 3],
+        [ref_age, ref_age + rng.normal(-2, 5, len(hh)), ref_age - rng.uniform(18, 40, len(hh))],
+        default=ref_age + rng.uniform(20, 30, len(hh)),
+    )
+    age = np.where(age < 0, rng.integers(0, 11, len(hh)), age)
+    age = np.clip(np.round(age), 0, 105).astype(np.int64)
+
+    ref_sex = rng.integers(1, 3, len(size))[hh]
+    sex = np.where(relation == 2, 3 - ref_sex, rng.choice([1, 2], len(hh), p=[0.48, 0.52]))
+    sex = np.where(relation == 1, ref_sex, sex)
+    return hh, order, relation, age, sex
+
+
+def _selected(rng, hh, age, n_households):
+    """Um morador de 15+ sorteado por domicílio"""
+    key = np.where(age >= 15, rng.random(len(hh)), -1.0)
+    best = np.full(n_households, -1.0)
+    np.maximum.at(best, hh, key)
+    return (key >= 0) & (key == best[hh])
+
+
+# ==========================================
+# VARIÁVEIS
+# ==========================================
+
+def _variables(rng, uf, upa_codes, strata, urban, metro, upa_weight, upa_of, size, scale_income):
+    """
+    Valores por código PNS para um bloco de UPAs de uma UF. Retorna
+    {código: array}; NaN (ou None em texto) = campo em branco.
+    """
+    n_hh = len(size)
+    hh, order, relation, age, sex = _people(rng, size)
+    n = len(hh)
+    upa = upa_of[hh]
+    selected = _selected(rng, hh, age, n_hh)
+    adults = np.bincount(hh, weights=age >= 15, minlength=n_hh)
+    elderly = age >= 60
+
+    educ = np.clip(np.round(rng.normal(11.5 - 0.09 * np.maximum(age - 30, 0), 4)), 0, 16)
+    educ = np.where(age < 5, np.nan, np.minimum(educ, np.maximum(age - 5, 0)))
+    educ_hh = np.nan_to_num(np.bincount(hh, weights=np.nan_to_num(educ), minlength=n_hh) / size)
+    income = np.round(np.exp(rng.normal(np.log(1100 * scale_income) + 0.08 * (educ_hh - 8), 0.8, n_hh)))
+    income = np.where(rng.random(n_hh) < 0.03, 0, income)[hh]
+
+    def sel(values, extra=None):
+        """Campo do morador selecionado (em branco para os demais)"""
+        mask = selected if extra is None else selected & extra
+        return np.where(mask, values, np.nan)
+
+    a = age.astype(np.float64)
+    female = sex == 2
+    difficulty_p = _sigmoid(-9 + 0.09 * a)
+
+    def difficulty():
+        level = _choice(rng, [2, 3, 4], [0.6, 0.25, 0.15], n)
+        return sel(np.where(rng.random(n) < difficulty_p, level, 1), elderly)
+
+    # Autoavaliação 1..5 piorando com a idade (sorteio por limiares acumulados)
+    health_shift = np.clip((a - 40) / 60, 0, 1)
+    cuts = np.column_stack([0.12 - 0.08 * health_shift, 0.60 - 0.28 * health_shift,
+                            0.90 - 0.10 * health_shift, 0.97 - 0.03 * health_shift])
+    self_rated = 1 + (rng.random(n)[:, None] > cuts).sum(axis=1)
+
+    dv = {
+        "V0001": np.full(n, uf),
+        "V0024": strata[upa],
+        "UPA_PNS": upa_codes[upa],
+        "V0006_PNS": np.concatenate([np.arange(1, c + 1) for c in np.bincount(upa_of, minlength=len(upa_codes))])[hh],
+        "V0015": np.full(n, 1),
+        "V0020": np.full(n, 2019),
+        "V0022": size[hh],
+        "V0026": urban[upa],
+        "V0031": metro[upa],
+        "C00301": order + 1,
+        "C004": relation,
+        "C006": sex,
+        "C008": age,
+        "C009": _choice(rng, [1, 2, 3, 4, 5], [0.43, 0.10, 0.01, 0.45, 0.01], n),
+        "C011": np.where(age < 14, np.nan, np.where(rng.random(n) < np.where(elderly, 0.2, 0.6), 1,
+                                                    _choice(rng, [2, 3], [0.1, 0.9], n))),
+        "D00901": educ,
+        "E01602": np.where(age < 14, np.nan, income),
+        "I00101": _yes_no(rng, np.clip(0.1 + 0.00012 * income, 0, 0.9)),
+        "J001": _choice(rng, [1, 2], [0.76, 0.24], n),
+        "J01101": _choice(rng, [1, 2], [0.07, 0.93], n),
+        "J026": _yes_no(rng, np.full(n, 0.7)),
+        "V0028": upa_weight[upa] * np.exp(rng.normal(0, 0.1, n)),
+        "V00291": sel(upa_weight[upa] * adults[hh] * np.exp(rng.normal(0, 0.3, n))),
+        "K001": difficulty(),
+        "K004": difficulty(),
+        "K010": difficulty(),
+        "K022": difficulty(),
+        "K031": difficulty(),
+        "K05401": sel(_yes_no(rng, np.full(n, 0.15)), elderly),
+        "M001": sel(_yes_no(rng, _sigmoid(3.5 - 0.07 * a + 0.15 * np.nan_to_num(educ)))),
+        "M011011": sel(_yes_no(rng, _sigmoid(5 - 0.06 * a + 0.1 * np.nan_to_num(educ)))),
+        "N001": sel(_yes_no(rng, np.where(female, 0.14, 0.06))),
+        "O00101": sel(_yes_no(rng, np.where(elderly, 0.75, 0.3))),
+        "P00102": sel(self_rated),
+        "P00103": sel(np.clip(np.round(rng.normal(np.where(female, 66, 76), 13)), 35, 180)),
+        "P00403": sel(np.clip(np.round(rng.normal(np.where(female, 158, 171), 7)), 130, 205)),
+        "P034": sel(_yes_no(rng, np.full(n, 0.3))),
+        "P050": sel(_choice(rng, [1, 2, 3], [0.12, 0.6, 0.28], n)),
+        "Q00201": sel(_yes_no(rng, _sigmoid(-4.2 + 0.065 * a))),
+        "Q03001": sel(_yes_no(rng, _sigmoid(-5.3 + 0.055 * a))),
+        "Q060": sel(_yes_no(rng, _sigmoid(-6.2 + 0.06 * a))),
+        "Q06207": sel(_yes_no(rng, _sigmoid(-7.5 + 0.065 * a))),
+        "Q092": sel(_yes_no(rng, np.full(n, 0.05))),
+        "Q11201": sel(_yes_no(rng, _sigmoid(-7 + 0.06 * a))),
+        "R002010": sel(np.minimum(rng.poisson(0.3 + 0.05 * np.maximum(a - 40, 0)), 20)),
+    }
+    any_adl = np.column_stack([dv[c] > 1 for c in ("K001", "K004", "K010")]).any(axis=1)
+    any_iadl = np.column_stack([dv[c] > 1 for c in ("K022", "K031")]).any(axis=1)
+    dv["K01901"] = sel(np.where(any_adl & (rng.random(n) < 0.6), 1, 2), elderly)
+    dv["K03401"] = sel(np.where(any_iadl & (rng.random(n) < 0.6), 1, 2), elderly)
+    return dv
+
+
+def check_codes(values, desired_columns, mappings):
+    """Códigos gerados fora dos conjuntos de MAPPINGS -> {coluna: códigos}"""
+    bad = {}
+    for code, column in desired_columns.items():
+        if code in values and column in mappings:
+            v = np.asarray(values[code], dtype=object)
+            uniques = {_normalize(int(x) if isinstance(x, float) else x) for x in set(v.tolist())
+                       if not (isinstance(x, float) and np.isnan(x))}
+            extra = uniques - set(mappings[column])
+            if extra:
+                bad[column] = sorted(extra)
+    return bad
+
+
+# ==========================================
+# CODIFICAÇÃO EM LARGURA FIXA
+# ==========================================
+
+def _digits(values, width):
+    """Inteiros não negativos -> dígitos ASCII com zeros à esquerda (n, largura)"""
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    return ((values[:, None] // powers) % 10 + 48).astype(np.uint8)
+
+
+def encode_field(values, width, decimals=0):
+    """
+    Valores -> bytes (n, largura): números com zeros à esquerda, com ponto
+    quando há decimais (casas reduzidas no bloco se a parte inteira não
+    couber), NaN em branco.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    filled = np.where(missing, 0.0, np.abs(values))
+    int_digits = len(str(int(filled.max()))) if len(filled) else 1
+    places = min(decimals, width - 1 - int_digits) if decimals else 0
+
+    if places > 0:
+        scaled = np.round(filled * 10 ** places).astype(np.int64)
+        out = np.empty((len(values), width), dtype=np.uint8)
+        out[:, :width - places - 1] = _digits(scaled // 10 ** places, width - places - 1)
+        out[:, width - places - 1] = ord(".")
+        out[:, width - places:] = _digits(scaled % 10 ** places, places)
+    else:
+        out = _digits(np.round(filled).astype(np.int64), width)
+    out[missing] = ord(" ")
+    return out
+
+
+def encode_records(values, layout):
+    """{código: valores} -> matriz de registros (n, LRECL) com campos ausentes em branco"""
+    n = len(next(iter(values.values())))
+    records = np.full((n, layout.record_length), ord(" "), dtype=np.uint8)
+    for code, column in values.items():
+        if code not in layout:
+            continue
+        var = layout[code]
+        decimals = var.decimals if var.type == "num" else 0
+        records[:, var.offset:var.offset + var.width] = encode_field(column, var.width, decimals)
+    return records
+
+
+# ==========================================
+# GERAÇÃO
+# ==========================================
+
+def generate(path, scale=1.0, seed=SEED, sas_file=SAS_FILE, layout_cache_dir=LAYOUT_CACHE_DIR,
+             newline=b"\n", verbose=True):
+    """Grava o arquivo sintético em `path` e devolve o número de registros"""
+    layout = load_layout(sas_file, cache_dir=layout_cache_dir)
+    desired_columns, mappings = script_constants(ETL_SCRIPT, "DESIRED_COLUMNS", "MAPPINGS")
+    mappings = {col: {_normalize(k) for k in m} for col, m in mappings.items()}
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    total = 0
+    with open(path, "wb") as f:
+        for uf_index, (uf, n_uf) in enumerate(allocate(scale).items()):
+            rng = make_rng(seed, "synth", uf)
+            persons_per_upa = HOUSEHOLDS_PER_UPA * 2.9
+            n_upa = max(1, int(np.ceil(n_uf / persons_per_upa * 1.25)) + 2)
+            n_strata = max(1, n_upa // UPAS_PER_STRATUM)
+            n_mun = max(1, min(int(5570 * UF_POPULATION[uf] / sum(UF_POPULATION.values())), n_upa // 3))
+
+            stratum = np.sort(rng.integers(0, n_strata, n_upa))
+            municipality = np.sort(rng.integers(1, n_mun + 1, n_upa))
+            seq = np.arange(n_upa) - np.searchsorted(municipality, municipality)
+            upa_codes = np.array([f"{uf}{m:04d}{s % 1000:03d}" for m, s in zip(municipality, seq)])
+            strata = np.array([f"{uf}{s + 1:05d}" for s in stratum])
+            urban = np.where(rng.random(n_upa) < 0.85, 1, 2)
+            metro = _choice(rng, [1, 2, 4], [0.25, 0.15, 0.6], n_upa)
+            design_weight = UF_POPULATION[uf] * 1e6 / n_uf
+            upa_weight = design_weight * np.exp(rng.normal(0, 0.25, n_upa))
+            income_factor = REGION_INCOME[uf[0]] * (1.4 if uf == "53" else 1.0)
+
+            written = 0
+            for start in range(0, n_upa, UPAS_PER_BLOCK):
+                if written >= n_uf:
+                    break
+                block = slice(start, min(start + UPAS_PER_BLOCK, n_upa))
+                n_block = block.stop - block.start
+                upa_of, size = _households(rng, n_block)
+                values = _variables(rng, uf, upa_codes[block], strata[block], urban[block], metro[block],
+                                    upa_weight[block], upa_of, size, income_factor)
+                if start == 0 and uf_index == 0:
+                    bad = check_codes(values, desired_columns, mappings)
+                    if bad:
+                        raise ValueError(f"Códigos fora de MAPPINGS: {bad}")
+                records = encode_records(values, layout)[:n_uf - written]
+                lines = np.empty((len(records), layout.record_length + len(newline)), dtype=np.uint8)
+                lines[:, :layout.record_length] = records
+                lines[:, layout.record_length:] = np.frombuffer(newline, dtype=np.uint8)
+                f.write(lines.tobytes())
+                written += len(records)
+            if written < n_uf:
+                raise RuntimeError(f"UF {uf}: {written} de {n_uf} registros gerados")
+            total += written
+            if verbose:
+                print(f"   UF {uf}: {written:,} registros")
+    if verbose:
+        print(f"OK {total:,} registros sintéticos em {path}")
+    return total
+
+
+def synthetic_path(scale, synth_dir=SYNTH_DIR, seed=SEED):
+    scale_label = f"{scale:g}".replace(".", "_")
+    return Path(synth_dir) / f"PNS_2019_synth_x{scale_label}_s{seed}.txt"
+
+
+if __name__ == "__main__":
+    for scale in SCALES:
+        generate(synthetic_path(scale), scale)
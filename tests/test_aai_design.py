@@ -0,0 +1,98 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from aai_design import SurveyDesign
+
+
+def _design(n=600, seed=4):
+    rng = np.random.default_rng(seed)
+    strata = rng.choice(["1", "10", "2", "7"], n)
+    psu = rng.integers(0, 12, n).astype(str)
+    strata[psu == "11"] = "99"  # estrato com uma só UPA
+    psu[strata == "99"] = "11"
+    return strata, psu, rng.uniform(50, 500, n), rng.normal(size=n)
+
+
+def _factors(design, weights):
+    return np.asarray(design.replicates, dtype=np.float64) / weights[:, None]
+
+
+def test_rao_wu_replicates(tmp_path):
+    strata, psu, w, _ = _design()
+    design = SurveyDesign.build(strata, psu, w, tmp_path / "boot", n_replicates=30, seed=1)
+    factors = _factors(design, w)
+
+    assert design.n_replicates == 30
+    for s in np.unique(strata):
+        rows = strata == s
+        per_psu = {p: factors[rows & (psu == p)] for p in np.unique(psu[rows])}
+        # Mesmo fator para todas as linhas de uma UPA
+        for block in per_psu.values():
+            np.testing.assert_allclose(block, np.broadcast_to(block[0], block.shape), rtol=1e-6)
+        if len(per_psu) == 1:
+            np.testing.assert_allclose(factors[rows], 1.0, rtol=1e-6)
+        else:
+            # m_h = n_h - 1 sorteios × n_h/(n_h-1): soma dos fatores das UPAs = n_h
+            total = sum(block[0] for block in per_psu.values())
+            np.testing.assert_allclose(total, len(per_psu), rtol=1e-5)
+
+
+def test_jkn_replicates_and_variance(tmp_path):
+    strata, psu, w, y = _design()
+    design = SurveyDesign.build(strata, psu, w, tmp_path / "jkn", method="jkn")
+    factors = _factors(design, w)
+
+    units = sorted({(s, p) for s, p in zip(strata, psu) if s != "99"})
+    assert design.n_replicates == len(units)
+    np.testing.assert_allclose(factors[strata == "99"], 1.0, rtol=1e-6)
+
+    # Variância JKn calculada UPA a UPA, sem a matriz gravada
+    theta = (w * y).sum() / w.sum()
+    variance = 0.0
+    for s, p in units:
+        n_h = len({q for t, q in units if t == s})
+        wr = np.where(strata == s, w * n_h / (n_h - 1), w)
+        wr[(strata == s) & (psu == p)] = 0.0
+        variance += (n_h - 1) / n_h * ((wr * y).sum() / wr.sum() - theta) ** 2
+
+    estimate, se, _, _ = design.mean(y)
+    assert estimate == pytest.approx(theta)
+    assert se ** 2 == pytest.approx(variance, rel=1e-4)
+
+
+def test_jk1_drops_one_group(tmp_path):
+    strata, psu, w, _ = _design()
+    design = SurveyDesign.build(strata, psu, w, tmp_path / "jk1", method="jk1", n_replicates=5, seed=1)
+    factors = _factors(design, w)
+    assert ((factors == 0).any(axis=1)).all()
+    assert ((factors == 0).sum(axis=1) == 1).all()
+    np.testing.assert_allclose(factors[factors > 0], 5 / 4, rtol=1e-6)
+
+
+def test_load_or_build_reuses_matrix(tmp_path, monkeypatch):
+    strata, psu, w, _ = _design()
+    data = pd.DataFrame({"estrato": strata, "upa": psu, "peso": w})
+    first = SurveyDesign.load_or_build(data, "estrato", "upa", "peso", tmp_path / "rep", n_replicates=20, seed=3)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("matriz reconstruída")
+    monkeypatch.setattr(SurveyDesign, "build", fail)
+    again = SurveyDesign.load_or_build(data, "estrato", "upa", "peso", tmp_path / "rep", n_replicates=20, seed=3)
+    np.testing.assert_array_equal(again.replicates, first.replicates)
+    assert again.cache_key == first.cache_key
+
+    # Outra semente muda a chave: reconstrói
+    with pytest.raises(AssertionError):
+        SurveyDesign.load_or_build(data, "estrato", "upa", "peso", tmp_path / "rep", n_replicates=20, seed=4)
+
+
+def test_build_refuses_oversized_matrix(tmp_path):
+    strata, psu, w, _ = _design()
+    with pytest.raises(ValueError):
+        SurveyDesign.build(strata, psu, w, tmp_path / "big", method="jkn", max_bytes=1024)
+    assert not (tmp_path / "big.npy").exists()
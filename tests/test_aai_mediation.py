@@ -0,0 +1,91 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from aai_design import SurveyDesign
+from aai_mediation import mediation
+from aai_stats import bootstrap_counts, make_rng
+
+
+def _data(n=500, seed=11):
+    rng = np.random.default_rng(seed)
+    idade = rng.uniform(60, 90, n)
+    x = rng.binomial(1, 0.4, n).astype(float)
+    x2 = rng.normal(size=n)
+    m = 0.6 * x + 0.3 * x2 + 0.01 * idade + rng.normal(0, 1, n)
+    y = 0.2 * x + 0.5 * m - 0.02 * idade + rng.normal(0, 1, n)
+    data = pd.DataFrame({"x": x, "x2": x2, "m": m, "y": y, "idade": idade, "peso": rng.uniform(0.5, 3.0, n)})
+    data.loc[rng.random(n) < 0.05, "m"] = np.nan
+    data.loc[rng.random(n) < 0.05, "x2"] = np.nan
+    return data
+
+
+def _wls(X, y, w):
+    sw = np.sqrt(w)
+    return np.linalg.lstsq(X * sw[:, None], y * sw, rcond=None)[0]
+
+
+def _effects(data, x, m, w, covariates=("idade",)):
+    """Os três modelos ajustados separadamente (linhas completas do par)"""
+    cols = [x, *covariates, m, "y"]
+    rows = data[cols].notna().all(axis=1).to_numpy() & (w > 0)
+    d, w = data[rows], w[rows]
+    base = np.column_stack([np.ones(len(d)), d[[x, *covariates]].to_numpy()])
+    total = _wls(base, d["y"].to_numpy(), w)[1]
+    a = _wls(base, d[m].to_numpy(), w)[1]
+    coef = _wls(np.column_stack([base, d[m].to_numpy()]), d["y"].to_numpy(), w)
+    return total, coef[1], a * coef[-1]
+
+
+def test_point_estimates_match_separate_fits():
+    data = _data()
+    result = mediation(data, [("x", "m"), ("x2", "m")], "y", "peso", covariates=["idade"], n_boot=20, seed=1)
+
+    for row in result.itertuples():
+        total, direct, indirect = _effects(data, row.x, row.mediator, data["peso"].to_numpy())
+        assert row.total == pytest.approx(total)
+        assert row.direct == pytest.approx(direct)
+        assert row.indirect == pytest.approx(indirect)
+        assert row.indirect == pytest.approx(row.a * row.b)
+        assert row.proportion_mediated == pytest.approx(indirect / total)
+        assert row.n == data[[row.x, "idade", row.mediator, "y"]].notna().all(axis=1).sum()
+
+
+def test_bootstrap_ci_matches_replicate_loop():
+    data = _data()
+    n_boot = 60
+    result = mediation(data, [("x", "m")], "y", "peso", covariates=["idade"], n_boot=n_boot, seed=3)
+
+    w = data["peso"].to_numpy()
+    counts = np.vstack(list(bootstrap_counts(len(data), n_boot, make_rng(3, "mediation"))))
+    indirect = np.array([_effects(data, "x", "m", c * w)[2] for c in counts])
+    lower, upper = np.percentile(indirect, [2.5, 97.5])
+    assert result.loc[0, "indirect_lower"] == pytest.approx(lower)
+    assert result.loc[0, "indirect_upper"] == pytest.approx(upper)
+    assert result.loc[0, "indirect_se"] == pytest.approx(indirect.std(ddof=1))
+
+    # Blocos de réplicas menores não mudam o resultado
+    small = mediation(data, [("x", "m")], "y", "peso", covariates=["idade"], n_boot=n_boot, seed=3, batch_size=7)
+    pd.testing.assert_frame_equal(small, result)
+
+
+def test_design_standard_errors(tmp_path):
+    data = _data()
+    rng = np.random.default_rng(2)
+    design = SurveyDesign.build(rng.integers(0, 4, len(data)), rng.integers(0, 6, len(data)),
+                                data["peso"].to_numpy(), tmp_path / "design", method="jkn")
+    result = mediation(data, [("x", "m")], "y", "peso", covariates=["idade"], design=design)
+
+    replicates = np.asarray(design.replicates, dtype=np.float64)
+    reps = np.array([_effects(data, "x", "m", replicates[:, r]) for r in range(design.n_replicates)])
+    point = np.array(_effects(data, "x", "m", data["peso"].to_numpy()))
+    se = np.sqrt(design.variance(point, reps.T))
+    np.testing.assert_allclose(result.loc[0, ["total_se", "direct_se", "indirect_se"]].to_numpy(float), se,
+                               rtol=1e-5)
+
+    with pytest.raises(ValueError):
+        mediation(data.iloc[:-1], [("x", "m")], "y", "peso", design=design)
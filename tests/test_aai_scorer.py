@@ -0,0 +1,88 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from aai_scorer import AAIScorer, ADL_COLS, BINARY_COLS, CHRONIC_COLS, IADL_COLS, IMPUTE_COLS
+
+
+def _records(n=400, seed=7):
+    """Registros do ETL (códigos PNS) antes dos mapeamentos categóricos"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "idade": rng.integers(60, 95, n).astype(float),
+        "anos_estudo": rng.integers(0, 17, n).astype(float),
+        "renda_percapita": rng.gamma(2.0, 800.0, n),
+        "num_medicamentos": rng.integers(0, 8, n).astype(float),
+        "peso_real": rng.normal(70, 12, n),
+        "altura": rng.normal(162, 9, n),
+        "autoavaliacao_saude": rng.integers(1, 6, n).astype(float),
+    })
+    for col in BINARY_COLS:
+        df[col] = rng.choice([1.0, 2.0], n)
+    for col in ADL_COLS + IADL_COLS:
+        df[col] = rng.choice([0.0, 1.0], n, p=[0.85, 0.15])
+    # Faltantes como nos microdados
+    for col in ["anos_estudo", "renda_percapita", "num_medicamentos", "altura", "peso_real"]:
+        df.loc[rng.random(n) < 0.05, col] = np.nan
+    return df
+
+
+def _baseline_etl(df):
+    """Derivações do ETL original + AAI_total do notebook (domínios disponíveis após o ETL)"""
+    df = df.copy()
+    df["altura"] = df["altura"] / 100
+    df["imc"] = df["peso_real"] / (df["altura"] ** 2)
+    df["imc"] = df["imc"].fillna(df["imc"].median())
+    for col in BINARY_COLS + ADL_COLS + IADL_COLS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(int)
+    df["multimorbidity_count"] = df[CHRONIC_COLS].sum(axis=1)
+    df["functional_raw"] = df[ADL_COLS].sum(axis=1) + df[IADL_COLS].sum(axis=1)
+    df["functional_score"] = 1 - (df["functional_raw"] / (df["functional_raw"].max() or 1))
+    z = {}
+    for col in ["autoavaliacao_saude", "multimorbidity_count", "functional_score"]:
+        z[col] = (df[col].astype(float) - df[col].mean()) / df[col].std(ddof=0)
+    raw = -0.5 * z["autoavaliacao_saude"] - 0.7 * z["multimorbidity_count"] + 1.2 * z["functional_score"]
+    df["health_score"] = (raw - raw.min()) / (raw.max() - raw.min() + 1e-9)
+    for col in IMPUTE_COLS:
+        df[col] = df[col].fillna(df[col].median())
+    df["AAI_total"] = df[["health_score", "functional_score"]].mean(axis=1)
+    return df
+
+
+def test_scorer_reproduces_baseline():
+    data = _records()
+    expected = _baseline_etl(data)
+    scored = AAIScorer().fit_transform(data)
+
+    for col in ["imc", "functional_score", "health_score", "AAI_total"] + IMPUTE_COLS:
+        np.testing.assert_allclose(scored[col].to_numpy(float), expected[col].to_numpy(float), rtol=1e-12, err_msg=col)
+    assert scored["AAI_total"].between(0, 1).all()
+
+
+def test_batches_match_full_transform():
+    data = _records()
+    scorer = AAIScorer().fit(data)
+    full = scorer.transform(data)
+    chunks = pd.concat(scorer.transform_batches(data.iloc[i:i + 37] for i in range(0, len(data), 37)))
+
+    pd.testing.assert_frame_equal(chunks, full)
+
+
+def test_altura_already_in_metres(tmp_path):
+    data = _records()
+    scorer = AAIScorer().fit(data)
+    scored = scorer.transform(data)
+
+    # Reaplicar sobre um frame já processado (altura em metros) não muda o IMC
+    again = AAIScorer.load(scorer.save(tmp_path / "scorer.json")).transform(scored)
+    np.testing.assert_allclose(again["imc"], scored["imc"])
+    np.testing.assert_allclose(again["AAI_total"], scored["AAI_total"])
+
+
+def test_transform_requires_fit():
+    with pytest.raises(ValueError):
+        AAIScorer().transform(_records(10))
@@ -0,0 +1,103 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from aai_stats import (bootstrap_counts, grouped_bootstrap_ci, grouped_weighted_quantiles, make_rng,
+                       replicate_estimates, weighted_bootstrap_ci, weighted_quantiles)
+
+
+@pytest.mark.parametrize("method", ["linear", "inverted_cdf"])
+def test_grouped_quantiles_empty_groups(method):
+    # Último grupo (e um do meio) sem valores válidos: NaN nessas linhas
+    codes = np.array([0, 0, 0, 1, 1, 2, 2, 3, 3])
+    values = np.array([1.0, 2.0, 3.0, np.nan, np.nan, 5.0, 4.0, np.nan, np.nan])
+    w = np.array([1.0, 2.0, 1.0, 1.0, 1.0, 3.0, 1.0, 1.0, 1.0])
+    q = [0.25, 0.5, 0.75]
+
+    groups, result = grouped_weighted_quantiles(codes, values, w, q, method=method)
+
+    assert groups.tolist() == [0, 1, 2, 3]
+    assert np.isnan(result[[1, 3]]).all()
+    for g in (0, 2):
+        rows = codes == g
+        np.testing.assert_allclose(result[g], weighted_quantiles(values[rows], w[rows], q, method=method))
+
+
+def test_grouped_quantiles_all_missing():
+    groups, result = grouped_weighted_quantiles(np.array([0, 0, 1, 1, 1]), np.full(5, np.nan), np.ones(5), [0.5])
+    assert groups.tolist() == [0, 1]
+    assert np.isnan(result).all()
+
+
+def test_grouped_quantiles_reported_case():
+    _, result = grouped_weighted_quantiles(np.array([0, 0, 0, 1, 1]), np.array([1.0, 2.0, 3.0, np.nan, np.nan]),
+                                           np.ones(5), [0.5])
+    assert result[0, 0] == 2.0
+    assert np.isnan(result[1, 0])
+
+
+def _sample(n=300, seed=3):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0.5, 0.2, n), rng.uniform(0.5, 3.0, n)
+
+
+def test_bootstrap_counts_are_resamples():
+    batches = list(bootstrap_counts(50, 23, make_rng(1, "counts"), batch_size=10))
+    assert [len(b) for b in batches] == [10, 10, 3]
+    counts = np.vstack(batches)
+    assert (counts.sum(axis=1) == 50).all()
+    assert (counts == np.round(counts)).all() and (counts >= 0).all()
+
+
+def test_replicates_match_resampling_loop():
+    y, w = _sample()
+    n_boot = 40
+    # Mesmo fluxo de índices que o laço original (reamostrar n com reposição por réplica)
+    idx = make_rng(7, "loop").integers(0, len(y), size=(n_boot, len(y)))
+    expected = [(w[i] * y[i]).sum() / w[i].sum() for i in idx]
+
+    estimates = replicate_estimates(y, w, n_boot=n_boot, rng=make_rng(7, "loop"))
+    np.testing.assert_allclose(estimates, expected, rtol=1e-12)
+    # Blocos menores consomem o mesmo fluxo
+    np.testing.assert_allclose(replicate_estimates(y, w, n_boot=n_boot, rng=make_rng(7, "loop"), batch_size=6),
+                               estimates, rtol=1e-12)
+
+
+def test_weighted_bootstrap_ci():
+    y, w = _sample()
+    point, lower, upper = weighted_bootstrap_ci(y, w, n_boot=200, rng=make_rng(1, "ci"))
+    assert point == pytest.approx((w * y).sum() / w.sum())
+    assert lower < point < upper
+
+    # Razão com denominador 1 é a média
+    ratio = weighted_bootstrap_ci(y, w, x=np.ones_like(y), statistic="ratio", n_boot=200, rng=make_rng(1, "ci"))
+    np.testing.assert_allclose(ratio, (point, lower, upper))
+    with pytest.raises(ValueError):
+        weighted_bootstrap_ci(y, w, statistic="ratio")
+
+
+def test_grouped_bootstrap_ci():
+    rng = np.random.default_rng(5)
+    codes = rng.integers(1, 40, 4000)
+    codes[:5] = 0  # grupo pequeno: sem IC
+    y, w = rng.random(4000), rng.uniform(0.5, 2.0, 4000)
+    y[::17] = np.nan
+
+    groups, sizes, point, lower, upper = grouped_bootstrap_ci(codes, y, w, n_boot=100, seed=2, min_n=10,
+                                                              block_groups=8)
+    valid = ~np.isnan(y)
+    for i, g in enumerate(groups):
+        rows = valid & (codes == g)
+        assert sizes[i] == rows.sum()
+        assert point[i] == pytest.approx((w[rows] * y[rows]).sum() / w[rows].sum())
+    small = sizes < 10
+    assert small.any() and np.isnan(lower[small]).all() and np.isnan(upper[small]).all()
+    assert ((lower[~small] <= point[~small]) & (point[~small] <= upper[~small])).all()
+
+    # Cada bloco de grupos tem seu próprio fluxo: o resultado não depende de n_jobs
+    parallel = grouped_bootstrap_ci(codes, y, w, n_boot=100, seed=2, min_n=10, block_groups=8, n_jobs=2)
+    for a, b in zip(parallel, (groups, sizes, point, lower, upper)):
+        np.testing.assert_array_equal(a, b)
@@ -0,0 +1,73 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from pns_fwf import (RECORD_LENGTH, decode_numeric, decode_text, extract_columns, iter_chunks,
+                     min_age_predicate, open_records)
+
+POSITIONS = {"V0001": (0, 2), "C008": (2, 3), "VDF003": (5, 8), "C006": (13, 1)}
+DESIRED = {"V0001": "uf", "C008": "idade", "VDF003": "renda_percapita", "C006": "sexo"}
+NUMERIC = ["idade", "renda_percapita"]
+
+
+def _block(values, width):
+    return np.frombuffer("".join(v.ljust(width)[:width] for v in values).encode("latin-1"),
+                         dtype=np.uint8).reshape(len(values), width)
+
+
+def _reference(values):
+    return pd.to_numeric(pd.Series([v.strip() for v in values]), errors="coerce").to_numpy(dtype=np.float64)
+
+
+@pytest.mark.parametrize("values", [
+    ["12", " 7", "-3", "+4", " -05", "0"],              # sinais e espaços nas bordas
+    ["1.5", "-0.25", ".5", "5.", "+.75", "10.125"],     # ponto decimal
+    ["", "   ", "12", "  ", "9", ""],                   # campos vazios
+    ["1E3", "12a", "1 2", "--1", "1.2.3", "- 1"],       # fora do formato: mesma regra do pd.to_numeric
+])
+def test_decode_numeric_matches_to_numeric(values):
+    np.testing.assert_array_equal(decode_numeric(_block(values, 6)), _reference(values))
+
+
+def test_decode_text_strips_and_shares_labels():
+    labels = decode_text(_block(["35", " 35", "1 ", "  "], 3))
+    assert labels.tolist() == ["35", "35", "1", ""]
+
+
+def _records(n, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n):
+        renda = "" if i % 11 == 0 else f"{rng.uniform(0, 5000):.2f}"
+        rows.append(f"{rng.choice(['11', '35', '53'])}{rng.integers(0, 110):3d}{renda:>8}{rng.integers(1, 3)}")
+    return [row.ljust(RECORD_LENGTH) for row in rows]
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_open_records_line_endings(tmp_path, newline):
+    rows = _records(5)
+    raw_file = tmp_path / "PNS_2019.txt"
+    raw_file.write_bytes(newline.join(rows).encode("latin-1") + newline.encode())
+
+    records = open_records(raw_file)
+    assert records.shape == (5, RECORD_LENGTH)
+    assert decode_text(records[:, 0:2]).tolist() == [row[:2] for row in rows]
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_iter_chunks_matches_full_extraction(tmp_path, newline):
+    raw_file = tmp_path / "PNS_2019.txt"
+    raw_file.write_bytes(newline.join(_records(503)).encode("latin-1") + newline.encode())
+
+    # Mesmo caminho de load_and_extract (pns_2019_pandas): matriz inteira + extract_columns
+    full = pd.DataFrame(extract_columns(open_records(raw_file), POSITIONS, DESIRED, NUMERIC))
+    chunks = pd.concat(iter_chunks(raw_file, POSITIONS, DESIRED, NUMERIC, chunk_records=64), ignore_index=True)
+    pd.testing.assert_frame_equal(chunks, full)
+
+    elderly = pd.concat(iter_chunks(raw_file, POSITIONS, DESIRED, NUMERIC, predicate=min_age_predicate(60),
+                                    chunk_records=64, n_workers=2), ignore_index=True)
+    pd.testing.assert_frame_equal(elderly, full[full["idade"] >= 60].reset_index(drop=True))
@@ -0,0 +1,77 @@
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from pns_fwf import RECORD_LENGTH, extract_columns, iter_chunks, open_records
+from pns_index import RecordIndex, build_index, load_index
+
+POSITIONS = {"V0001": (0, 2), "UPA_PNS": (2, 9), "C008": (11, 3)}
+DESIRED = {"V0001": "uf", "UPA_PNS": "upa", "C008": "idade"}
+
+
+def _write(path, n=400, seed=0):
+    """Registros agrupados por UPA (como no arquivo do IBGE), com UFs que reaparecem"""
+    rng = np.random.default_rng(seed)
+    rows, i = [], 0
+    while i < n:
+        uf = rng.choice(["11", "35", "53"])
+        upa = f"{uf}{rng.integers(0, 40):07d}"
+        for _ in range(min(rng.integers(1, 12), n - i)):
+            rows.append(f"{uf}{upa}{rng.integers(0, 100):3d}".ljust(RECORD_LENGTH))
+            i += 1
+    path.write_bytes("\n".join(rows).encode("latin-1") + b"\n")
+    return pd.DataFrame(extract_columns(open_records(path), POSITIONS, DESIRED, ["idade"]))
+
+
+def _rows(ranges):
+    return np.concatenate([np.arange(a, b) for a, b in ranges]) if len(ranges) else np.zeros(0, dtype=int)
+
+
+def test_ranges_select_records(tmp_path):
+    raw_file = tmp_path / "PNS_2019.txt"
+    full = _write(raw_file)
+    index = build_index(raw_file, POSITIONS, chunk_records=50)
+
+    assert index.n_records == len(full)
+    assert sorted(index.values("uf")) == sorted(full["uf"].unique())
+    np.testing.assert_array_equal(index.ranges(), [[0, len(full)]])
+
+    by_uf = index.ranges(ufs=[35, "53"])
+    np.testing.assert_array_equal(_rows(by_uf), np.flatnonzero(full["uf"].isin(["35", "53"])))
+    assert RecordIndex.count(by_uf) == full["uf"].isin(["35", "53"]).sum()
+
+    upas = list(full["upa"].drop_duplicates().iloc[:6])
+    both = index.ranges(ufs=["35"], upas=upas)
+    np.testing.assert_array_equal(_rows(both), np.flatnonzero((full["uf"] == "35") & full["upa"].isin(upas)))
+    assert len(index.ranges(ufs=["99"])) == 0
+
+
+def test_iter_chunks_with_ranges(tmp_path):
+    raw_file = tmp_path / "PNS_2019.txt"
+    full = _write(raw_file)
+    ranges = build_index(raw_file, POSITIONS).ranges(ufs=["11"])
+
+    selected = pd.concat(iter_chunks(raw_file, POSITIONS, DESIRED, ["idade"], chunk_records=32, ranges=ranges),
+                         ignore_index=True)
+    pd.testing.assert_frame_equal(selected, full[full["uf"] == "11"].reset_index(drop=True))
+
+
+def test_load_index_cache(tmp_path):
+    raw_file = tmp_path / "PNS_2019.txt"
+    _write(raw_file)
+    first = load_index(raw_file, POSITIONS, cache_dir=tmp_path / "cache")
+    index_file = tmp_path / "cache" / "pns_index_PNS_2019.npz"
+    assert index_file.exists()
+
+    cached = load_index(raw_file, POSITIONS, cache_dir=tmp_path / "cache")
+    np.testing.assert_array_equal(cached.ranges(ufs=["35"]), first.ranges(ufs=["35"]))
+
+    # Arquivo raw trocado: o índice é refeito
+    full = _write(raw_file, n=120, seed=1)
+    os.utime(raw_file, ns=(0, os.stat(raw_file).st_mtime_ns + 10**9))
+    rebuilt = load_index(raw_file, POSITIONS, cache_dir=tmp_path / "cache")
+    assert rebuilt.n_records == len(full) == 120